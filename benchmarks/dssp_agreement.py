@@ -0,0 +1,257 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Agreement of the built-in DSSP engine with reference assignments, without mkdssp.
+
+The reference structures and their expected per-residue codes are kept in benchmarks/dssp_reference, listed in its
+references.json. The check assigns every reference structure with the built-in engine, records the fraction of
+residues with the expected code (overall, per reference and per code) as JSON, and exits with status 1 if the
+overall agreement is below --min-agreement. With --record, structure files are assigned with mkdssp instead and
+added to the references, which is the only step that needs mkdssp installed; --import-dssp adds a structure file
+with an existing DSSP output file of it instead.
+
+DSSP before version 4 has no polyproline II code, so against references it produced, the built-in engine's P
+residues are compared as coil.
+
+Run from the repository root:
+    python -m benchmarks.dssp_agreement -o dssp_agreement.json
+    python -m benchmarks.dssp_agreement --record pdb_folder/1fat.pdb pdb_folder/4hhb.cif
+    python -m benchmarks.dssp_agreement --import-dssp pdb_folder/2beg.pdb pdb_folder/2beg.dssp
+"""
+
+import argparse
+import datetime
+import json
+import os
+import re
+import shutil
+import sys
+from typing import Any, Dict, List, Tuple
+
+from src.chains import ChainData
+from src.dssp import assign, compare_assignments, engine_version, mkdssp_path
+
+# The reference structures and references.json
+REFERENCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dssp_reference')
+
+# Overall agreement below which the check fails
+DEFAULT_MIN_AGREEMENT = 0.95
+
+# The version in the first line of DSSP output or in "mkdssp --version", e.g. "version 4.4.0"
+DSSP_VERSION_PATTERN = re.compile(r'version (\d+)\.', re.IGNORECASE)
+
+# First DSSP major version to assign polyproline II helices (P)
+PPII_DSSP_VERSION = 4
+
+
+def load_references(folder: str = REFERENCE_DIR) -> List[Dict[str, Any]]:
+    '''
+    Returns the references listed in references.json: the structure file (relative to folder), the model, where the
+    expected codes come from, whether their source assigns P ("ppii", true if missing), and the expected assignment
+    of every chain as {"res_nums": [...], "ss": "..."}.
+
+    '''
+    path = os.path.join(folder, 'references.json')
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return json.load(f)['references']
+
+
+def _expected(reference: Dict[str, Any]) -> Dict[str, ChainData]:
+    return {chain_id: ChainData(chain_id, chain['res_nums'], 'X' * len(chain['ss']), chain['ss'])
+            for chain_id, chain in reference['chains'].items()}
+
+
+def _assigns_ppii(version: str) -> bool:
+    '''Returns whether the DSSP of a version line assigns polyproline II helices; unversioned ones are older.'''
+    match = DSSP_VERSION_PATTERN.search(version)
+    return match is not None and int(match.group(1)) >= PPII_DSSP_VERSION
+
+
+def check(folder: str = REFERENCE_DIR) -> Dict[str, Any]:
+    '''
+    Assigns every reference structure with the built-in engine and compares it with the expected codes.
+
+    Returns:
+        The overall agreement and confusion over all residues, and one entry per reference with its file, source
+        and the result of src.dssp.compare_assignments.
+    '''
+    from src.structure_io import parse_structure
+
+    rows = []
+    for reference in load_references(folder):
+        structure = parse_structure(None, os.path.join(folder, reference['file']))
+        builtin = assign(structure[reference.get('model', 0)])
+        if not reference.get('ppii', True):
+            builtin = {chain_id: ChainData(chain_id, chain.res_nums, chain.sequence, chain.ss.replace('P', '-'))
+                       for chain_id, chain in builtin.items()}
+        rows.append({'file': reference['file'], 'source': reference['source'],
+                     **compare_assignments(_expected(reference), builtin)})
+
+    residues = sum(row['residues'] for row in rows)
+    matches = sum(row['matches'] for row in rows)
+    confusion = {}
+    for row in rows:
+        for pair, count in row['confusion'].items():
+            confusion[pair] = confusion.get(pair, 0) + count
+    return {
+        'meta': {'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                 'engine': engine_version('builtin')},
+        'residues': residues,
+        'agreement': matches / residues if residues else None,
+        'confusion': dict(sorted(confusion.items(), key=lambda item: item[1], reverse=True)),
+        'references': rows,
+    }
+
+
+def _add_references(added: List[Dict[str, Any]], file_paths: List[str], folder: str) -> None:
+    '''
+    Copies the files a reference is made from into folder and writes the added references to references.json,
+    replacing earlier references of the same file name.
+
+    '''
+    references = {reference['file']: reference for reference in load_references(folder)}
+    references.update((reference['file'], reference) for reference in added)
+    os.makedirs(folder, exist_ok=True)
+    for file_path in file_paths:
+        if os.path.abspath(file_path) != os.path.abspath(os.path.join(folder, os.path.basename(file_path))):
+            shutil.copyfile(file_path, os.path.join(folder, os.path.basename(file_path)))
+    with open(os.path.join(folder, 'references.json'), 'w') as f:
+        json.dump({'references': list(references.values())}, f, indent=1)
+        f.write('\n')
+
+
+def record(file_paths: List[str], folder: str = REFERENCE_DIR, model_index: int = 0) -> List[Dict[str, Any]]:
+    '''
+    Assigns structure files with mkdssp, copies them into folder and adds their assignments to references.json,
+    replacing earlier references of the same file name.
+
+    Returns:
+        The added references.
+
+    Raises:
+        RuntimeError: If mkdssp is not installed
+    '''
+    from src.structure_io import parse_structure
+    from src.visual import assign_model
+
+    if mkdssp_path() is None:
+        raise RuntimeError('Recording DSSP references requires mkdssp to be installed')
+    added = []
+    for file_path in file_paths:
+        structure = parse_structure(None, file_path)
+        assignment = assign_model(structure, file_path, model_index, engine='mkdssp')
+        added.append({
+            'file': os.path.basename(file_path),
+            'model': model_index,
+            'source': engine_version('mkdssp'),
+            'ppii': _assigns_ppii(engine_version('mkdssp')),
+            'chains': {chain_id: {'res_nums': chain.res_nums.tolist(), 'ss': chain.ss}
+                       for chain_id, chain in assignment.items()},
+        })
+    _add_references(added, file_paths, folder)
+    return added
+
+
+def read_dssp_output(dssp_path: str) -> Tuple[str, Dict[str, Dict[str, list]]]:
+    '''
+    Reads the classic DSSP output format: the program line of its header, and the residue numbers and codes of every
+    chain. Blank codes become "-"; chain break lines ("!") are skipped.
+
+    Raises:
+        ValueError: If the file has no residue table
+    '''
+    with open(dssp_path) as f:
+        lines = f.read().splitlines()
+    table = next((i for i, line in enumerate(lines) if line.startswith('  #  RESIDUE')), None)
+    if table is None:
+        raise ValueError(f'Not a DSSP output file: {dssp_path}')
+    program = lines[0].strip(' .=').split(' ====')[0] if lines[0].startswith('====') else 'DSSP'
+    chains = {}
+    for line in lines[table + 1:]:
+        if len(line) < 17 or line[13] == '!':
+            continue
+        chain = chains.setdefault(line[11], {'res_nums': [], 'ss': ''})
+        chain['res_nums'].append(int(line[5:10]))
+        chain['ss'] += line[16] if line[16] != ' ' else '-'
+    return program, chains
+
+
+def import_dssp(pairs: List[Tuple[str, str]], folder: str = REFERENCE_DIR,
+                model_index: int = 0) -> List[Dict[str, Any]]:
+    '''
+    Adds structure files with the assignment of an existing DSSP output file of each, e.g. one published with the
+    structure, copying both into folder like record.
+
+    Args:
+        pairs (list): (structure file, DSSP output file) pairs.
+
+    Returns:
+        The added references.
+
+    Raises:
+        ValueError: If a DSSP output file has no residue table
+    '''
+    added = []
+    for file_path, dssp_path in pairs:
+        program, chains = read_dssp_output(dssp_path)
+        added.append({
+            'file': os.path.basename(file_path),
+            'model': model_index,
+            'source': f'{program} ({os.path.basename(dssp_path)})',
+            'ppii': _assigns_ppii(program),
+            'chains': chains,
+        })
+    _add_references(added, [path for pair in pairs for path in pair], folder)
+    return added
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Checks the built-in DSSP engine against reference assignments.')
+    parser.add_argument('--record', nargs='+', metavar='FILE', default=None, help='Adds structure files to the references, assigned with mkdssp, instead of checking.')
+    parser.add_argument('--import-dssp', dest='import_dssp', nargs=2, action='append', metavar=('FILE', 'DSSP'), default=None, help='Adds a structure file to the references with the assignment of a DSSP output file of it, instead of checking. May be repeated.')
+    parser.add_argument('--references', default=REFERENCE_DIR, help='The folder of the references. Defaults to benchmarks/dssp_reference.')
+    parser.add_argument('-o', dest='output', default='dssp_agreement.json', help='The results file (JSON). Defaults to dssp_agreement.json.')
+    parser.add_argument('--min-agreement', dest='min_agreement', type=float, default=DEFAULT_MIN_AGREEMENT, help=f'Overall agreement below which the exit status is 1. Defaults to {DEFAULT_MIN_AGREEMENT}.')
+    args = parser.parse_args()
+    if args.record is not None and args.import_dssp is not None:
+        parser.error('--record and --import-dssp cannot be combined')
+
+    if args.record is not None or args.import_dssp is not None:
+        added = record(args.record, args.references) if args.record is not None else import_dssp(args.import_dssp, args.references)
+        for reference in added:
+            residues = sum(len(chain['ss']) for chain in reference['chains'].values())
+            print(f"Recorded {reference['file']}: {residues} residues ({reference['source']})")
+        return 0
+
+    results = check(args.references)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}')
+    for row in results['references']:
+        agreement = f"{row['agreement']:.1%}" if row['agreement'] is not None else 'n/a'
+        print(f"{row['file']:<30} {row['residues']:>6} residues  {agreement:>7}  ({row['source']})")
+    if results['agreement'] is None:
+        print('No reference residues to compare')
+        return 1
+    print(f"Overall agreement: {results['agreement']:.1%} of {results['residues']} residues")
+    if results['confusion']:
+        print('Disagreements (reference>built-in): ' +
+              ', '.join(f'{pair} {count}' for pair, count in results['confusion'].items()))
+    return 0 if results['agreement'] >= args.min_agreement else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,359 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Stage-level benchmarks of the visualization pipeline on synthetic structures.
+
+Every stage (parsing, DSSP, row preparation, SVG color injection, template rendering and the output paths) is
+timed separately, for a matrix of structure sizes and formats, and the results are written as JSON. A previous
+results file can be given as a baseline to report regressions. Metadata requests go to a local stub server.
+
+Run from the repository root:
+    python -m benchmarks.run_benchmarks --residues 100 1000 --chains 1 4 -o results.json
+    python -m benchmarks.run_benchmarks --baseline results.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import Bio
+import numpy as np
+
+from benchmarks.stub_server import StubServer
+from benchmarks.synthetic import generate
+from src.dssp import engine_version, resolve_engine
+from src.metadata import MetadataClient
+from src.structure_io import parse_structure
+from src.visual import VisualMap, assign_model, _check_poppler_available, _write_pages
+
+# Default size matrix; every combination of residues per chain, chain count and file format is one case
+DEFAULT_RESIDUES = (100, 1000, 5000)
+DEFAULT_CHAINS = (1, 4)
+DEFAULT_FORMATS = ('pdb', 'cif')
+
+# Stages up to the HTML, in pipeline order; rows are prepared while the template streams, so prepare_chain_data is
+# also counted in template_render, and inject_svg_color in prepare_chain_data
+PIPELINE_STAGES = ('parse', 'dssp', 'metadata', 'prepare_chain_data', 'inject_svg_color', 'template_render')
+
+# Stages writing the outputs from the HTML (wkhtml backend) or from the rows (native backend)
+OUTPUT_STAGES = ('imgkit_png', 'pdfkit_pdf', 'pdf2image_raster', 'native_png', 'native_svg')
+
+STAGES = PIPELINE_STAGES + OUTPUT_STAGES
+
+# Resolution of the pdf2image stage, the path taken by high-DPI images
+RASTER_DPI = 300
+
+# Relative slowdown, and absolute slowdown in seconds, both of which a stage must exceed to count as a regression
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_MIN_DELTA = 0.005
+
+# PDB code of the synthetic entries, answered by the stub server
+SYNTHETIC_PDB_NAME = '0XXX'
+
+
+class StageTimer:
+    '''Accumulates wall-clock seconds per stage name.'''
+
+    def __init__(self) -> None:
+        self.seconds: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+
+# Marks the end of an iteration in _timed_iteration
+_EXHAUSTED = object()
+
+
+def _timed_iteration(items: Iterable[Any], timer: StageTimer, name: str) -> Iterator[Any]:
+    '''Yields the items of a lazy iterable, timing the production of each one as the stage name.'''
+    iterator = iter(items)
+    while True:
+        with timer.stage(name):
+            item = next(iterator, _EXHAUSTED)
+        if item is _EXHAUSTED:
+            return
+        yield item
+
+
+class _TimedTemplate:
+    '''Wraps a Jinja template so that render() and generate() are timed as the template_render stage.'''
+
+    def __init__(self, template, timer: StageTimer) -> None:
+        self._template = template
+        self._timer = timer
+
+    def render(self, *args: Any, **kwargs: Any) -> str:
+        with self._timer.stage('template_render'):
+            return self._template.render(*args, **kwargs)
+
+    def generate(self, *args: Any, **kwargs: Any) -> Iterator[str]:
+        return _timed_iteration(self._template.generate(*args, **kwargs), self._timer, 'template_render')
+
+
+class _TimedEnvironment:
+    '''Hands out timed templates of the shared Jinja environment.'''
+
+    def __init__(self, env, timer: StageTimer) -> None:
+        self._env = env
+        self._timer = timer
+
+    def get_template(self, *args: Any, **kwargs: Any) -> _TimedTemplate:
+        return _TimedTemplate(self._env.get_template(*args, **kwargs), self._timer)
+
+
+class StagedVisualMap(VisualMap):
+    '''
+    A VisualMap that records the time of its pipeline stages in the class-level timer, through the same code paths
+    as VisualMap itself.
+
+    '''
+    timer = StageTimer()
+
+    @classmethod
+    def _get_jinja_env(cls):
+        return _TimedEnvironment(super()._get_jinja_env(), cls.timer)
+
+    def _get_dssp_output(self, pdb_name, file_path, model_index: int = 0):
+        with self.timer.stage('parse'):
+            structure = parse_structure(pdb_name, file_path)
+        with self.timer.stage('dssp'):
+            return assign_model(structure, file_path, model_index, engine=self.dssp_engine)
+
+    def _prepare_chain_data(self, *args: Any, **kwargs: Any):
+        with self.timer.stage('prepare_chain_data'):
+            chains = super()._prepare_chain_data(*args, **kwargs)
+        return ({**chain, 'rows': _timed_iteration(chain['rows'], self.timer, 'prepare_chain_data')}
+                for chain in _timed_iteration(chains, self.timer, 'prepare_chain_data'))
+
+    @staticmethod
+    def _inject_svg_color(svg_string, color):
+        with StagedVisualMap.timer.stage('inject_svg_color'):
+            return VisualMap._inject_svg_color(svg_string, color)
+
+
+def _available_stages(skip: List[str]) -> Dict[str, Optional[str]]:
+    '''Returns every stage mapped to the reason it is skipped, or None if it runs.'''
+    reasons = {stage: None for stage in OUTPUT_STAGES}
+    if not shutil.which('wkhtmltoimage'):
+        reasons['imgkit_png'] = 'wkhtmltoimage not found'
+    if not shutil.which('wkhtmltopdf'):
+        reasons['pdfkit_pdf'] = reasons['pdf2image_raster'] = 'wkhtmltopdf not found'
+    elif not _check_poppler_available():
+        reasons['pdf2image_raster'] = 'poppler not found'
+    for stage in skip:
+        reasons[stage] = 'skipped by request'
+    return reasons
+
+
+def run_case(file_path: str, residues_per_line: int, metadata: MetadataClient, dssp_engine: str,
+             skipped: Dict[str, Optional[str]], work_dir: str, trace_memory: bool = False) -> Dict[str, Any]:
+    '''
+    Runs the pipeline once on one structure file.
+
+    Returns:
+        The seconds of every stage that ran and the output HTML size. With trace_memory, the peak of memory
+        allocated by Python from parsing to template rendering instead, without running the output stages.
+    '''
+    import imgkit
+    import pdfkit
+
+    timer = StagedVisualMap.timer = StageTimer()
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        visual_map = StagedVisualMap(file_path, pdb_name=SYNTHETIC_PDB_NAME, use_cache=False, metadata=metadata,
+                                     dssp_engine=dssp_engine)
+        with timer.stage('metadata'):
+            visual_map._get_uniprot_mapping()
+            visual_map._resolve_metadata()
+        html_path = os.path.join(work_dir, 'output.html')
+        visual_map._write_template(html_path, residues_per_line=residues_per_line)
+    finally:
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+
+    result = {'html_bytes': os.path.getsize(html_path), 'stages': timer.seconds}
+    if trace_memory:
+        result['peak_memory_bytes'] = peak
+        return result
+
+    if not skipped['imgkit_png']:
+        with timer.stage('imgkit_png'):
+            imgkit.from_file(html_path, os.path.join(work_dir, 'output.png'), options={'quality': 100, 'quiet': ''})
+    if not skipped['pdfkit_pdf']:
+        with timer.stage('pdfkit_pdf'):
+            options = {**visual_map._pdf_options(residues_per_line), 'quiet': ''}
+            pdf_bytes = pdfkit.from_file(html_path, options=options)
+        if not skipped['pdf2image_raster']:
+            with timer.stage('pdf2image_raster'):
+                _write_pages(pdf_bytes, os.path.join(work_dir, 'output_raster.png'), RASTER_DPI, 'stitch')
+
+    # The native backend prepares its own rows, which are not added to prepare_chain_data again
+    StagedVisualMap.timer = StageTimer()
+    for fmt in ('png', 'svg'):
+        if not skipped[f'native_{fmt}']:
+            with timer.stage(f'native_{fmt}'):
+                renderer = visual_map._native_renderer(residues_per_line)
+                renderer.save(os.path.join(work_dir, f'output.{fmt}'), dpi=100)
+    return result
+
+
+def run_benchmarks(residues: List[int], chains: List[int], formats: List[str], residues_per_line: int = 50,
+                   repeat: int = 3, dssp_engine: Optional[str] = None, skip: Optional[List[str]] = None,
+                   data_dir: Optional[str] = None) -> Dict[str, Any]:
+    '''
+    Runs every case of the size matrix and returns the results document.
+
+    Stage times are the median and minimum of `repeat` runs. Peak memory is measured in one extra run, since
+    tracing allocations slows every stage down.
+
+    '''
+    dssp_engine = resolve_engine(dssp_engine)
+    skipped = _available_stages(skip or [])
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), 'pros2vi-benchmarks')
+    cases = []
+    with StubServer() as server, tempfile.TemporaryDirectory(prefix='pros2vi-benchmark-') as work_dir:
+        metadata = MetadataClient(cache_dir=None, pdbe_url=server.pdbe_url, rcsb_url=server.rcsb_url)
+        for fmt, residue_count, chain_count in itertools.product(formats, residues, chains):
+            name = f'{fmt}_{residue_count}r_{chain_count}c'
+            file_path = generate(data_dir, residue_count, chain_count, fmt)
+            runs = [run_case(file_path, residues_per_line, metadata, dssp_engine, skipped, work_dir)
+                    for _ in range(repeat)]
+            traced = run_case(file_path, residues_per_line, metadata, dssp_engine, skipped, work_dir,
+                              trace_memory=True)
+            stages = {}
+            for stage in STAGES:
+                seconds = [run['stages'][stage] for run in runs if stage in run['stages']]
+                if seconds:
+                    stages[stage] = {'median': statistics.median(seconds), 'min': min(seconds)}
+            case = {'name': name, 'format': fmt, 'residues_per_chain': residue_count, 'chains': chain_count,
+                    'file_bytes': os.path.getsize(file_path), 'html_bytes': runs[0]['html_bytes'],
+                    'peak_memory_bytes': traced['peak_memory_bytes'], 'stages': stages}
+            cases.append(case)
+            print(_format_case(case), flush=True)
+
+    return {
+        'meta': {
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'numpy': np.__version__,
+            'biopython': Bio.__version__,
+            'dssp_engine': engine_version(dssp_engine),
+            'residues_per_line': residues_per_line,
+            'repeat': repeat,
+            'skipped': {stage: reason for stage, reason in skipped.items() if reason},
+        },
+        'cases': cases,
+    }
+
+
+def _format_case(case: Dict[str, Any]) -> str:
+    stages = '  '.join(f"{stage}={timing['median'] * 1000:.1f}ms" for stage, timing in case['stages'].items())
+    return (f"{case['name']:<20} html={case['html_bytes'] / 1e6:.1f}MB "
+            f"peak={case['peak_memory_bytes'] / 1e6:.1f}MB  {stages}")
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE,
+            min_delta: float = DEFAULT_MIN_DELTA) -> List[Dict[str, Any]]:
+    '''
+    Compares the median stage times and peak memory of every case present in both documents.
+
+    A stage regresses if it is more than `tolerance` (relative) and `min_delta` seconds (absolute) slower than in
+    the baseline; peak memory regresses if it grew by more than `tolerance`.
+
+    Returns:
+        One row per compared value, with its baseline, current value, ratio and whether it regressed.
+    '''
+    previous = {case['name']: case for case in baseline.get('cases', [])}
+    rows = []
+    for case in results['cases']:
+        old = previous.get(case['name'])
+        if old is None:
+            continue
+        for stage, timing in case['stages'].items():
+            if stage not in old['stages']:
+                continue
+            before, after = old['stages'][stage]['median'], timing['median']
+            rows.append({'case': case['name'], 'metric': stage, 'baseline': before, 'current': after,
+                         'ratio': after / before if before else None,
+                         'regression': after > before * (1 + tolerance) and after - before > min_delta})
+        before, after = old.get('peak_memory_bytes'), case.get('peak_memory_bytes')
+        if before and after:
+            rows.append({'case': case['name'], 'metric': 'peak_memory_bytes', 'baseline': before, 'current': after,
+                         'ratio': after / before, 'regression': after > before * (1 + tolerance)})
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Times each stage of the visualization pipeline on synthetic structures of increasing size.')
+    parser.add_argument('--residues', type=int, nargs='+', default=list(DEFAULT_RESIDUES), help=f'Residues per chain of the synthetic structures. Defaults to {" ".join(map(str, DEFAULT_RESIDUES))}.')
+    parser.add_argument('--chains', type=int, nargs='+', default=list(DEFAULT_CHAINS), help=f'Chain counts of the synthetic structures. Defaults to {" ".join(map(str, DEFAULT_CHAINS))}.')
+    parser.add_argument('--formats', nargs='+', choices=DEFAULT_FORMATS, default=list(DEFAULT_FORMATS), help='Input file formats. Defaults to both.')
+    parser.add_argument('-r', dest='residues_per_line', type=int, default=50, help='The number of residues per each line. Defaults to 50.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case; stage times are their median. Defaults to 3.')
+    parser.add_argument('--dssp-engine', dest='dssp_engine', default=None, help='The DSSP engine (mkdssp, builtin or auto). Defaults to PROS2VI_DSSP_ENGINE, else auto.')
+    parser.add_argument('--skip', nargs='+', choices=OUTPUT_STAGES, default=[], help='Output stages not to run.')
+    parser.add_argument('--data-dir', dest='data_dir', default=None, help='Where the synthetic structures are generated and reused. Defaults to a folder in the temporary directory.')
+    parser.add_argument('-o', dest='output', default='benchmark_results.json', help='The results file (JSON). Defaults to benchmark_results.json.')
+    parser.add_argument('--baseline', default=None, help='A previous results file to compare against; the exit status is 1 if any stage regressed.')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help=f'Relative slowdown counted as a regression. Defaults to {DEFAULT_TOLERANCE}.')
+    parser.add_argument('--min-delta', dest='min_delta', type=float, default=DEFAULT_MIN_DELTA, help=f'Smallest slowdown in seconds counted as a regression. Defaults to {DEFAULT_MIN_DELTA}.')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.residues, args.chains, args.formats, residues_per_line=args.residues_per_line,
+                             repeat=args.repeat, dssp_engine=args.dssp_engine, skip=args.skip, data_dir=args.data_dir)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}')
+    for stage, reason in results['meta']['skipped'].items():
+        print(f'Skipped {stage}: {reason}')
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as f:
+        rows = compare(results, json.load(f), args.tolerance, args.min_delta)
+    for row in rows:
+        ratio = f"{row['ratio']:.2f}x" if row['ratio'] is not None else 'n/a'
+        flag = '  REGRESSION' if row['regression'] else ''
+        print(f"{row['case']:<20} {row['metric']:<20} {row['baseline']:.4g} -> {row['current']:.4g} ({ratio}){flag}")
+    regressions = sum(row['regression'] for row in rows)
+    print(f'{regressions} regression(s) in {len(rows)} comparisons against {args.baseline}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
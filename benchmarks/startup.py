@@ -0,0 +1,187 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Import and startup times of the library and the command line tools.
+
+Every command runs in a fresh interpreter, so the times include the imports a user pays for on each invocation.
+The command also checks that the heavy dependencies (Biopython, requests, Jinja2, Pillow, pdf2image, imgkit,
+pdfkit) are not imported until a stage needs them, and that the command line tools parse their arguments without
+importing NumPy or the pipeline, and exits with status 1 if one is.
+
+Run from the repository root:
+    python -m benchmarks.startup -o startup.json
+    python -m benchmarks.startup --baseline startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+# Repository root, the working directory of every command
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Timed commands, each run in a fresh interpreter
+COMMANDS = {
+    'import_library': [sys.executable, '-c', 'import src.visual'],
+    'cli_help': [sys.executable, 'pros2vi_cli.py', '--help'],
+    'cli_argument_error': [sys.executable, 'pros2vi_cli.py', '-f', 'gif', 'input.pdb'],
+    'batch_help': [sys.executable, 'pros2vi_batch.py', '--help'],
+    'batch_argument_error': [sys.executable, 'pros2vi_batch.py', '-f', 'gif', 'input.pdb'],
+}
+
+# Modules that must not be imported with the library, only by the stages that use them
+LAZY_MODULES = ('Bio', 'requests', 'jinja2', 'PIL', 'pdf2image', 'imgkit', 'pdfkit')
+
+# Command line tools, and the modules they must not import before their arguments are parsed
+ENTRY_POINTS = ('pros2vi_cli.py', 'pros2vi_batch.py')
+ENTRY_POINT_LAZY_MODULES = ('numpy', 'src.visual') + LAZY_MODULES
+
+# Relative slowdown counted as a regression, and the smallest counted slowdown in seconds
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_MIN_DELTA = 0.02
+
+# Line of `python -X importtime`: self and cumulative microseconds, then the module indented by its depth
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def time_command(command: List[str], repeat: int) -> Dict[str, float]:
+    '''Runs a command `repeat` times and returns the median and minimum wall time in seconds.'''
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - start)
+    return {'median': statistics.median(seconds), 'min': min(seconds)}
+
+
+def import_times(module: str = 'src.visual', top: int = 15) -> List[Dict[str, Any]]:
+    '''
+    Returns the top-level imports of a module (those made by the module and its own package) with the most
+    cumulative import time, from `python -X importtime`.
+
+    '''
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                             capture_output=True, text=True)
+    imports = []
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        imports.append({'module': name, 'depth': len(indent) // 2, 'self': int(self_us) / 1e6,
+                        'cumulative': int(cumulative_us) / 1e6})
+    imports = [entry for entry in imports if entry['depth'] <= 1 or entry['module'].startswith('src.')]
+    return sorted(imports, key=lambda entry: entry['cumulative'], reverse=True)[:top]
+
+
+def loaded_lazy_modules() -> List[str]:
+    '''Returns the LAZY_MODULES imported by importing the library and the modules of the command line tools.'''
+    code = ('import sys\n'
+            'import src.visual, src.batch, src.cache, src.dssp, src.metadata, src.metrics, src.jobs\n'
+            f'print("\\n".join(name for name in {LAZY_MODULES!r} if name in sys.modules))')
+    process = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return process.stdout.split()
+
+
+def entry_point_modules() -> List[str]:
+    '''Returns the ENTRY_POINT_LAZY_MODULES imported by running each of ENTRY_POINTS with --help, as "tool: module".'''
+    loaded = []
+    for script in ENTRY_POINTS:
+        code = ('import runpy, sys\n'
+                f'sys.argv = [{script!r}, "--help"]\n'
+                'try:\n'
+                f'    runpy.run_path({script!r}, run_name="__main__")\n'
+                'except SystemExit:\n'
+                '    pass\n'
+                f'print("\\n".join(name for name in {ENTRY_POINT_LAZY_MODULES!r} if name in sys.modules), file=sys.stderr)')
+        process = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+        loaded.extend(f'{script}: {name}' for name in process.stderr.split())
+    return loaded
+
+
+def run_startup(repeat: int = 10) -> Dict[str, Any]:
+    '''Times every command of COMMANDS and collects the import times and the eagerly imported heavy modules.'''
+    return {
+        'meta': {'python': sys.version.split()[0], 'repeat': repeat},
+        'commands': {name: time_command(command, repeat) for name, command in COMMANDS.items()},
+        'imports': import_times(),
+        'eager_modules': loaded_lazy_modules() + entry_point_modules(),
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE,
+            min_delta: float = DEFAULT_MIN_DELTA) -> List[Dict[str, Any]]:
+    '''
+    Compares the median time of every command present in both documents; a command regresses if it is more than
+    `tolerance` (relative) and `min_delta` seconds (absolute) slower than in the baseline.
+
+    '''
+    rows = []
+    for name, timing in results['commands'].items():
+        old = baseline.get('commands', {}).get(name)
+        if old is None:
+            continue
+        before, after = old['median'], timing['median']
+        rows.append({'command': name, 'baseline': before, 'current': after,
+                     'ratio': after / before if before else None,
+                     'regression': after > before * (1 + tolerance) and after - before > min_delta})
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Times the imports and startup of the library and the command line tools.')
+    parser.add_argument('--repeat', type=int, default=10, help='Runs per command; times are their median. Defaults to 10.')
+    parser.add_argument('-o', dest='output', default='startup_results.json', help='The results file (JSON). Defaults to startup_results.json.')
+    parser.add_argument('--baseline', default=None, help='A previous results file to compare against; the exit status is 1 if any command regressed.')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help=f'Relative slowdown counted as a regression. Defaults to {DEFAULT_TOLERANCE}.')
+    parser.add_argument('--min-delta', dest='min_delta', type=float, default=DEFAULT_MIN_DELTA, help=f'Smallest slowdown in seconds counted as a regression. Defaults to {DEFAULT_MIN_DELTA}.')
+    args = parser.parse_args()
+
+    results = run_startup(args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}')
+    for name, timing in results['commands'].items():
+        print(f"{name:<20} median={timing['median'] * 1000:.1f}ms min={timing['min'] * 1000:.1f}ms")
+    print('Slowest imports of src.visual:')
+    for entry in results['imports']:
+        print(f"  {entry['module']:<30} {entry['cumulative'] * 1000:>7.1f}ms")
+
+    status = 0
+    if results['eager_modules']:
+        print(f"Imported eagerly: {', '.join(results['eager_modules'])}")
+        status = 1
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            rows = compare(results, json.load(f), args.tolerance, args.min_delta)
+        for row in rows:
+            ratio = f"{row['ratio']:.2f}x" if row['ratio'] is not None else 'n/a'
+            flag = '  REGRESSION' if row['regression'] else ''
+            print(f"{row['command']:<20} {row['baseline']:.4g} -> {row['current']:.4g} ({ratio}){flag}")
+        regressions = sum(row['regression'] for row in rows)
+        print(f'{regressions} regression(s) in {len(rows)} comparisons against {args.baseline}')
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
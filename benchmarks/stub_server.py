@@ -0,0 +1,122 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""A local stand-in for the PDBe and RCSB APIs, so that benchmarks never depend on the network."""
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from benchmarks.synthetic import CHAIN_IDS
+
+# Chains mapped to a UniProt accession in the stub responses
+STUB_CHAINS = 8
+
+STUB_TITLE = 'SYNTHETIC PROTEIN FOR BENCHMARKING'
+STUB_ORGANISM = 'Homo sapiens'
+
+
+def _uniprot_mapping(identifier: str) -> Dict[str, Any]:
+    mappings = [{'chain_id': chain_id, 'start': {'residue_number': 1}} for chain_id in CHAIN_IDS[:STUB_CHAINS]]
+    return {identifier.lower(): {'UniProt': {'P00000': {'identifier': 'SYNTH_HUMAN', 'mappings': mappings}}}}
+
+
+def _rcsb_entry(identifier: str) -> Dict[str, Any]:
+    return {'struct': {'title': STUB_TITLE}, 'rcsb_entry_container_identifiers': {'entry_id': identifier.upper(),
+                                                                                   'polymer_entity_ids': ['1']}}
+
+
+def _organisms() -> Dict[str, Any]:
+    return {'data': {'entry': {'polymer_entities': [{
+        'rcsb_polymer_entity_container_identifiers': {'entity_id': '1'},
+        'rcsb_entity_source_organism': [{'scientific_name': STUB_ORGANISM}],
+    }]}}}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    '''Answers the requests of src/metadata.py with fixed documents, whatever the PDB code.'''
+
+    def _respond(self, document: Optional[Dict[str, Any]]) -> None:
+        body = json.dumps(document).encode() if document is not None else b'{}'
+        self.send_response(200 if document is not None else 404)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        self.server.requests += 1
+        match = re.fullmatch(r'/pdbe/api/mappings/uniprot/(\w+)', self.path)
+        if match:
+            return self._respond(_uniprot_mapping(match.group(1)))
+        match = re.fullmatch(r'/rcsb/rest/v1/core/entry/(\w+)', self.path)
+        if match:
+            return self._respond(_rcsb_entry(match.group(1)))
+        self._respond(None)
+
+    def do_POST(self) -> None:
+        self.server.requests += 1
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._respond(_organisms() if self.path == '/rcsb/graphql' else None)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class StubServer:
+    '''
+    Serves the stub APIs from a background thread on a free local port, e.g.
+    MetadataClient(cache_dir=None, pdbe_url=server.pdbe_url, rcsb_url=server.rcsb_url).
+
+    '''
+    def __init__(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        self._server = ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.requests = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def pdbe_url(self) -> str:
+        return f'{self.url}/pdbe/api'
+
+    @property
+    def rcsb_url(self) -> str:
+        return f'{self.url}/rcsb'
+
+    @property
+    def requests(self) -> int:
+        '''The number of requests answered so far.'''
+        return self._server.requests
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='pros2vi-stub-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
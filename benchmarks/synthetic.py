@@ -0,0 +1,195 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Synthetic protein structures of any size, with a realistic mix of helices, strands and loops, written as PDB or
+mmCIF files for benchmarking."""
+
+import os
+import string
+from typing import List, Tuple
+
+import numpy as np
+
+# Backbone bond lengths (Angstrom) and angles (degrees) of an ideal peptide
+BOND_N_CA = 1.458
+BOND_CA_C = 1.525
+BOND_C_N = 1.329
+BOND_C_O = 1.231
+ANGLE_N_CA_C = 111.2
+ANGLE_CA_C_N = 116.2
+ANGLE_C_N_CA = 121.7
+ANGLE_CA_C_O = 120.5
+
+# (phi, psi, shortest, longest) of the segment types a chain is built from
+SEGMENT_TYPES = {
+    'helix': (-57.0, -47.0, 8, 24),
+    'strand': (-120.0, 130.0, 4, 10),
+    'polyproline': (-75.0, 145.0, 3, 6),
+    'loop': (None, None, 2, 8),
+}
+
+# How often each segment type is picked
+SEGMENT_WEIGHTS = {'helix': 0.4, 'strand': 0.2, 'polyproline': 0.05, 'loop': 0.35}
+
+# Residue names drawn for the sequence
+RESIDUE_NAMES = ('ALA', 'ARG', 'ASN', 'ASP', 'CYS', 'GLN', 'GLU', 'GLY', 'HIS', 'ILE',
+                 'LEU', 'LYS', 'MET', 'PHE', 'PRO', 'SER', 'THR', 'TRP', 'TYR', 'VAL')
+
+# Chain IDs in the order they are used
+CHAIN_IDS = string.ascii_uppercase + string.ascii_lowercase + string.digits
+
+# Distance between the starting points of neighbouring chains (Angstrom)
+CHAIN_SPACING = 40.0
+
+BACKBONE = ('N', 'CA', 'C', 'O')
+
+
+def _place(a: np.ndarray, b: np.ndarray, c: np.ndarray, bond: float, angle: float, torsion: float) -> np.ndarray:
+    '''Returns the position of the atom bonded to c, from the bond length, the b-c-d angle and the a-b-c-d torsion.'''
+    angle, torsion = np.radians(angle), np.radians(torsion)
+    bc = (c - b) / np.linalg.norm(c - b)
+    normal = np.cross(b - a, bc)
+    normal /= np.linalg.norm(normal)
+    frame = np.stack([bc, np.cross(normal, bc), normal], axis=1)
+    offset = np.array([-bond * np.cos(angle), bond * np.sin(angle) * np.cos(torsion), bond * np.sin(angle) * np.sin(torsion)])
+    return c + frame @ offset
+
+
+def _torsions(residues: int, rng: np.random.Generator) -> np.ndarray:
+    '''Returns (phi, psi) of every residue, drawn segment by segment.'''
+    names = list(SEGMENT_WEIGHTS)
+    weights = np.array([SEGMENT_WEIGHTS[name] for name in names])
+    torsions = []
+    while len(torsions) < residues:
+        phi, psi, shortest, longest = SEGMENT_TYPES[names[rng.choice(len(names), p=weights / weights.sum())]]
+        for _ in range(int(rng.integers(shortest, longest + 1))):
+            if phi is None:
+                torsions.append((rng.uniform(-160, -60), rng.uniform(-60, 160)))
+            else:
+                torsions.append((phi + rng.normal(0, 5), psi + rng.normal(0, 5)))
+    return np.array(torsions[:residues])
+
+
+def build_chain(residues: int, rng: np.random.Generator, origin: Tuple[float, float, float] = (0, 0, 0)) -> np.ndarray:
+    '''
+    Builds the backbone of one chain from ideal geometry.
+
+    Returns:
+        The N, CA, C and O coordinates of every residue, as an array of shape (residues, 4, 3).
+    '''
+    return build_backbone(_torsions(residues, rng), origin)
+
+
+def build_backbone(torsions: np.ndarray, origin: Tuple[float, float, float] = (0, 0, 0)) -> np.ndarray:
+    '''Builds the backbone of one chain from ideal geometry and the (phi, psi) of every residue, see build_chain.'''
+    residues = len(torsions)
+    coords = np.empty((residues, 4, 3))
+    n = np.array(origin, dtype=float)
+    ca = n + np.array([BOND_N_CA, 0.0, 0.0])
+    c = ca + BOND_CA_C * np.array([-np.cos(np.radians(ANGLE_N_CA_C)), np.sin(np.radians(ANGLE_N_CA_C)), 0.0])
+    previous_psi = None
+    for index, (phi, psi) in enumerate(torsions):
+        if index:
+            previous_n, previous_ca, previous_c = coords[index - 1, :3]
+            n = _place(previous_n, previous_ca, previous_c, BOND_C_N, ANGLE_CA_C_N, previous_psi)
+            ca = _place(previous_ca, previous_c, n, BOND_N_CA, ANGLE_C_N_CA, 180.0)
+            c = _place(previous_c, n, ca, BOND_CA_C, ANGLE_N_CA_C, phi)
+        # The carbonyl oxygen lies in the peptide plane, opposite the next residue's nitrogen
+        next_n = _place(n, ca, c, BOND_C_N, ANGLE_CA_C_N, psi)
+        coords[index] = (n, ca, c, _place(next_n, ca, c, BOND_C_O, ANGLE_CA_C_O, 180.0))
+        previous_psi = psi
+    return coords
+
+
+def build_structure(residues: int, chains: int = 1, seed: int = 0) -> List[Tuple[str, List[str], np.ndarray]]:
+    '''
+    Builds a structure of several chains of the same length, side by side.
+
+    Returns:
+        (chain ID, residue names, coordinates) of every chain, see build_chain.
+
+    Raises:
+        ValueError: If there are more chains than CHAIN_IDS
+    '''
+    if chains > len(CHAIN_IDS):
+        raise ValueError(f'At most {len(CHAIN_IDS)} chains are supported')
+    rng = np.random.default_rng(seed)
+    structure = []
+    for index in range(chains):
+        names = [RESIDUE_NAMES[i] for i in rng.integers(len(RESIDUE_NAMES), size=residues)]
+        structure.append((CHAIN_IDS[index], names, build_chain(residues, rng, origin=(0.0, 0.0, index * CHAIN_SPACING))))
+    return structure
+
+
+def write_pdb(structure: List[Tuple[str, List[str], np.ndarray]], path: str) -> None:
+    '''Writes a structure from build_structure as a PDB file. Atom serial numbers wrap after 99999.'''
+    serial = 0
+    with open(path, 'w') as f:
+        f.write('HEADER    SYNTHETIC PROTEIN                       01-JAN-24   0XXX              \n')
+        for chain_id, names, coords in structure:
+            for res_num, (res_name, atoms) in enumerate(zip(names, coords), 1):
+                for atom_name, (x, y, z) in zip(BACKBONE, atoms):
+                    serial += 1
+                    f.write(f'ATOM  {serial % 100000:5d}  {atom_name:<3s} {res_name} {chain_id}{res_num % 10000:4d}    '
+                            f'{x:8.3f}{y:8.3f}{z:8.3f}  1.00  0.00           {atom_name[0]}\n')
+            f.write('TER\n')
+        f.write('END\n')
+
+
+def write_mmcif(structure: List[Tuple[str, List[str], np.ndarray]], path: str, name: str = 'SYNTHETIC') -> None:
+    '''Writes a structure from build_structure as an mmCIF file.'''
+    serial = 0
+    with open(path, 'w') as f:
+        f.write(f'data_{name}\n#\nloop_\n')
+        for column in ('group_PDB', 'id', 'type_symbol', 'label_atom_id', 'label_alt_id', 'label_comp_id',
+                       'label_asym_id', 'label_entity_id', 'label_seq_id', 'pdbx_PDB_ins_code', 'Cartn_x', 'Cartn_y',
+                       'Cartn_z', 'occupancy', 'B_iso_or_equiv', 'auth_seq_id', 'auth_asym_id', 'pdbx_PDB_model_num'):
+            f.write(f'_atom_site.{column}\n')
+        for chain_id, names, coords in structure:
+            for res_num, (res_name, atoms) in enumerate(zip(names, coords), 1):
+                for atom_name, (x, y, z) in zip(BACKBONE, atoms):
+                    serial += 1
+                    f.write(f'ATOM {serial} {atom_name[0]} {atom_name} . {res_name} {chain_id} 1 {res_num} ? '
+                            f'{x:.3f} {y:.3f} {z:.3f} 1.00 0.00 {res_num} {chain_id} 1\n')
+        f.write('#\n')
+
+
+def generate(folder: str, residues: int, chains: int = 1, fmt: str = 'pdb', seed: int = 0) -> str:
+    '''
+    Writes a synthetic structure into folder, unless it already exists, and returns its path.
+
+    Args:
+        folder (str): The output folder, created if needed.
+        residues (int): Residues per chain.
+        chains (int): The number of chains.
+        fmt (str): "pdb" or "cif".
+        seed (int): The random seed; the same arguments always give the same file.
+
+    Raises:
+        ValueError: If fmt is not supported
+    '''
+    if fmt not in ('pdb', 'cif'):
+        raise ValueError('The synthetic structure format must be pdb or cif')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'synthetic_{residues}r_{chains}c_{seed}.{fmt}')
+    if not os.path.exists(path):
+        structure = build_structure(residues, chains, seed)
+        # Written under a temporary name first, so an interrupted run never leaves a truncated input behind
+        partial = f'{path}.partial'
+        if fmt == 'pdb':
+            write_pdb(structure, partial)
+        else:
+            write_mmcif(structure, partial)
+        os.replace(partial, path)
+    return path
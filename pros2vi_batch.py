@@ -0,0 +1,69 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import logging
+import os
+import sys
+from src import batch
+
+def main():
+    parser = argparse.ArgumentParser(description='Creates secondary structure visualizations for many structures in parallel. Inputs can be directories, glob patterns, structure files, manifest files (one path or PDB code per line) or PDB codes.')
+
+    # Arguments
+    parser.add_argument('inputs', type=str, nargs='+', help='Directories, glob patterns (quoted), PDB/mmCIF files, manifest files or PDB codes.')
+    parser.add_argument('-o', dest='output_dir', type=str, default=None, help='The output directory. Defaults to output.')
+    parser.add_argument('-f', dest='format', type=str, choices=['png', 'jpg', 'svg'], default='png', help='The image format; svg requires the native backend. Defaults to png.')
+    parser.add_argument('-r', dest='residues_per_line', type=int, default=50, help='The number of residues per each line. Defaults to 50.')
+    parser.add_argument('-d', dest='dpi', type=int, default=100, help='The DPI of the output images. Defaults to 100.')
+    parser.add_argument('-pdf', action='store_true', default=False, help='Also generate a PDF for each structure.')
+    parser.add_argument('-j', dest='workers', type=int, default=os.cpu_count(), help='The number of worker processes. Defaults to the number of CPUs.')
+    parser.add_argument('--report', dest='report_path', type=str, default='batch_report.jsonl', help='The per-item status report (JSON lines). Defaults to batch_report.jsonl.')
+    parser.add_argument('--resume', action='store_true', default=False, help='Skip items already reported as successful, to continue an interrupted batch.')
+    parser.add_argument('--download-dir', dest='download_dir', type=str, default='uploads', help='Where structures given by PDB code are downloaded. Defaults to uploads.')
+    parser.add_argument('--backend', dest='backend', default='wkhtml', help='The rendering backend, wkhtml or native. Defaults to wkhtml.')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', default=True, help='Run DSSP even if its assignment for a file is cached.')
+    parser.add_argument('--sprite', action='store_true', default=False, help='Define each icon once as an SVG symbol per document.')
+    parser.add_argument('--group-chains', dest='group_chains', action='store_true', default=False, help='Render identical chains (e.g. of homo-oligomers) once, headed by all their chain IDs.')
+    parser.add_argument('--export', dest='export', default=None, metavar='FORMAT', help=f'Write the per-residue assignment, segments and UniProt IDs of each structure as json, csv, npz, parquet or ndjson instead of rendering it: one file per structure, or with ndjson one line per structure in {batch.EXPORT_STREAM} in the output directory.')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    # The pipeline loads NumPy and is only needed once the arguments are valid
+    from src import visual
+
+    options = {
+        'output_dir': args.output_dir or visual.OUTPUT_FOLDER,
+        'download_dir': args.download_dir,
+        'format': args.format,
+        'residues_per_line': args.residues_per_line,
+        'dpi': args.dpi,
+        'pdf': args.pdf,
+        'sprite': args.sprite,
+        'backend': args.backend,
+        'use_cache': args.use_cache,
+        'export': args.export,
+        'group_chains': args.group_chains,
+    }
+    try:
+        counts = batch.run_batch(args.inputs, options, workers=args.workers, report_path=args.report_path, resume=args.resume)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{counts['ok']} succeeded, {counts['error']} failed, {counts['skipped']} skipped. Report: {args.report_path}")
+    sys.exit(1 if counts['error'] else 0)
+
+
+if __name__ == '__main__':
+    main()
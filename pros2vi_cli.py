@@ -13,13 +13,43 @@
 #   limitations under the License.
 
 import argparse
-from src import visual
+import cProfile
+import json
+import sys
+import time
+from src import cache
+from src import metadata
+from src import metrics
+
+def tile_argument(value):
+    if value == 'chain':
+        return value
+    try:
+        rows = int(value)
+    except ValueError:
+        rows = 0
+    if rows <= 0:
+        raise argparse.ArgumentTypeError('must be "chain" or a positive number of rows')
+    return rows
+
+def print_profile(spans, wall_seconds, path):
+    '''Prints the time spent in each stage to standard error, and writes the spans as JSON to path unless it is "-".'''
+    stages = metrics.summarize(spans)
+    print(f'{"stage":<16} {"calls":>5} {"seconds":>9} {"share":>6}', file=sys.stderr)
+    for stage, total in stages.items():
+        share = total['seconds'] / wall_seconds if wall_seconds else 0
+        print(f'{stage:<16} {total["count"]:>5} {total["seconds"]:>9.3f} {share:>6.1%}', file=sys.stderr)
+    print(f'{"total":<16} {"":>5} {wall_seconds:>9.3f}', file=sys.stderr)
+    print('Stages may overlap (metadata runs in the background, tiles in parallel) and nest (load contains parse and dssp).', file=sys.stderr)
+    if path != '-':
+        with open(path, 'w') as f:
+            json.dump({'wall_seconds': wall_seconds, 'stages': stages, 'spans': spans}, f, indent=2)
 
 def main():
     parser = argparse.ArgumentParser(description='A script that takes in the PDB code and path to the PDB file, and creates a visualization of the secondary structure assignments. Note that you need to have DSSP installed in your system, for this script to work.')
 
     # Arguments
-    parser.add_argument('pdb_file_path', type=str, help='The path to the PDB file.')
+    parser.add_argument('pdb_file_path', type=str, nargs='?', help='The path to the PDB file.')
     parser.add_argument('-n', dest='pdb_name', type=str, default=None, help='The PDB code of the file you want to parse.')
     parser.add_argument('-s', dest='subtitle', type=str, default=None, help='A short informative description of the protein.')
     parser.add_argument('-sn', dest='scientific_name', type=str, default=None, help='The source scientific name.')
@@ -27,11 +57,90 @@ def main():
     parser.add_argument('-o', dest='output_image_name', type=str, default='', help='The name of the output image, you can use the png or jpg. If no argument is provided, it defaults to PDB_CODE.png')
     parser.add_argument('-d', dest='dpi', type=int, default=100, help='The DPI of the output image, as an integer. If no argument provided, it defaults to 100.')
     parser.add_argument('-pdf', action='store_true', default=False, help='A boolean flag indicating whether a PDF output is needed. If --pdf argument is sent, a PDF is generated.')
+    parser.add_argument('--backend', dest='backend', default='wkhtml', help='The rendering backend, wkhtml or native. "native" draws the image in Python (PNG, JPG or SVG) without wkhtmltopdf or poppler. Defaults to wkhtml.')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', default=True, help='Run DSSP even if its assignment for this file is cached, and do not store the result.')
+    parser.add_argument('--clear-cache', action='store_true', default=False, help=f'Remove all cached DSSP assignments and metadata (stored in {cache.CACHE_DIR}, or PROS2VI_CACHE_DIR) before running.')
+    parser.add_argument('--offline', action='store_true', default=metadata.OFFLINE, help='Do not contact the PDBe/RCSB APIs; use cached metadata only.')
+    parser.add_argument('--tile', dest='tile', type=tile_argument, default=None, help='Render large structures in parallel tiles of this many rows, or one tile per chain with "chain". Images are written as a numbered series (NAME_001.png, ...) and the PDF gets one page per tile.')
+    parser.add_argument('--pages', dest='pages', choices=['stitch', 'separate'], default=None, help='How an image of several pages or tiles is written: joined vertically into one image ("stitch", the default without --tile) or as a numbered series ("separate", the default with --tile).')
+    parser.add_argument('--dssp-engine', dest='dssp_engine', default=None, help='"mkdssp" runs the DSSP executable, "builtin" assigns secondary structure in-process with NumPy (no DSSP installation needed, faster for small proteins), "auto" uses mkdssp if it is installed. Defaults to PROS2VI_DSSP_ENGINE, else auto.')
+    parser.add_argument('--all-models', dest='all_models', action='store_true', default=False, help='Assign every model of the file (e.g. an NMR ensemble) in parallel and show the consensus structure, with a bar under each residue for the share of models that agree.')
+    parser.add_argument('--frames', dest='frames', type=str, nargs='+', default=None, help='Trajectory frame files or glob patterns (e.g. "md/frame_*.pdb"), assigned in parallel and shown as their consensus structure like --all-models. pdb_file_path then defaults to the first frame.')
+    parser.add_argument('--profile', dest='profile', nargs='?', const='-', default=None, metavar='PATH', help='Print the time spent in each pipeline stage (load, parse, dssp, metadata, prepare, render_template, pdf, rasterize) when done, and write every timed span as JSON to PATH if given.')
+    parser.add_argument('--cprofile', dest='cprofile', type=str, default=None, metavar='PATH', help='Run under cProfile and save the statistics to PATH, to inspect with "python -m pstats PATH".')
+    parser.add_argument('--sprite', action='store_true', default=False, help='Define each icon once as an SVG symbol and reference it from every residue. Greatly reduces the HTML size and render time for large structures.')
+    parser.add_argument('--select', dest='selection', type=str, default=None, metavar='SELECTION', help='Only show these chains and residue ranges, e.g. "A:1-300,C" (residues 1 to 300 of chain A and all of chain C). DSSP still assigns the whole model.')
+    parser.add_argument('--group-chains', dest='group_chains', action='store_true', default=False, help='Render chains with identical residues, secondary structure and UniProt ID (e.g. the subunits of a homo-oligomer) once, as one block headed by all their chain IDs.')
+    parser.add_argument('--export', dest='export_path', type=str, default=None, metavar='PATH', help='Write the per-residue assignment, the segments and the UniProt IDs of every chain to PATH instead of rendering a visualization. The format is told from the extension: .json, .csv, .npz, .parquet (requires pyarrow) or .ndjson.')
+    parser.add_argument('--export-format', dest='export_format', default=None, help='The format of --export (json, csv, npz, parquet or ndjson), if its extension does not tell it.')
 
     args = parser.parse_args()
 
-    vs = visual.VisualMap(file_path=args.pdb_file_path, pdb_name=args.pdb_name, subtitle=args.subtitle, scientific_name=args.scientific_name)
-    vs.generate_visual(residues_per_line=args.residues_per_line, output_image_name=args.output_image_name, dpi=args.dpi, pdf=args.pdf)
+    # The pipeline modules load NumPy and are only needed once the arguments are valid
+    from src import dssp
+    from src import export
+    from src import selection
+    from src import visual
+
+    if args.backend not in visual.BACKENDS:
+        parser.error(f'argument --backend: invalid choice: {args.backend!r} (choose from {", ".join(visual.BACKENDS)})')
+    if args.dssp_engine is not None and args.dssp_engine not in dssp.DSSP_ENGINES:
+        parser.error(f'argument --dssp-engine: invalid choice: {args.dssp_engine!r} (choose from {", ".join(dssp.DSSP_ENGINES)})')
+    if args.export_format is not None and args.export_format not in export.EXPORT_FORMATS:
+        parser.error(f'argument --export-format: invalid choice: {args.export_format!r} (choose from {", ".join(export.EXPORT_FORMATS)})')
+
+    if args.clear_cache:
+        dssp_cache = cache.get_dssp_cache()
+        if dssp_cache is not None:
+            dssp_cache.clear()
+        metadata.get_metadata_client().clear()
+        if args.pdb_file_path is None:
+            return
+    if args.pdb_file_path is None and args.frames:
+        args.pdb_file_path = args.frames[0]
+    if args.pdb_file_path is None:
+        parser.error('the following arguments are required: pdb_file_path')
+
+    if args.selection is not None:
+        try:
+            selection.parse_selection(args.selection)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.export_path is not None:
+        try:
+            export.resolve_format(args.export_path, args.export_format)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if metrics.TIMING_LOG:
+        metrics.enable_timing_log()
+
+    def run():
+        try:
+            vs = visual.VisualMap(file_path=args.pdb_file_path, pdb_name=args.pdb_name, subtitle=args.subtitle, scientific_name=args.scientific_name, use_cache=args.use_cache,
+                                  metadata=metadata.MetadataClient(offline=args.offline), model_index='all' if args.all_models else 0, frames=args.frames,
+                                  dssp_engine=args.dssp_engine, lookups=('uniprot',) if args.export_path is not None else None,
+                                  group_chains=args.group_chains, selection=args.selection)
+        except ValueError as e:
+            # Arguments that only turn out invalid for this structure, e.g. a selected chain it does not have
+            parser.error(str(e))
+        if args.export_path is not None:
+            vs.export(args.export_path, args.export_format)
+            return
+        vs.generate_visual(residues_per_line=args.residues_per_line, output_image_name=args.output_image_name, dpi=args.dpi, pdf=args.pdf, sprite=args.sprite, backend=args.backend, tile=args.tile, pages=args.pages)
+
+    start = time.perf_counter()
+    with metrics.collect() as spans:
+        if args.cprofile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.runcall(run)
+            finally:
+                profiler.dump_stats(args.cprofile)
+        else:
+            run()
+    if args.profile:
+        print_profile(spans, time.perf_counter() - start, args.profile)
 
 
 if __name__ == '__main__':
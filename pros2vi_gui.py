@@ -13,14 +13,21 @@
 #   limitations under the License.
 
 from src import visual
-from flask import Flask, request, render_template, redirect, url_for, send_from_directory
+from src import jobs
+from src import metrics
+from src.artifacts import ArtifactStore, artifact_key
+from src.cache import file_digest
+from src.selection import format_selection, parse_selection
+from src.sessions import SessionStore
+from flask import Flask, request, render_template, redirect, url_for, send_from_directory, jsonify, abort, g, Response
+from werkzeug.utils import secure_filename
 import webbrowser
 from threading import Timer
 import os
 import json
-from PIL.Image import DecompressionBombError
-from Bio.PDB import PDBList
+import shutil
 import time
+import uuid
 
 app = Flask(__name__)
 
@@ -30,113 +37,253 @@ if not os.path.exists('uploads'):
 UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Rendered results, shared by identical submissions
+artifact_store = ArtifactStore()
+
+# Structures of recent submissions and the state computed from them, so that re-rendering with other settings skips
+# parsing, DSSP and metadata lookups
+session_store = SessionStore()
+
+# Cookie naming the browser's current session
+SESSION_COOKIE = 'pros2vi_session'
+
+# Seconds browsers may reuse a result image without asking again; artifacts never change
+RESULT_MAX_AGE = 24 * 3600
+
+# Latency of every request, by endpoint and status code
+REQUEST_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    'pros2vi_request_seconds', 'Time spent answering HTTP requests.', ('endpoint', 'method', 'status')))
+
+# Fields of the form that are text, also when the form is sent as JSON
+TEXT_FIELDS = ('pdb_name', 'title', 'subtitle', 'scientific_name', 'output_image', 'selection', 'session')
+
+# Color picker elements of the form and the colors they set
+ELEMENT_COLORS = {
+    'helix': ('H_COLOR',),
+    'beta': ('B_COLOR', 'B_A_COLOR'),
+    'strand': ('E_COLOR', 'E_A_COLOR'),
+    'pihelix': ('I_COLOR',),
+    '310helix': ('G_COLOR',),
+    'turn': ('T_COLOR',),
+    'bend': ('S_COLOR',),
+    'ppii': ('P_COLOR',),
+    'unsolved': ('-_COLOR',),
+}
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    if 'request_start' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=request.endpoint or 'unknown',
+                                method=request.method, status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
-    visual.VisualMap.COLORS = {
-        'H_COLOR': '#0000ff',
-        'E_COLOR': '#ff0000',
-        'E_A_COLOR': '#ff0000',
-        'B_COLOR': '#228B22',
-        'B_A_COLOR': '#228B22',
-        'I_COLOR': '#ff00ff',
-        'T_COLOR': '#ffff00',
-        'S_COLOR': '#ffa500',
-        'G_COLOR': '#ff0000',
-        '-_COLOR': '#b7b7b7',
-        'P_COLOR': '#228B22'
-    }
-    return render_template('index.html')
+    session = session_store.get(request.cookies.get(SESSION_COOKIE))
+    session_file = os.path.basename(session['file_path']) if session and session['file_path'] else None
+    return render_template('index.html', session_file=session_file)
+
+def wants_json():
+    return request.is_json or request.accept_mimetypes.best == 'application/json'
 
 @app.route('/submit', methods=['POST'])
 def submit():
-    pdb_name = request.form['pdb_name'] if request.form['pdb_name'] else None
-    file = request.files['file']
-    title = request.form['title'] if request.form['title'] else None
-    subtitle = request.form['subtitle'] if request.form['subtitle'] else None
-    scientific_name = request.form['scientific_name'] if request.form['scientific_name'] else None
-    residues_per_line = int(request.form['residues_per_line']) if request.form['residues_per_line'] else 50
-    dpi = int(request.form['dpi']) if request.form['dpi'] else 100
-    global output_image
-    output_image = request.form['output_image']
-    generate_pdf = 'checkbox' in request.form
-    
-    if request.headers.get('Content-Type') == 'application/json':
+    if request.is_json:
         request_data = request.get_json()
+        if not isinstance(request_data, dict):
+            return error_response('The request body must be a JSON object', 400)
     else:
         request_data = request.form.to_dict()
-    elements_colors_json = request_data.get('element_colors')
-    colors_parsed = json.loads(elements_colors_json)
-
-    filename = file.filename
-
-    if filename == '':
-        if not os.path.isfile(f'uploads/{pdb_name}.cif'):
-            try:
-                pdbl = PDBList(server='https://files.wwpdb.org')
-                pdbl.retrieve_pdb_file(pdb_name, pdir='uploads', file_format='mmCif')
-            except Exception as e:
-                return redirect(url_for('error_page'))
-
-        start_time = time.time() 
-        timeout = 10
-        while not os.path.exists(f'uploads/{pdb_name.lower()}.cif'):
-            if time.time() - start_time > timeout:
-                print("❌ Download attempt timed out.")
-                return redirect(url_for('error_page'))
-            time.sleep(0.5)
-
-        file_path = f'uploads/{pdb_name.lower()}.cif'
-    else:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+
+    def field(name):
+        return request_data.get(name) or None
+
+    pdb_name = field('pdb_name')
+    file = request.files.get('file')
+    try:
+        for name in TEXT_FIELDS:
+            if field(name) is not None and not isinstance(field(name), str):
+                raise ValueError(f'The {name} field must be a string')
+        residues_per_line = positive_int(field('residues_per_line'), 'residues_per_line', 50)
+        dpi = positive_int(field('dpi'), 'dpi', 100)
+        chain_selection = format_selection(parse_selection(field('selection'))) if field('selection') else None
+        colors = element_colors(request_data.get('element_colors'))
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    # A submission without a structure re-renders the one of the current session
+    session = session_store.get(field('session') or request.cookies.get(SESSION_COOKIE))
+
+    # Uploads are saved in a folder of their own, then moved into their session
+    job_id = uuid.uuid4().hex
+    upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], job_id)
+    file_path = None
+    if file is not None and file.filename != '':
+        os.makedirs(upload_folder)
+        file_path = os.path.join(upload_folder, secure_filename(file.filename))
         file.save(file_path)
+        source = file_digest(file_path)
+        output_image = field('output_image') or f'{os.path.basename(file_path).split(".", 1)[0]}.png'
+    elif pdb_name:
+        source = f'pdb:{pdb_name.upper()}'
+        output_image = field('output_image') or f'{pdb_name.lower()}.png'
+    elif session is not None:
+        source = session['source']
+        if session['file_path'] is None:
+            pdb_name = session['pdb_name']
+            output_image = field('output_image') or f'{pdb_name.lower()}.png'
+        else:
+            output_image = field('output_image') or f'{os.path.basename(session["file_path"]).split(".", 1)[0]}.png'
+    else:
+        return error_response('A PDB code or a structure file is required', 400)
+
+    if os.path.splitext(output_image)[1].lower() not in ('.png', '.jpg'):
+        shutil.rmtree(upload_folder, ignore_errors=True)
+        return error_response('The output image name must end with one of the following extensions: "JPG", "PNG"', 400)
+
+    if session is None or session['source'] != source:
+        session = session_store.create(source, file_path, pdb_name=pdb_name if file_path is None else None)
+    # An upload of the session's own structure is not needed again
+    shutil.rmtree(upload_folder, ignore_errors=True)
+
+    def record_spans(job):
+        # The stages were timed in the worker process; record them in this one
+        if job.status == jobs.DONE:
+            metrics.replay(job.result.get('spans'))
+
+    options = {
+        'file_path': session['file_path'],
+        'pdb_name': pdb_name,
+        'title': field('title'),
+        'subtitle': field('subtitle'),
+        'scientific_name': field('scientific_name'),
+        'colors': colors,
+        'residues_per_line': residues_per_line,
+        'dpi': dpi,
+        'selection': chain_selection,
+        'output_image': output_image,
+        'pdf': 'checkbox' in request_data,
+        'artifact_dir': artifact_store.root,
+        'download_dir': session['path'],
+        'session_dir': session['path'],
+    }
+    # Everything that changes the rendered files, but not the name they are downloaded as
+    options['artifact_key'] = artifact_key(source, {
+        'pdb_name': pdb_name,
+        'title': options['title'],
+        'subtitle': options['subtitle'],
+        'scientific_name': options['scientific_name'],
+        'colors': {**visual.VisualMap.COLORS, **colors},
+        'residues_per_line': residues_per_line,
+        'dpi': dpi,
+        'selection': chain_selection,
+        'format': os.path.splitext(output_image)[1].lower(),
+        'pdf': options['pdf'],
+    })
+
+    job_queue = jobs.get_job_queue()
+    manifest = artifact_store.get(options['artifact_key'])
+    metrics.CACHE_REQUESTS.inc(cache='artifact', result='hit' if manifest is not None else 'miss')
+    if manifest is not None:
+        # Rendered before: answer at once
+        job_queue.complete(jobs.artifact_result(options['artifact_key'], manifest, output_image), job_id=job_id)
+    else:
+        try:
+            job_queue.submit(jobs.render_job, options, job_id=job_id, on_finished=record_spans)
+        except jobs.QueueFullError as e:
+            return error_response(str(e), 503)
+
+    if wants_json():
+        response = jsonify(job_id=job_id, session=session['id'], status_url=url_for('job_status', job_id=job_id),
+                           result_url=url_for('result', job_id=job_id))
+        response.status_code = 202
+    else:
+        response = redirect(url_for('result', job_id=job_id))
+    response.set_cookie(SESSION_COOKIE, session['id'], max_age=int(session_store.ttl), httponly=True, samesite='Lax')
+    return response
 
-    if output_image == '':
-        output_image = f'{os.path.splitext(os.path.basename(file_path))[0]}.png'
-
-    pdb_name = title if title else pdb_name
-
-    vs = visual.VisualMap(pdb_name=pdb_name, file_path=file_path, subtitle=subtitle, scientific_name=scientific_name)
-
-    if 'helix' in colors_parsed.keys():
-        visual.VisualMap.COLORS['H_COLOR'] = colors_parsed['helix']
-    if 'beta' in colors_parsed.keys():
-        visual.VisualMap.COLORS['B_COLOR'] = colors_parsed['beta']
-        visual.VisualMap.COLORS['B_A_COLOR'] = colors_parsed['beta']
-    if 'strand' in colors_parsed.keys():
-        visual.VisualMap.COLORS['E_COLOR'] = colors_parsed['strand']
-        visual.VisualMap.COLORS['E_A_COLOR'] = colors_parsed['strand']
-    if 'pihelix' in colors_parsed.keys(): 
-        visual.VisualMap.COLORS['I_COLOR'] = colors_parsed['pihelix']
-    if '310helix' in colors_parsed.keys():
-        visual.VisualMap.COLORS['G_COLOR'] = colors_parsed['310helix']
-    if 'turn' in colors_parsed.keys():
-        visual.VisualMap.COLORS['T_COLOR'] = colors_parsed['turn']
-    if 'bend' in colors_parsed.keys():
-        visual.VisualMap.COLORS['S_COLOR'] = colors_parsed['bend']
-    if 'ppii' in colors_parsed.keys():
-        visual.VisualMap.COLORS['P_COLOR'] = colors_parsed['ppii']
-    if 'unsolved' in colors_parsed.keys():
-        visual.VisualMap.COLORS['-_COLOR'] = colors_parsed['unsolved']
+def positive_int(value, name, default):
+    '''
+    Returns a form or JSON field as a positive integer, or default if it is empty.
 
+    Raises:
+        ValueError: If the value is not a positive integer
+    '''
+    if value is None:
+        return default
+    message = f'The {name} field must be a positive integer'
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(message)
     try:
-        vs.generate_visual(residues_per_line=residues_per_line, output_image_name=output_image, dpi=dpi, pdf=generate_pdf)
-    except DecompressionBombError:
-        return redirect(url_for('error_page_size'))
-    except Exception as e:
-        print(f"Error generating visualization: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
-        return redirect(url_for('error_page'))
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(message)
+    if number <= 0:
+        raise ValueError(message)
+    return number
 
-    return redirect(url_for('result'))
+def element_colors(value):
+    '''
+    Returns the VisualMap colors set by the color pickers, given as an object or its JSON text.
 
-@app.route('/result')
-def result():
-    return render_template("display_image.html", filename=output_image)
+    Raises:
+        ValueError: If the value is not an object of element names to color strings
+    '''
+    if not value:
+        return {}
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError('The element_colors field must be a JSON object')
+    if not isinstance(value, dict) or not all(isinstance(color, str) for color in value.values()):
+        raise ValueError('The element_colors field must map element names to colors')
+    colors = {}
+    for element, color in value.items():
+        for key in ELEMENT_COLORS.get(element, ()):
+            colors[key] = color
+    return colors
+
+def error_response(message, status_code):
+    if wants_json():
+        return jsonify(error=message), status_code
+    return render_template('error_template.html'), status_code
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get_job_queue().get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+@app.route('/result/<job_id>')
+def result(job_id):
+    job = jobs.get_job_queue().get(job_id)
+    if job is None:
+        abort(404)
+    if job.status == jobs.FAILED:
+        print(f"Error generating visualization: {job.error_type}: {job.error}")
+        if job.error_type == 'DecompressionBombError':
+            return redirect(url_for('error_page_size'))
+        return redirect(url_for('error_page'))
+    if job.status != jobs.DONE:
+        return render_template('job_status.html', job=job, position=jobs.get_job_queue().depth())
+    return render_template("display_image.html", result=job.result)
 
-@app.route('/result_image/<filename>')
-def result_image(filename):
-    return send_from_directory(f'{os.getcwd()}/output', filename)
+@app.route('/result_image/<key>/<filename>')
+def result_image(key, filename):
+    key = secure_filename(key)
+    artifact_store.touch(key)
+    # The key identifies the content, so it is a strong ETag and conditional requests are answered with 304
+    return send_from_directory(artifact_store.path(key), filename, etag=f'{key}-{filename}', max_age=RESULT_MAX_AGE)
 
 @app.route('/error_page_size')
 def error_page_size():
@@ -150,6 +297,8 @@ def open_browser():
       webbrowser.open_new("http://127.0.0.1:3000")
 
 if __name__ == "__main__":
+      if metrics.TIMING_LOG:
+          metrics.enable_timing_log()
       # Skip browser auto-open in Docker (when DOCKER_ENV is set)
       if not os.environ.get('DOCKER_ENV'):
           Timer(1, open_browser).start()
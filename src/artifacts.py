@@ -0,0 +1,168 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Rendered images and PDFs of the web interface, stored by content and parameters under a disk quota."""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional, Dict, Any
+
+# Artifact location, overridable with the PROS2VI_ARTIFACT_DIR environment variable
+ARTIFACT_DIR = os.environ.get('PROS2VI_ARTIFACT_DIR', os.path.join(os.getcwd(), 'output', 'artifacts'))
+
+# Size limit of all artifacts in bytes; least recently used artifacts are evicted first
+ARTIFACT_QUOTA_BYTES = int(os.environ.get('PROS2VI_ARTIFACT_QUOTA_MB', '1024')) * 1024 * 1024
+
+# Bumped whenever the rendering changes, so earlier artifacts are no longer served
+ARTIFACT_FORMAT = 2
+
+# Description of the files of an artifact, inside its folder
+MANIFEST_FILE = 'manifest.json'
+
+# Prefix of folders being written; ones left behind by killed jobs are removed after STAGING_MAX_AGE seconds
+STAGING_PREFIX = '.staging-'
+STAGING_MAX_AGE = 24 * 3600
+
+
+def artifact_key(source: str, params: Dict[str, Any]) -> str:
+    '''
+    Returns the key of a rendering: a hash of its input and of every parameter that affects the output.
+
+    Args:
+        source (str): Identifies the input content, e.g. the SHA-256 digest of the uploaded file or "pdb:1FAT".
+        params (dict): The render parameters, JSON-serializable (residues per line, DPI, colors, titles, ...).
+
+    '''
+    payload = json.dumps({'format': ARTIFACT_FORMAT, 'source': source, 'params': params}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ArtifactStore:
+    '''
+    One folder per artifact key holding the rendered files and a manifest. Folders are written under a temporary
+    name and renamed into place when complete, so readers never see a partial artifact and concurrent identical
+    renders are harmless. Serving an artifact marks it as recently used.
+
+    '''
+    def __init__(self, root: str = ARTIFACT_DIR, quota_bytes: int = ARTIFACT_QUOTA_BYTES) -> None:
+        '''
+
+        Args:
+            root (str): The artifact folder, created if missing.
+            quota_bytes (int): The size limit of all artifacts; 0 disables the limit.
+
+        '''
+        self.root = root
+        self.quota_bytes = quota_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        '''Returns the folder of an artifact.'''
+        return os.path.join(self.root, key)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        '''
+        Returns the manifest of an artifact and marks it as recently used, or None if there is none.
+
+        Returns:
+            The file names within the artifact folder, e.g. {"image": "image.png", "pdf": None}
+        '''
+        try:
+            with open(os.path.join(self.path(key), MANIFEST_FILE), 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.touch(key)
+        return manifest
+
+    def touch(self, key: str) -> None:
+        '''Marks an artifact as recently used.'''
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            pass
+
+    def staging_dir(self) -> str:
+        '''Returns a new, empty folder to render an artifact into before commit.'''
+        return tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=self.root)
+
+    def commit(self, key: str, staging_dir: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        '''
+        Moves a rendered staging folder into place as the artifact for key, then evicts artifacts over the quota.
+
+        Returns:
+            The manifest of the stored artifact, which is the existing one if the same key was committed meanwhile.
+        '''
+        with open(os.path.join(staging_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f)
+        try:
+            os.rename(staging_dir, self.path(key))
+        except OSError:
+            # An identical render finished first
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            existing = self.get(key)
+            if existing is None:
+                raise
+            manifest = existing
+        self.evict(keep=key)
+        return manifest
+
+    def _entries(self):
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                mtime = os.stat(path).st_mtime
+                size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+            except OSError:
+                continue
+            yield name, mtime, size
+
+    def size(self) -> int:
+        '''Returns the total size of all artifacts in bytes.'''
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        '''
+        Removes the least recently used artifacts until the store is within its quota, and abandoned staging folders.
+
+        Args:
+            keep (str): An artifact that is never evicted, e.g. the one just written.
+        '''
+        entries = []
+        expired = time.time() - STAGING_MAX_AGE
+        for name, mtime, size in self._entries():
+            if name.startswith(STAGING_PREFIX):
+                if mtime < expired:
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                continue
+            entries.append((mtime, name, size))
+        if not self.quota_bytes:
+            return
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= self.quota_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            total -= size
+
+    def clear(self) -> None:
+        '''Removes every artifact.'''
+        for name in os.listdir(self.root):
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
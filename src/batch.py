@@ -0,0 +1,278 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Batch rendering of many structures over a process pool, with a per-item status report that allows resuming."""
+
+import contextlib
+import glob
+import json
+import logging
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List, Iterable
+
+from src import renderer
+from src.structure_io import STRUCTURE_EXTENSIONS
+
+# A PDB code, e.g. 1FAT; file stems such as "1fat" or "pdb1fat" are recognized too
+PDB_ID_PATTERN = re.compile(r'^(?:pdb)?([0-9][A-Za-z0-9]{3})$')
+
+# The stream of every exported structure with the ndjson export format, in the output directory
+EXPORT_STREAM = 'export.ndjson'
+
+
+def _is_structure_file(path: str) -> bool:
+    return path.lower().endswith(STRUCTURE_EXTENSIONS)
+
+
+def expand_inputs(inputs: Iterable[str]) -> List[str]:
+    '''
+    Expands the batch inputs into a list of structure file paths and PDB codes, without duplicates.
+
+    Each input may be a directory (all structure files in it), a glob pattern, a structure file,
+    a manifest file (one path or PDB code per line, "#" starts a comment) or a PDB code.
+
+    Raises:
+        ValueError: If an input is none of the above
+    '''
+    items = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            items.extend(sorted(
+                os.path.join(entry, name) for name in os.listdir(entry) if _is_structure_file(name)
+            ))
+        elif glob.has_magic(entry):
+            items.extend(sorted(path for path in glob.glob(entry, recursive=True) if _is_structure_file(path)))
+        elif os.path.isfile(entry) and _is_structure_file(entry):
+            items.append(entry)
+        elif os.path.isfile(entry):
+            with open(entry, 'r') as f:
+                lines = [line.split('#', 1)[0].strip() for line in f]
+            manifest_dir = os.path.dirname(entry)
+            for line in lines:
+                if not line:
+                    continue
+                if PDB_ID_PATTERN.match(line) and not os.path.exists(os.path.join(manifest_dir, line)):
+                    items.append(line.upper())
+                else:
+                    items.append(line if os.path.isabs(line) else os.path.join(manifest_dir, line))
+        elif PDB_ID_PATTERN.match(entry):
+            items.append(entry.upper())
+        else:
+            raise ValueError(f'Not a directory, glob, structure file, manifest or PDB code: {entry}')
+
+    seen = set()
+    return [item for item in items if not (item in seen or seen.add(item))]
+
+
+def _pdb_name_for(item: str) -> Optional[str]:
+    '''
+    Returns the PDB code of a batch item: the item itself, or a file name like "1fat.cif" or "pdb1fat.ent".
+
+    '''
+    stem = os.path.basename(item).split('.', 1)[0]
+    match = PDB_ID_PATTERN.match(stem)
+    return match.group(1).upper() if match else None
+
+
+def output_stem(item: str) -> str:
+    '''Returns the name of a batch item's output files without extension: the file name, or the lowercase PDB code.'''
+    if os.path.exists(item):
+        return os.path.basename(item).split('.', 1)[0]
+    return item.lower()
+
+
+def check_output_stems(items: Iterable[str]) -> Dict[str, str]:
+    '''
+    Returns the output stem of every item (see output_stem).
+
+    Raises:
+        ValueError: If items share a stem (ignoring case), as their outputs would overwrite each other
+    '''
+    stems = {item: output_stem(item) for item in items}
+    claimed = {}
+    for item, stem in stems.items():
+        claimed.setdefault(stem.lower(), []).append(item)
+    duplicates = [names for names in claimed.values() if len(names) > 1]
+    if duplicates:
+        raise ValueError('Items with the same output name would overwrite each other: ' +
+                         '; '.join(', '.join(names) for names in duplicates))
+    return stems
+
+
+def check_options(options: Dict[str, Any]) -> None:
+    '''
+    Checks the batch options (see run_batch) before anything is rendered.
+
+    Raises:
+        ValueError: If the format, backend, export format, residues_per_line or dpi is not supported
+    '''
+    from src.export import EXPORT_FORMATS
+    from src.visual import BACKENDS, RENDER_FORMATS
+
+    export_format = options.get('export')
+    if export_format:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f'The export format must be one of: {", ".join(EXPORT_FORMATS)}')
+        return
+    backend = options.get('backend', 'wkhtml')
+    if backend not in BACKENDS:
+        raise ValueError(f'The backend must be one of: {", ".join(BACKENDS)}')
+    image_format = options.get('format', 'png')
+    formats = [f for f in RENDER_FORMATS if f != 'pdf' and (backend == 'native' or f != 'svg')]
+    if image_format not in formats:
+        raise ValueError(f'The {backend} backend renders images as: {", ".join(formats)}')
+    if options.get('residues_per_line', 50) <= 0 or options.get('dpi', 100) <= 0:
+        raise ValueError('The residues_per_line and dpi options must be positive')
+
+
+def render_item(item: str, options: Dict[str, Any], stem: Optional[str] = None) -> Dict[str, Any]:
+    '''
+    Renders one batch item; runs in a worker process. Errors are reported in the result instead of raised.
+
+    Args:
+        item (str): A structure file path or a PDB code.
+        options (dict): The batch options, see run_batch.
+        stem (str): The name of the output files without extension, see check_output_stems; the default is
+            output_stem(item).
+
+    Returns:
+        A status record: item, status ("ok" or "error"), outputs, error and seconds. With the ndjson export format,
+        also the exported data, for the parent process to append to the stream.
+    '''
+    from src.visual import VisualMap
+
+    start = time.time()
+    record = {'item': item, 'status': 'ok', 'outputs': [], 'error': None}
+    try:
+        pdb_name = _pdb_name_for(item)
+        if os.path.exists(item):
+            file_path = item
+        else:
+            from Bio.PDB import PDBList
+            os.makedirs(options['download_dir'], exist_ok=True)
+            file_path = PDBList(server='https://files.wwpdb.org', verbose=False).retrieve_pdb_file(
+                item, pdir=options['download_dir'], file_format='mmCif'
+            )
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f'Download of {item} failed')
+
+        export_format = options.get('export')
+        vs = VisualMap(file_path=file_path, pdb_name=pdb_name, use_cache=options.get('use_cache', True),
+                       lookups=('uniprot',) if export_format else None, group_chains=options.get('group_chains', False))
+        stem = stem or output_stem(item)
+        if export_format == 'ndjson':
+            record['data'] = vs.export_data()
+        elif export_format:
+            record['outputs'] = [vs.export(os.path.join(options['output_dir'], f'{stem}.{export_format}'), export_format)]
+        else:
+            outputs = [{'path': os.path.join(options['output_dir'], f"{stem}.{options.get('format', 'png')}"),
+                        'dpi': options.get('dpi', 100), 'residues_per_line': options.get('residues_per_line', 50)}]
+            if options.get('pdf'):
+                outputs.append({'path': os.path.join(options['output_dir'], f'{stem}.pdf'), 'dpi': options.get('dpi', 100),
+                                'residues_per_line': options.get('residues_per_line', 50)})
+            record['outputs'] = vs.render_plan(outputs, sprite=options.get('sprite', False),
+                                               backend=options.get('backend', 'wkhtml'))
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = f'{type(e).__name__}: {e}'
+        logging.debug(traceback.format_exc())
+    record['seconds'] = round(time.time() - start, 3)
+    return record
+
+
+def read_report(report_path: str) -> Dict[str, Dict[str, Any]]:
+    '''
+    Returns the last status record of each item in a JSON lines report, or an empty dictionary if there is none.
+
+    '''
+    records = {}
+    if not os.path.exists(report_path):
+        return records
+    with open(report_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run
+                continue
+            records[record['item']] = record
+    return records
+
+
+def run_batch(inputs: Iterable[str], options: Dict[str, Any], workers: Optional[int] = None,
+              report_path: str = 'batch_report.jsonl', resume: bool = False) -> Dict[str, int]:
+    '''
+    Renders every item over a pool of worker processes. DSSP assignments and metadata are shared between the
+    workers through the on-disk caches, and the renderer slots (see src/renderer.py) through a semaphore, so the
+    workers together never run more than RENDERER_PROCESSES wkhtmltoimage and wkhtmltopdf processes. Each finished item is appended to the report as one JSON line, so a
+    failure does not stop the run and an interrupted run can be resumed.
+
+    Args:
+        inputs (list): Directories, globs, structure files, manifest files and PDB codes (see expand_inputs).
+        options (dict): output_dir, download_dir, format ("png", "jpg" or "svg"), residues_per_line, dpi,
+            pdf, sprite, backend, use_cache, group_chains and export. An export format (see src/export.py) writes the data of each
+            item instead of rendering it; with "ndjson", one line per item is appended to EXPORT_STREAM as items finish.
+        workers (int): The number of worker processes, the default is the number of CPUs.
+        report_path (str): The JSON lines status report.
+        resume (bool): If True, items already reported as "ok" are skipped.
+
+    Returns:
+        The number of items per status, including "skipped".
+
+    Raises:
+        ValueError: If an input, the options or the output names of the items are invalid, see expand_inputs,
+            check_options and check_output_stems
+    '''
+    from src.export import write_ndjson_line
+
+    check_options(options)
+    items = expand_inputs(inputs)
+    # Every output goes to the ndjson stream, so only separate output files need distinct names
+    stems = check_output_stems(items) if options.get('export') != 'ndjson' else {}
+    counts = {'ok': 0, 'error': 0, 'skipped': 0}
+    if resume:
+        done = {item for item, record in read_report(report_path).items() if record['status'] == 'ok'}
+        counts['skipped'] = sum(1 for item in items if item in done)
+        items = [item for item in items if item not in done]
+    os.makedirs(options['output_dir'], exist_ok=True)
+    stream_path = os.path.join(options['output_dir'], EXPORT_STREAM) if options.get('export') == 'ndjson' else None
+
+    with open(report_path, 'a') as report, \
+            open(stream_path, 'a') if stream_path else contextlib.nullcontext() as stream, \
+            ProcessPoolExecutor(max_workers=workers, initializer=renderer.set_slots,
+                                initargs=(renderer.shared_slots(),)) as executor:
+        futures = {executor.submit(render_item, item, options, stems.get(item)): item for item in items}
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as e:
+                # The worker process itself died (e.g. out of memory)
+                record = {'item': futures[future], 'status': 'error', 'outputs': [], 'error': f'{type(e).__name__}: {e}'}
+            data = record.pop('data', None)
+            if data is not None:
+                write_ndjson_line({'item': record['item'], **data}, stream)
+                stream.flush()
+                record['outputs'] = [stream_path]
+            counts[record['status']] += 1
+            report.write(json.dumps(record) + '\n')
+            report.flush()
+            if record['status'] == 'ok':
+                logging.info(f"{record['item']}: {', '.join(record['outputs'])}")
+            else:
+                logging.warning(f"{record['item']}: {record['error']}")
+    return counts
@@ -0,0 +1,227 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Persistent on-disk caches, shared between the CLI, the GUI and concurrent worker processes."""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+import zlib
+from typing import Optional, Dict
+
+# Cache location, overridable with the PROS2VI_CACHE_DIR environment variable
+CACHE_DIR = os.environ.get('PROS2VI_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'pros2vi'))
+
+# Size limit of the DSSP cache in bytes (compressed entries); least recently used entries are evicted first
+DSSP_CACHE_MAX_BYTES = int(os.environ.get('PROS2VI_DSSP_CACHE_MB', '512')) * 1024 * 1024
+
+# Seconds to wait for a database lock held by another process
+SQLITE_TIMEOUT = 30
+
+# Bumped whenever the format or the meaning of cached DSSP entries changes
+DSSP_CACHE_FORMAT = 2
+
+
+def file_digest(file_path: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's content, read in 1 MB chunks.
+
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def dssp_version() -> str:
+    """
+    Returns the version line of the DSSP executable used by Biopython ("dssp", else "mkdssp"),
+    or "unknown" if neither can be run. The result is computed once per process.
+
+    """
+    for executable in ('dssp', 'mkdssp'):
+        path = shutil.which(executable)
+        if path is None:
+            continue
+        try:
+            result = subprocess.run([path, '--version'], capture_output=True, text=True, timeout=SQLITE_TIMEOUT)
+        except (OSError, subprocess.SubprocessError):
+            continue
+        output = (result.stdout or result.stderr).strip()
+        return f"{executable} {output.splitlines()[0] if output else 'unknown'}"
+    return 'unknown'
+
+
+class SQLiteStore:
+    '''
+    A key-value store of compressed blobs in one SQLite file, bounded in size with least-recently-used eviction.
+    Safe to share between threads and processes.
+
+    '''
+    def __init__(self, path: str, max_bytes: int) -> None:
+        '''
+
+        Args:
+            path (str): The SQLite database file, created if missing.
+            max_bytes (int): The size limit of all stored values; 0 disables the limit.
+
+        '''
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, '
+                'created REAL NOT NULL, last_access REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[bytes]:
+        '''
+        Returns the value stored under key and marks it as recently used, or None if it is missing
+        or older than max_age seconds.
+
+        '''
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            row = connection.execute('SELECT value, created FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None or (max_age is not None and now - row[1] > max_age):
+                self.misses += 1
+                return None
+            connection.execute('UPDATE entries SET last_access = ? WHERE key = ?', (now, key))
+        self.hits += 1
+        return zlib.decompress(row[0])
+
+    def put(self, key: str, value: bytes) -> None:
+        '''
+        Stores value under key, then evicts least recently used entries beyond the size limit.
+
+        '''
+        blob = zlib.compress(value)
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO entries (key, value, size, created, last_access) VALUES (?, ?, ?, ?, ?)',
+                (key, blob, len(blob), now, now)
+            )
+            if self.max_bytes:
+                self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in connection.execute('SELECT key, size FROM entries ORDER BY last_access').fetchall():
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self) -> None:
+        '''Removes every entry.'''
+        with self._lock, self._connect() as connection:
+            connection.execute('DELETE FROM entries')
+        with self._connect() as connection:
+            connection.execute('VACUUM')
+
+    def size(self) -> int:
+        '''Returns the total size of the stored (compressed) values in bytes.'''
+        with self._connect() as connection:
+            return connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+
+class DSSPCache:
+    '''
+    Caches DSSP assignments (VisualMap.structure_list) keyed by the input file's content hash,
+    the DSSP executable version and the model index.
+
+    '''
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = DSSP_CACHE_MAX_BYTES) -> None:
+        self.store = SQLiteStore(os.path.join(cache_dir, 'dssp.sqlite'), max_bytes)
+
+    @staticmethod
+    def key(file_path: str, model_index: int = 0, digest: Optional[str] = None, version: Optional[str] = None) -> str:
+        '''
+        Returns the cache key of a structure file, hashing its full content unless its digest is given.
+        The version defaults to that of the DSSP executable (see src/dssp.py for the built-in engine's).
+
+        '''
+        return f'{DSSP_CACHE_FORMAT}:{digest or file_digest(file_path)}:{version or dssp_version()}:{model_index}'
+
+    def get(self, key: str) -> Optional[Dict[str, 'ChainData']]:
+        '''
+        Returns the cached structure_list for key, or None.
+
+        '''
+        from src.chains import ChainData
+
+        value = self.store.get(key)
+        if value is None:
+            return None
+        return {
+            chain_id: ChainData(chain_id, res_nums, res_names, res_strucs)
+            for chain_id, (res_nums, res_names, res_strucs) in json.loads(value).items()
+        }
+
+    def put(self, key: str, structure_list: Dict[str, 'ChainData']) -> None:
+        '''
+        Stores a structure_list under key, as one residue-number list and two one-letter strings per chain.
+
+        '''
+        compact = {
+            chain_id: [chain.res_nums.tolist(), chain.sequence, chain.ss]
+            for chain_id, chain in structure_list.items()
+        }
+        self.store.put(key, json.dumps(compact, separators=(',', ':')).encode('utf-8'))
+
+    def clear(self) -> None:
+        '''Removes every cached assignment.'''
+        self.store.clear()
+
+
+_dssp_cache = None
+_dssp_cache_lock = threading.Lock()
+
+
+def get_dssp_cache() -> Optional[DSSPCache]:
+    '''
+    Returns the process-wide DSSP cache, or None if the cache directory cannot be used.
+
+    '''
+    global _dssp_cache
+    with _dssp_cache_lock:
+        if _dssp_cache is None:
+            try:
+                _dssp_cache = DSSPCache()
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"DSSP cache disabled, {CACHE_DIR} is not usable: {e}")
+                _dssp_cache = False
+        return _dssp_cache or None
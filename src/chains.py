@@ -0,0 +1,118 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Compact columnar storage of the per-residue DSSP assignment of a chain."""
+
+from typing import Any, Dict, Iterable, Iterator, List, Union
+
+import numpy as np
+
+
+class ChainData:
+    '''
+    The DSSP assignment of one chain, stored as contiguous columns instead of one dictionary per residue:
+    an int32 array of residue numbers, a one-letter sequence string and a string of secondary structure codes.
+
+    For existing callers it still behaves like the former list of residue dictionaries: len(), iteration and
+    integer indexing yield {"chain", "res_num", "res_name", "res_struc"} dictionaries, and slicing returns a
+    ChainData.
+
+    '''
+    __slots__ = ('chain_id', 'res_nums', 'sequence', 'ss')
+
+    def __init__(self, chain_id: str, res_nums: Union[Iterable[int], np.ndarray], sequence: str, ss: str) -> None:
+        '''
+
+        Args:
+            chain_id (str): The chain identifier.
+            res_nums (list): The residue numbers.
+            sequence (str): One-letter residue names, one character per residue.
+            ss (str): DSSP secondary structure codes, one character per residue.
+
+        Raises:
+            ValueError: If the columns have different lengths
+        '''
+        self.chain_id = chain_id
+        self.res_nums = np.asarray(res_nums, dtype=np.int32)
+        self.sequence = sequence
+        self.ss = ss
+        if not len(self.res_nums) == len(sequence) == len(ss):
+            raise ValueError('The residue numbers, sequence and secondary structure must have the same length')
+
+    @classmethod
+    def from_residues(cls, chain_id: str, residues: List[Dict[str, Any]]) -> 'ChainData':
+        '''
+        Builds a ChainData from a list of residue dictionaries as produced by DSSP parsing.
+
+        '''
+        return cls(
+            chain_id,
+            [res['res_num'] for res in residues],
+            ''.join(res['res_name'] for res in residues),
+            ''.join(res['res_struc'] for res in residues),
+        )
+
+    def residue(self, index: int) -> Dict[str, Any]:
+        '''
+        Returns the residue at index as a dictionary, the format of the former structure_list entries.
+
+        '''
+        return {
+            'chain': self.chain_id,
+            'res_num': int(self.res_nums[index]),
+            'res_name': self.sequence[index],
+            'res_struc': self.ss[index],
+        }
+
+    def take(self, indices: np.ndarray) -> 'ChainData':
+        '''
+        Returns the residues at the given indices, in their order, as a ChainData.
+
+        '''
+        indices = np.asarray(indices, dtype=np.intp)
+        sequence = np.frombuffer(self.sequence.encode('utf-32-le'), dtype=np.uint32)[indices]
+        ss = np.frombuffer(self.ss.encode('utf-32-le'), dtype=np.uint32)[indices]
+        return ChainData(self.chain_id, self.res_nums[indices], sequence.tobytes().decode('utf-32-le'),
+                         ss.tobytes().decode('utf-32-le'))
+
+    def to_residues(self) -> List[Dict[str, Any]]:
+        '''Returns all residues as a list of dictionaries.'''
+        return [self.residue(index) for index in range(len(self))]
+
+    def __len__(self) -> int:
+        return len(self.ss)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict[str, Any], 'ChainData']:
+        if isinstance(index, slice):
+            return ChainData(self.chain_id, self.res_nums[index], self.sequence[index], self.ss[index])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('residue index out of range')
+        return self.residue(index)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for index in range(len(self)):
+            yield self.residue(index)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, list):
+            return self.to_residues() == other
+        if not isinstance(other, ChainData):
+            return NotImplemented
+        return (self.chain_id == other.chain_id and self.sequence == other.sequence and self.ss == other.ss
+                and np.array_equal(self.res_nums, other.res_nums))
+
+    def __repr__(self) -> str:
+        return f'ChainData(chain_id={self.chain_id!r}, residues={len(self)})'
@@ -0,0 +1,496 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Built-in DSSP: backbone hydrogen bonds and the secondary structure assignment of Kabsch & Sander, with the
+DSSP 4 rules for pi-helix priority and polyproline II helices, computed in-process with NumPy instead of mkdssp."""
+
+import logging
+import os
+import shutil
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+from src.chains import ChainData
+
+# DSSP implementation: "mkdssp" (the executable, through Bio.PDB.DSSP), "builtin" (this module), or "auto" for
+# mkdssp when it is installed and the built-in engine otherwise
+DSSP_ENGINE = os.environ.get('PROS2VI_DSSP_ENGINE', 'auto')
+DSSP_ENGINES = ('auto', 'mkdssp', 'builtin')
+
+# Part of the DSSP cache key of built-in assignments; bumped whenever they change
+BUILTIN_VERSION = 'builtin 1'
+
+# Electrostatic hydrogen bond energy of DSSP, in kcal/mol: COUPLING_CONSTANT is -0.084 * 332
+COUPLING_CONSTANT = -27.888
+MIN_HBOND_ENERGY = -9.9
+MAX_HBOND_ENERGY = -0.5
+# Atom distances below this (in Å) are clashes, given the minimum energy
+MINIMAL_DISTANCE = 0.5
+
+# Residues whose CA atoms are farther apart (in Å) are not tested for hydrogen bonds; also the spatial bin size
+MINIMAL_CA_DISTANCE = 9.0
+
+# Longest C-N peptide bond in Å; residues farther apart are separated by a chain break
+MAX_PEPTIDE_BOND_LENGTH = 2.5
+
+# Minimum angle of the CA trace at a bend, in degrees
+BEND_ANGLE = 70.0
+
+# Polyproline II region (phi, psi) +- epsilon in degrees, and the minimum stretch of residues in it
+PP_PHI = -75.0
+PP_PSI = 145.0
+PP_EPSILON = 29.0
+PP_STRETCH = 3
+
+# Backbone atoms every assigned residue needs
+BACKBONE_ATOMS = ('N', 'CA', 'C', 'O')
+
+_warned_fallback = False
+
+
+def mkdssp_path() -> Optional[str]:
+    '''Returns the path of the DSSP executable Biopython runs ("dssp", else "mkdssp"), or None.'''
+    return shutil.which('dssp') or shutil.which('mkdssp')
+
+
+def resolve_engine(engine: Optional[str] = None) -> str:
+    '''
+    Returns the engine to run, "mkdssp" or "builtin", for an engine setting (the default is DSSP_ENGINE).
+
+    Raises:
+        ValueError: If the engine is not one of DSSP_ENGINES
+    '''
+    global _warned_fallback
+    engine = engine or DSSP_ENGINE
+    if engine not in DSSP_ENGINES:
+        raise ValueError(f'The DSSP engine must be one of: {", ".join(DSSP_ENGINES)}')
+    if engine != 'auto':
+        return engine
+    if mkdssp_path() is not None:
+        return 'mkdssp'
+    if not _warned_fallback:
+        _warned_fallback = True
+        logging.warning('mkdssp was not found, secondary structure is assigned by the built-in DSSP engine')
+    return 'builtin'
+
+
+def engine_version(engine: str) -> str:
+    '''Returns the version recorded in DSSP cache keys for a resolved engine.'''
+    if engine == 'builtin':
+        return BUILTIN_VERSION
+    from src.cache import dssp_version
+    return dssp_version()
+
+
+def _backbone(model) -> Tuple[List[str], List[int], str, np.ndarray]:
+    '''
+    Collects the amino acids of a model that have a complete backbone, in model order.
+
+    Returns:
+        (chain IDs, residue numbers, one-letter sequence, coordinates of shape (residues, 4, 3) in BACKBONE_ATOMS order)
+    '''
+    from Bio.Data.PDBData import protein_letters_3to1, protein_letters_3to1_extended
+
+    chain_ids = []
+    res_nums = []
+    letters = []
+    coords = []
+    for chain in model:
+        for residue in chain:
+            hetero, res_num, _ = residue.id
+            resname = residue.get_resname()
+            if hetero == 'W' or (hetero != ' ' and resname not in protein_letters_3to1_extended):
+                continue
+            try:
+                coords.append([residue[name].coord for name in BACKBONE_ATOMS])
+            except KeyError:
+                continue
+            chain_ids.append(chain.id)
+            res_nums.append(res_num)
+            letters.append(protein_letters_3to1.get(resname, 'X'))
+    return chain_ids, res_nums, ''.join(letters), np.array(coords, dtype=np.float64).reshape(-1, 4, 3)
+
+
+def _neighbor_pairs(points: np.ndarray, cutoff: float) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Returns the index pairs (i < j) of points closer than cutoff, binning the points into cubes of the cutoff size
+    so that only points in neighboring cubes are compared.
+
+    '''
+    n = len(points)
+    cells = np.floor(points / cutoff).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    first = []
+    second = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                neighbor_keys = keys + (dx * dims[1] + dy) * dims[2] + dz
+                starts = np.searchsorted(sorted_keys, neighbor_keys, 'left')
+                counts = np.searchsorted(sorted_keys, neighbor_keys, 'right') - starts
+                total = counts.sum()
+                if not total:
+                    continue
+                offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                first.append(np.repeat(np.arange(n), counts))
+                second.append(order[np.repeat(starts, counts) + offsets])
+    if not first:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    i = np.concatenate(first)
+    j = np.concatenate(second)
+    keep = (i < j) & (np.linalg.norm(points[i] - points[j], axis=1) < cutoff)
+    return i[keep], j[keep]
+
+
+def _hbond_energies(donors: np.ndarray, acceptors: np.ndarray, n: np.ndarray, h: np.ndarray, c: np.ndarray,
+                    o: np.ndarray) -> np.ndarray:
+    '''Returns the DSSP energy of the N-H(donor)...O=C(acceptor) hydrogen bond of each pair.'''
+    d_on = np.linalg.norm(o[acceptors] - n[donors], axis=1)
+    d_ch = np.linalg.norm(c[acceptors] - h[donors], axis=1)
+    d_oh = np.linalg.norm(o[acceptors] - h[donors], axis=1)
+    d_cn = np.linalg.norm(c[acceptors] - n[donors], axis=1)
+    with np.errstate(divide='ignore'):
+        energy = COUPLING_CONSTANT * (1 / d_oh - 1 / d_ch + 1 / d_cn - 1 / d_on)
+    clash = (d_on < MINIMAL_DISTANCE) | (d_ch < MINIMAL_DISTANCE) | (d_oh < MINIMAL_DISTANCE) | (d_cn < MINIMAL_DISTANCE)
+    energy = np.where(clash, MIN_HBOND_ENERGY, np.round(energy, 3))
+    return np.maximum(energy, MIN_HBOND_ENERGY)
+
+
+def _dihedrals(p0: np.ndarray, p1: np.ndarray, p2: np.ndarray, p3: np.ndarray) -> np.ndarray:
+    '''Returns the dihedral angles of the atom quadruples, in degrees.'''
+    b0 = p0 - p1
+    b1 = p2 - p1
+    b2 = p3 - p2
+    b1 = b1 / np.linalg.norm(b1, axis=1, keepdims=True)
+    v = b0 - np.sum(b0 * b1, axis=1, keepdims=True) * b1
+    w = b2 - np.sum(b2 * b1, axis=1, keepdims=True) * b1
+    x = np.sum(v * w, axis=1)
+    y = np.sum(np.cross(b1, v) * w, axis=1)
+    return np.degrees(np.arctan2(y, x))
+
+
+class BackboneDSSP:
+    '''
+    The DSSP assignment of one model. Residues are indexed in model order; chain breaks are chain changes and
+    peptide bonds longer than MAX_PEPTIDE_BOND_LENGTH.
+
+    Attributes:
+        ss (str): One DSSP code per residue ("-" for loops).
+        acceptors (np.ndarray): Shape (residues, 2), the acceptor residues of each residue's N-H in its two
+            strongest hydrogen bonds below MAX_HBOND_ENERGY, or -1.
+    '''
+    def __init__(self, chain_ids: List[str], res_nums: List[int], sequence: str, coords: np.ndarray) -> None:
+        self.chain_ids = chain_ids
+        self.res_nums = res_nums
+        self.sequence = sequence
+        size = len(sequence)
+        self.size = size
+        n, ca, c, o = (coords[:, k] for k in range(4))
+
+        # Chain breaks: breaks[i] is True if residue i does not continue residue i - 1
+        breaks = np.ones(size, dtype=bool)
+        same_chain = np.zeros(size, dtype=bool)
+        if size > 1:
+            same_chain[1:] = np.array(chain_ids[1:]) == np.array(chain_ids[:-1])
+            bonded = np.linalg.norm(n[1:] - c[:-1], axis=1) <= MAX_PEPTIDE_BOND_LENGTH
+            breaks[1:] = ~(same_chain[1:] & bonded)
+        self._break_count = np.cumsum(breaks)
+
+        # Amide hydrogens, placed along the C=O direction of the previous residue of the chain; chain starts keep
+        # H on N, which cancels their energies
+        h = n.copy()
+        previous = np.flatnonzero(same_chain)
+        if len(previous):
+            co = c[previous - 1] - o[previous - 1]
+            h[previous] = n[previous] + co / np.linalg.norm(co, axis=1, keepdims=True)
+        follows = np.flatnonzero(~breaks)
+
+        self.acceptors = self._strongest_acceptors(n, h, ca, c, o)
+
+        # Backbone dihedrals, NaN where undefined
+        self.phi = np.full(size, np.nan)
+        self.psi = np.full(size, np.nan)
+        if len(follows):
+            self.phi[follows] = _dihedrals(c[follows - 1], n[follows], ca[follows], c[follows])
+            self.psi[follows - 1] = _dihedrals(n[follows - 1], ca[follows - 1], c[follows - 1], n[follows])
+
+        ss = np.full(size, '-', dtype='<U1')
+        self._assign_sheets(ss)
+        self._assign_helices(ss, ca)
+        self._assign_pp(ss)
+        self.ss = ''.join(ss)
+
+    def _strongest_acceptors(self, n, h, ca, c, o) -> np.ndarray:
+        '''Private method that keeps the two strongest hydrogen bonds of every N-H, as DSSP does.'''
+        acceptors = np.full((self.size, 2), -1, dtype=np.intp)
+        first, second = _neighbor_pairs(ca, MINIMAL_CA_DISTANCE)
+        # Both directions of every close pair, except the N-H of a residue to the C=O of the one before it
+        donors = np.concatenate([first, second[second != first + 1]])
+        targets = np.concatenate([second, first[second != first + 1]])
+        proline = np.frombuffer(self.sequence.encode('ascii'), dtype=np.uint8) == ord('P')
+        keep = ~proline[donors]
+        donors, targets = donors[keep], targets[keep]
+
+        energies = _hbond_energies(donors, targets, n, h, c, o)
+        bonded = energies < MAX_HBOND_ENERGY
+        donors, targets, energies = donors[bonded], targets[bonded], energies[bonded]
+        order = np.lexsort((energies, donors))
+        donors, targets = donors[order], targets[order]
+        group_starts = np.flatnonzero(np.r_[True, donors[1:] != donors[:-1]])
+        rank = np.arange(len(donors)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(donors)]))
+        strongest = rank < 2
+        acceptors[donors[strongest], rank[strongest]] = targets[strongest]
+        return acceptors
+
+    def bond(self, donors, acceptors) -> np.ndarray:
+        '''Returns whether the N-H of each donor residue is hydrogen bonded to the C=O of the acceptor residue.'''
+        donors = np.asarray(donors)
+        acceptors = np.asarray(acceptors)
+        valid = (donors >= 0) & (donors < self.size) & (acceptors >= 0) & (acceptors < self.size)
+        safe = np.where(valid, donors, 0)
+        return valid & ((self.acceptors[safe, 0] == acceptors) | (self.acceptors[safe, 1] == acceptors))
+
+    def no_break(self, first, last) -> np.ndarray:
+        '''Returns whether residues first..last are one unbroken stretch of chain.'''
+        first = np.asarray(first)
+        last = np.asarray(last)
+        valid = (first >= 0) & (last < self.size) & (first <= last)
+        first = np.clip(first, 0, self.size - 1)
+        last = np.clip(last, 0, self.size - 1)
+        return valid & (self._break_count[last] == self._break_count[first])
+
+    def _bridges(self) -> List[Tuple[int, int, str]]:
+        '''Private method that returns the bridge partners (i, j, "p" or "a") with j >= i + 3, sorted by i and j.'''
+        donors, slots = np.nonzero(self.acceptors >= 0)
+        targets = self.acceptors[donors, slots]
+        # Every bridge involves a hydrogen bond between the neighborhoods of its residues
+        shifts = np.array([-1, 0, 1])
+        x = (donors[:, None, None] + shifts[None, :, None]).repeat(3, axis=2).ravel()
+        y = (targets[:, None, None] + shifts[None, None, :]).repeat(3, axis=1).ravel()
+        i = np.minimum(x, y)
+        j = np.maximum(x, y)
+        keep = (i >= 1) & (j >= i + 3) & (j + 1 < self.size)
+        if not keep.any():
+            return []
+        pairs = np.unique(np.stack([i[keep], j[keep]], axis=1), axis=0)
+        i, j = pairs[:, 0], pairs[:, 1]
+
+        valid = self.no_break(i - 1, i + 1) & self.no_break(j - 1, j + 1)
+        parallel = valid & ((self.bond(i + 1, j) & self.bond(j, i - 1)) | (self.bond(j + 1, i) & self.bond(i, j - 1)))
+        antiparallel = valid & ~parallel & ((self.bond(i + 1, j - 1) & self.bond(j + 1, i - 1)) |
+                                            (self.bond(j, i) & self.bond(i, j)))
+        bridges = [(int(a), int(b), 'p') for a, b in zip(i[parallel], j[parallel])]
+        bridges += [(int(a), int(b), 'a') for a, b in zip(i[antiparallel], j[antiparallel])]
+        return sorted(bridges)
+
+    def _assign_sheets(self, ss: np.ndarray) -> None:
+        '''Private method that joins bridges into ladders, over beta bulges, and assigns E and B.'''
+        ladders = []
+        for i, j, kind in self._bridges():
+            for ladder in ladders:
+                if ladder['type'] != kind or i != ladder['i'][-1] + 1:
+                    continue
+                if kind == 'p' and ladder['j'][-1] + 1 == j:
+                    ladder['i'].append(i)
+                    ladder['j'].append(j)
+                    break
+                if kind == 'a' and ladder['j'][0] - 1 == j:
+                    ladder['i'].append(i)
+                    ladder['j'].insert(0, j)
+                    break
+            else:
+                ladders.append({'type': kind, 'i': [i], 'j': [j]})
+
+        ladders.sort(key=lambda ladder: ladder['i'][0])
+        a = 0
+        while a < len(ladders):
+            b = a + 1
+            while b < len(ladders):
+                first, second = ladders[a], ladders[b]
+                ibi, iei, jbi, jei = first['i'][0], first['i'][-1], first['j'][0], first['j'][-1]
+                ibj, iej, jbj, jej = second['i'][0], second['i'][-1], second['j'][0], second['j'][-1]
+                if (first['type'] != second['type'] or
+                        not self.no_break(min(ibi, ibj), max(iei, iej)) or
+                        not self.no_break(min(jbi, jbj), max(jei, jej)) or
+                        not 0 <= ibj - iei < 6 or
+                        (iei >= ibj and ibi <= iej)):
+                    b += 1
+                    continue
+                # Gaps are unsigned in DSSP, so negative gaps never count as small
+                if first['type'] == 'p':
+                    bulge = (0 <= jbj - jei < 6 and ibj - iei < 3) or 0 <= jbj - jei < 3
+                else:
+                    bulge = (0 <= jbi - jej < 6 and ibj - iei < 3) or 0 <= jbi - jej < 3
+                if bulge:
+                    first['i'].extend(second['i'])
+                    if first['type'] == 'p':
+                        first['j'].extend(second['j'])
+                    else:
+                        first['j'][:0] = second['j']
+                    del ladders[b]
+                else:
+                    b += 1
+            a += 1
+
+        for ladder in ladders:
+            code = 'E' if len(ladder['i']) > 1 else 'B'
+            for first, last in ((ladder['i'][0], ladder['i'][-1]), (ladder['j'][0], ladder['j'][-1])):
+                span = ss[first:last + 1]
+                span[span != 'E'] = code
+
+    def _assign_helices(self, ss: np.ndarray, ca: np.ndarray) -> None:
+        '''Private method that assigns H, G and I from n-turns, with pi-helices taking precedence, then T and S.'''
+        size = self.size
+        index = np.arange(size)
+        starts = {}
+        for stride in (3, 4, 5):
+            starts[stride] = self.no_break(index, index + stride) & self.bond(index + stride, index)
+
+        def helix(stride: int, allowed: Optional[Tuple[str, ...]], code: str) -> None:
+            i = np.arange(1, max(size - stride, 1))
+            i = i[starts[stride][i] & starts[stride][i - 1]]
+            if allowed is not None:
+                free = np.isin(ss, allowed)
+                i = i[np.all([free[i + k] for k in range(stride)], axis=0)] if len(i) else i
+            for k in range(stride):
+                ss[i + k] = code
+
+        helix(4, None, 'H')
+        helix(3, ('-', 'G'), 'G')
+        helix(5, ('-', 'I', 'H'), 'I')
+
+        turn = np.zeros(size, dtype=bool)
+        for stride in (3, 4, 5):
+            for k in range(1, stride):
+                turn[k:] |= starts[stride][:size - k]
+        loop = ss == '-'
+        loop[[0, -1]] = False
+        ss[loop & turn] = 'T'
+
+        # Bends: the CA trace turns by more than BEND_ANGLE over residues i - 2 .. i + 2
+        if size > 4:
+            i = np.arange(2, size - 2)
+            before = ca[i] - ca[i - 2]
+            after = ca[i + 2] - ca[i]
+            cosine = np.sum(before * after, axis=1) / (np.linalg.norm(before, axis=1) * np.linalg.norm(after, axis=1))
+            kappa = np.degrees(np.arccos(np.clip(cosine, -1, 1)))
+            bend = (kappa > BEND_ANGLE) & self.no_break(i - 2, i + 2)
+            ss[i[bend & (ss[i] == '-')]] = 'S'
+
+    def _assign_pp(self, ss: np.ndarray) -> None:
+        '''Private method that assigns P to loop residues in stretches of PP_STRETCH residues in the PPII region.'''
+        with np.errstate(invalid='ignore'):
+            in_region = ((np.abs(self.phi - PP_PHI) <= PP_EPSILON) & (np.abs(self.psi - PP_PSI) <= PP_EPSILON))
+        stretch = np.zeros(self.size, dtype=bool)
+        i = np.arange(1, max(self.size - PP_STRETCH, 1))
+        window = np.all([in_region[i + k] for k in range(PP_STRETCH)], axis=0) if len(i) else np.zeros(0, dtype=bool)
+        for k in range(PP_STRETCH):
+            stretch[i[window] + k] = True
+        ss[stretch & (ss == '-')] = 'P'
+
+    def chains(self) -> Dict[str, ChainData]:
+        '''Returns the assignment in the form of VisualMap.structure_list.'''
+        columns = {}
+        for chain_id, res_num, letter, code in zip(self.chain_ids, self.res_nums, self.sequence, self.ss):
+            res_nums, res_names, res_strucs = columns.setdefault(chain_id, ([], [], []))
+            res_nums.append(res_num)
+            res_names.append(letter)
+            res_strucs.append(code)
+        return {
+            chain_id: ChainData(chain_id, res_nums, ''.join(res_names), ''.join(res_strucs))
+            for chain_id, (res_nums, res_names, res_strucs) in columns.items()
+        }
+
+
+def assign(model) -> Dict[str, ChainData]:
+    '''
+    Assigns the secondary structure of a parsed Bio.PDB model with the built-in engine.
+
+    Returns:
+        The chains' assignments keyed by chain ID, like VisualMap._get_dssp_output.
+    '''
+    chain_ids, res_nums, sequence, coords = _backbone(model)
+    if not sequence:
+        return {}
+    return BackboneDSSP(chain_ids, res_nums, sequence, coords).chains()
+
+
+def validate(file_paths: List[str], model_index: int = 0) -> List[Dict[str, Any]]:
+    '''
+    Compares the built-in engine with mkdssp on a corpus of structure files.
+
+    Returns:
+        One dictionary per file: its path, the number of residues both engines assigned, the fraction of them with
+        the same code, the per-code counts of disagreements as {"mkdssp code>builtin code": count}, and the seconds
+        each engine took (mkdssp including its process and file round trip, both excluding parsing).
+    '''
+    from src.structure_io import parse_structure
+    from src.visual import assign_model
+
+    if mkdssp_path() is None:
+        raise RuntimeError('Validating the built-in DSSP engine requires mkdssp to be installed')
+    results = []
+    for file_path in file_paths:
+        structure = parse_structure(None, file_path)
+        start = time.perf_counter()
+        reference = assign_model(structure, file_path, model_index, engine='mkdssp')
+        mkdssp_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        builtin = assign(structure[model_index])
+        builtin_seconds = time.perf_counter() - start
+
+        results.append({
+            'path': file_path,
+            **compare_assignments(reference, builtin),
+            'mkdssp_seconds': mkdssp_seconds,
+            'builtin_seconds': builtin_seconds,
+        })
+    return results
+
+
+def compare_assignments(reference: Dict[str, ChainData], assignment: Dict[str, ChainData]) -> Dict[str, Any]:
+    '''
+    Compares an assignment with a reference assignment of the same structure, residue by residue.
+
+    Returns:
+        {"residues", "matches", "agreement", "confusion"}: the number of residues both assigned, how many of them have
+        the same code and which fraction (None without any), and the per-code counts of disagreements as
+        {"reference code>code": count}.
+    '''
+    residues = 0
+    matches = 0
+    confusion = {}
+    for chain_id, chain in reference.items():
+        other = assignment.get(chain_id)
+        if other is None:
+            continue
+        codes = dict(zip(other.res_nums.tolist(), other.ss))
+        for res_num, code in zip(chain.res_nums.tolist(), chain.ss):
+            if res_num not in codes:
+                continue
+            residues += 1
+            if codes[res_num] == code:
+                matches += 1
+            else:
+                pair = f'{code}>{codes[res_num]}'
+                confusion[pair] = confusion.get(pair, 0) + 1
+    return {'residues': residues, 'matches': matches, 'agreement': matches / residues if residues else None,
+            'confusion': confusion}
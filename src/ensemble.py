@@ -0,0 +1,276 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Secondary structure of NMR ensembles and trajectory frames, assigned over a process pool and aggregated into
+per-residue frequencies as the assignments arrive."""
+
+import collections
+import glob
+import logging
+import math
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from src.chains import ChainData
+
+# DSSP codes in the column order of the frequency tables; other codes count as coil ("-")
+SS_CODES = 'HBEGIPTS-'
+
+# Column of every byte value in the frequency tables
+_CODE_COLUMNS = np.full(256, SS_CODES.index('-'), dtype=np.intp)
+_CODE_COLUMNS[np.frombuffer(SS_CODES.encode('ascii'), dtype=np.uint8)] = np.arange(len(SS_CODES))
+
+# Worker processes assigning models or frames at the same time
+ENSEMBLE_WORKERS = os.cpu_count() or 1
+
+# Tasks per worker; each task returns the counts of its models only
+TASKS_PER_WORKER = 4
+
+# The structure file last parsed in this process and its content digests, by path, modification time and size,
+# so that the tasks a worker runs on one multi-model file parse and hash it only once
+_parsed = {}
+_digests = {}
+
+
+class EnsembleSummary:
+    '''
+    Counts, for every residue, how many models (or frames) assign it each secondary structure code.
+    Memory grows with the number of residues only, so ensembles of any size can be added one model at a time.
+
+    The residues of the first model added are the reference; residues of later models are matched to them by chain
+    ID and residue number, and residues missing from the reference are ignored.
+
+    '''
+    def __init__(self) -> None:
+        self.models = 0
+        self._chains = {}
+        self._counts = {}
+
+    def add(self, structure_list: Dict[str, ChainData]) -> None:
+        '''Counts the assignment of one model, as returned by VisualMap._get_dssp_output.'''
+        self.models += 1
+        for chain_id, chain in structure_list.items():
+            columns = _CODE_COLUMNS[np.frombuffer(chain.ss.encode('ascii', 'replace'), dtype=np.uint8)]
+            rows = self._rows(chain)
+            found = rows >= 0
+            np.add.at(self._counts[chain_id], (rows[found], columns[found]), 1)
+
+    def merge(self, other: 'EnsembleSummary') -> None:
+        '''Adds the counts of another summary, e.g. one computed by a worker process.'''
+        self.models += other.models
+        for chain_id, chain in other._chains.items():
+            rows = self._rows(chain)
+            found = rows >= 0
+            np.add.at(self._counts[chain_id], rows[found], other._counts[chain_id][found])
+
+    def _rows(self, chain: ChainData) -> np.ndarray:
+        '''Returns the reference row of each residue of chain, or -1, adding chains not seen before.'''
+        reference = self._chains.get(chain.chain_id)
+        if reference is None:
+            self._chains[chain.chain_id] = ChainData(chain.chain_id, chain.res_nums, chain.sequence, '-' * len(chain))
+            self._counts[chain.chain_id] = np.zeros((len(chain), len(SS_CODES)), dtype=np.uint32)
+            return np.arange(len(chain))
+        if np.array_equal(reference.res_nums, chain.res_nums):
+            return np.arange(len(chain))
+        positions = {int(res_num): row for row, res_num in enumerate(reference.res_nums)}
+        return np.array([positions.get(int(res_num), -1) for res_num in chain.res_nums], dtype=np.intp)
+
+    def frequencies(self, chain_id: str) -> np.ndarray:
+        '''
+        Returns the fraction of models assigning each code to each residue of a chain, as an array of shape
+        (residues, len(SS_CODES)). Residues are normalized by the number of models that contain them.
+
+        '''
+        counts = self._counts[chain_id]
+        totals = counts.sum(axis=1, keepdims=True)
+        return counts / np.maximum(totals, 1)
+
+    def agreement(self, chain_id: str) -> np.ndarray:
+        '''Returns the fraction of models that assign the consensus code to each residue of a chain.'''
+        return self.frequencies(chain_id).max(axis=1)
+
+    def select(self, indices: Dict[str, np.ndarray]) -> 'EnsembleSummary':
+        '''
+        Returns the counts of the given residues only, as the indices of each chain to keep (see src/selection.py).
+
+        '''
+        summary = EnsembleSummary()
+        summary.models = self.models
+        for chain_id, rows in indices.items():
+            summary._chains[chain_id] = self._chains[chain_id].take(rows)
+            summary._counts[chain_id] = self._counts[chain_id][rows]
+        return summary
+
+    def consensus(self) -> Dict[str, ChainData]:
+        '''
+        Returns the most frequent code of every residue, in the form of VisualMap.structure_list. Ties go to the
+        code that comes first in SS_CODES.
+
+        '''
+        codes = np.frombuffer(SS_CODES.encode('ascii'), dtype=np.uint8)
+        consensus = {}
+        for chain_id, chain in self._chains.items():
+            ss = codes[self._counts[chain_id].argmax(axis=1)].tobytes().decode('ascii')
+            consensus[chain_id] = ChainData(chain_id, chain.res_nums, chain.sequence, ss)
+        return consensus
+
+
+def _file_signature(file_path: str) -> Tuple[str, int, int]:
+    stat = os.stat(file_path)
+    return file_path, stat.st_mtime_ns, stat.st_size
+
+
+def _parsed_structure(pdb_name: Optional[str], file_path: str):
+    '''
+    Returns the parsed structure of a file, reusing the last one parsed in this process if the file is unchanged.
+
+    '''
+    from src.structure_io import parse_structure
+
+    signature = _file_signature(file_path)
+    if signature not in _parsed:
+        # Only the file of the current frame is kept parsed
+        _parsed.clear()
+        _parsed[signature] = parse_structure(pdb_name, file_path)
+    return _parsed[signature]
+
+
+def _file_digest(file_path: str) -> str:
+    '''Returns the content digest of a file, computed once per process while the file is unchanged.'''
+    from src.cache import file_digest
+
+    signature = _file_signature(file_path)
+    if signature not in _digests:
+        _digests[signature] = file_digest(file_path)
+    return _digests[signature]
+
+
+def _summarize_task(pdb_name: Optional[str], items: List[Tuple[str, int]], use_cache: bool,
+                    engine: Optional[str] = None) -> EnsembleSummary:
+    '''
+    Assigns a share of the models in a worker process and returns their counts. Each file is parsed and hashed
+    at most once per process (see _parsed_structure), and cached assignments skip parsing altogether.
+
+    '''
+    from src.cache import get_dssp_cache
+    from src.dssp import engine_version, resolve_engine
+    from src.visual import assign_model
+
+    engine = resolve_engine(engine)
+    dssp_cache = get_dssp_cache() if use_cache else None
+    summary = EnsembleSummary()
+    for file_path, model_index in items:
+        key = None
+        structure_list = None
+        if dssp_cache is not None:
+            # A locked or corrupt cache database must not fail the ensemble: the model is assigned uncached instead
+            try:
+                key = dssp_cache.key(file_path, model_index, digest=_file_digest(file_path),
+                                     version=engine_version(engine))
+                structure_list = dssp_cache.get(key)
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"DSSP cache lookup failed, assigning model {model_index} of {file_path} uncached: {e}")
+                key = None
+        if structure_list is None:
+            structure = _parsed_structure(pdb_name, file_path)
+            structure_list = assign_model(structure, file_path, model_index, engine=engine)
+            if key is not None:
+                try:
+                    dssp_cache.put(key, structure_list)
+                except (OSError, sqlite3.Error) as e:
+                    logging.warning(f"DSSP cache write failed: {e}")
+        summary.add(structure_list)
+    return summary
+
+
+def summarize(pdb_name: Optional[str], items: List[Tuple[str, int]], use_cache: bool = True,
+              workers: int = ENSEMBLE_WORKERS, engine: Optional[str] = None) -> EnsembleSummary:
+    '''
+    Assigns the secondary structure of many models over a process pool and aggregates it into one summary.
+
+    The models are divided into contiguous tasks of at most TASKS_PER_WORKER per worker. Only a few tasks are
+    submitted ahead of the one being merged, and each returns counts rather than assignments, so memory does not
+    grow with the number of models. Tasks are merged in order, which keeps the reference residues deterministic.
+
+    Args:
+        pdb_name (str): The PDB code, passed to the parser.
+        items (list): (file path, model index) of every model, in order.
+        use_cache (bool): Whether to reuse and store the assignment of each model in the DSSP cache.
+        workers (int): The number of worker processes; 1 assigns every model in this process.
+        engine (str): The DSSP engine, see src/dssp.py.
+
+    Raises:
+        ValueError: If there are no models
+    '''
+    if not items:
+        raise ValueError('The ensemble has no models')
+    workers = max(1, min(workers, len(items)))
+    if workers == 1:
+        try:
+            return _summarize_task(pdb_name, items, use_cache, engine)
+        finally:
+            # Worker processes end with the pool; this one lives on, so it does not keep the last file parsed
+            _parsed.clear()
+
+    size = math.ceil(len(items) / (workers * TASKS_PER_WORKER))
+    tasks = iter([items[start:start + size] for start in range(0, len(items), size)])
+    summary = EnsembleSummary()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(executor.submit(_summarize_task, pdb_name, task, use_cache, engine))
+            if len(pending) >= workers * 2:
+                summary.merge(pending.popleft().result())
+        while pending:
+            summary.merge(pending.popleft().result())
+    return summary
+
+
+def model_items(pdb_name: Optional[str], file_path: str) -> List[Tuple[str, int]]:
+    '''
+    Returns the (file path, model index) items of every model in a structure file, e.g. an NMR ensemble.
+    The models are counted without parsing the file, see count_models.
+
+    '''
+    from src.structure_io import count_models
+
+    return [(file_path, model_index) for model_index in range(count_models(pdb_name, file_path))]
+
+
+def frame_items(frames: Iterable[str]) -> List[Tuple[str, int]]:
+    '''
+    Returns the (file path, model index) items of a series of frame files, the first model of each.
+    Glob patterns are expanded in sorted order.
+
+    Raises:
+        ValueError: If a frame file or pattern matches nothing
+    '''
+    paths = []
+    for frame in frames:
+        if glob.has_magic(frame):
+            matches = sorted(glob.glob(frame))
+            if not matches:
+                raise ValueError(f'No frames match {frame}')
+            paths.extend(matches)
+        elif os.path.isfile(frame):
+            paths.append(frame)
+        else:
+            raise ValueError(f'Frame file not found: {frame}')
+    return [(path, 0) for path in paths]
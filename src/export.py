@@ -0,0 +1,207 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Data-only export of the secondary structure assignment: residues, segments and UniProt IDs of every chain, as
+JSON, CSV, NumPy (.npz) or Parquet files, or as one JSON line per structure for streams of many structures."""
+
+import csv
+import json
+import os
+from typing import Optional, Dict, Any, IO, List
+
+import numpy as np
+
+from src.chains import ChainData
+from src.segments import ANNOTATED_TYPES, Segment
+
+# Export formats, and the format of each file extension
+EXPORT_FORMATS = ('json', 'csv', 'npz', 'parquet', 'ndjson')
+EXPORT_EXTENSIONS = {'.json': 'json', '.csv': 'csv', '.npz': 'npz', '.parquet': 'parquet', '.ndjson': 'ndjson',
+                     '.jsonl': 'ndjson'}
+
+# Columns of the per-residue tables (CSV, Parquet); agreement is only filled for ensembles
+RESIDUE_COLUMNS = ('chain_id', 'uniprot_id', 'res_num', 'res_name', 'ss', 'segment', 'agreement')
+
+
+def resolve_format(path: str, export_format: Optional[str] = None) -> str:
+    '''
+    Returns the export format given, or the one of the path's extension.
+
+    Raises:
+        ValueError: If the format is unknown or cannot be told from the path
+    '''
+    if export_format is None:
+        export_format = EXPORT_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if export_format is None:
+            raise ValueError(f"Cannot tell the export format of {path}, use one of: {', '.join(EXPORT_EXTENSIONS)}")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {export_format}, use one of: {', '.join(EXPORT_FORMATS)}")
+    return export_format
+
+
+def segment_label(segment: Segment) -> str:
+    '''Returns the annotation of a segment within its chain, e.g. "H3", or "" for types that are not annotated.'''
+    return f'{segment.ss}{segment.ordinal}' if segment.ss in ANNOTATED_TYPES else ''
+
+
+def chain_record(chain: ChainData, segments: List[Segment], uniprot_id: Optional[str] = None,
+                 agreement: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    '''
+    Returns the JSON-serializable assignment of one chain.
+
+    Args:
+        chain (ChainData): The chain.
+        segments (list): The chain's segments, see src/segments.py.
+        uniprot_id (str): The UniProt accession of the chain, if known.
+        agreement (ndarray): For ensembles, the fraction of models agreeing with each residue's consensus code.
+
+    Returns:
+        {"chain_id", "uniprot_id", "length", "res_nums", "sequence", "ss", "segments", "agreement"}, where segments
+        are {"ss", "label", "start", "end", "first_res", "last_res"} with start and end as residue indices.
+    '''
+    return {
+        'chain_id': chain.chain_id,
+        'uniprot_id': uniprot_id,
+        'length': len(chain),
+        'res_nums': chain.res_nums.tolist(),
+        'sequence': chain.sequence,
+        'ss': chain.ss,
+        'segments': [{'ss': segment.ss, 'label': segment_label(segment), 'start': segment.start, 'end': segment.end,
+                      'first_res': int(chain.res_nums[segment.start]), 'last_res': int(chain.res_nums[segment.end - 1])}
+                     for segment in segments],
+        'agreement': None if agreement is None else np.round(agreement, 4).tolist(),
+    }
+
+
+def residue_rows(record: Dict[str, Any]) -> Dict[str, List[Any]]:
+    '''
+    Returns the per-residue columns (RESIDUE_COLUMNS) of an exported structure, see VisualMap.export_data.
+
+    '''
+    columns = {name: [] for name in RESIDUE_COLUMNS}
+    for chain in record['chains']:
+        length = chain['length']
+        labels = [''] * length
+        for segment in chain['segments']:
+            labels[segment['start']:segment['end']] = [segment['label']] * (segment['end'] - segment['start'])
+        columns['chain_id'].extend([chain['chain_id']] * length)
+        columns['uniprot_id'].extend([chain['uniprot_id']] * length)
+        columns['res_num'].extend(chain['res_nums'])
+        columns['res_name'].extend(chain['sequence'])
+        columns['ss'].extend(chain['ss'])
+        columns['segment'].extend(labels)
+        columns['agreement'].extend(chain['agreement'] if chain['agreement'] is not None else [None] * length)
+    return columns
+
+
+def write_ndjson_line(record: Dict[str, Any], f: IO[str]) -> None:
+    '''Appends an exported structure to an open NDJSON stream as one line.'''
+    f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+def _write_csv(record: Dict[str, Any], path: str) -> None:
+    columns = residue_rows(record)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(RESIDUE_COLUMNS)
+        writer.writerows(zip(*(columns[name] for name in RESIDUE_COLUMNS)))
+
+
+def _write_npz(record: Dict[str, Any], path: str) -> None:
+    '''
+    Writes the columns as compressed NumPy arrays, readable with numpy.load without pickle: one row per residue
+    (chain, res_num, res_name, ss, segment as an index into the segment arrays, agreement), one per segment
+    (segment_chain, segment_ss, segment_label, segment_start, segment_end) and one per chain (chain_id, uniprot_id),
+    and the remaining fields as a JSON string in "meta".
+
+    '''
+    chains = record['chains']
+    segments = [(chain['chain_id'], segment) for chain in chains for segment in chain['segments']]
+    residue_segment = np.empty(sum(chain['length'] for chain in chains), dtype=np.int32)
+    offset = 0
+    index = 0
+    for chain in chains:
+        for segment in chain['segments']:
+            residue_segment[offset + segment['start']:offset + segment['end']] = index
+            index += 1
+        offset += chain['length']
+    has_agreement = any(chain['agreement'] is not None for chain in chains)
+    with open(path, 'wb') as f:
+        np.savez_compressed(
+            f,
+            chain=np.array([chain['chain_id'] for chain in chains for _ in range(chain['length'])], dtype=str),
+            res_num=np.array([res_num for chain in chains for res_num in chain['res_nums']], dtype=np.int32),
+            res_name=np.frombuffer(''.join(chain['sequence'] for chain in chains).encode('ascii', 'replace'), dtype='S1'),
+            ss=np.frombuffer(''.join(chain['ss'] for chain in chains).encode('ascii', 'replace'), dtype='S1'),
+            segment=residue_segment,
+            agreement=np.array([value for chain in chains for value in (chain['agreement'] or [np.nan] * chain['length'])]
+                               if has_agreement else [], dtype=np.float32),
+            segment_chain=np.array([chain_id for chain_id, _ in segments], dtype=str),
+            segment_ss=np.array([segment['ss'] for _, segment in segments], dtype=str),
+            segment_label=np.array([segment['label'] for _, segment in segments], dtype=str),
+            segment_start=np.array([segment['start'] for _, segment in segments], dtype=np.int32),
+            segment_end=np.array([segment['end'] for _, segment in segments], dtype=np.int32),
+            chain_id=np.array([chain['chain_id'] for chain in chains], dtype=str),
+            uniprot_id=np.array([chain['uniprot_id'] or '' for chain in chains], dtype=str),
+            meta=np.array(json.dumps({key: value for key, value in record.items() if key != 'chains'})),
+        )
+
+
+def _write_parquet(record: Dict[str, Any], path: str) -> None:
+    '''Writes the per-residue columns as a Parquet table, with the remaining fields as JSON in its metadata.'''
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception('Parquet export requires pyarrow (pip install pyarrow), or use the npz format')
+
+    columns = residue_rows(record)
+    table = pyarrow.table({name: columns[name] for name in RESIDUE_COLUMNS})
+    meta = json.dumps({key: value for key, value in record.items() if key != 'chains'})
+    table = table.replace_schema_metadata({'pros2vi': meta})
+    pyarrow.parquet.write_table(table, path)
+
+
+def write_export(record: Dict[str, Any], path: str, export_format: Optional[str] = None) -> str:
+    '''
+    Writes an exported structure (see VisualMap.export_data) to a file.
+
+    Args:
+        record (dict): The exported structure.
+        path (str): The output file.
+        export_format (str): One of EXPORT_FORMATS, the default is told from the path's extension.
+
+    Returns:
+        The path written.
+
+    Raises:
+        ValueError: If the format is unknown
+        Exception: If the format is parquet and pyarrow is not installed
+    '''
+    export_format = resolve_format(path, export_format)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if export_format == 'json':
+        with open(path, 'w') as f:
+            json.dump(record, f, separators=(',', ':'))
+    elif export_format == 'ndjson':
+        with open(path, 'w') as f:
+            write_ndjson_line(record, f)
+    elif export_format == 'csv':
+        _write_csv(record, path)
+    elif export_format == 'npz':
+        _write_npz(record, path)
+    else:
+        _write_parquet(record, path)
+    return path
@@ -0,0 +1,402 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""A bounded queue of render jobs for the web interface, each job running in its own worker process."""
+
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import threading
+import time
+import traceback
+import uuid
+from typing import Optional, Dict, Any, Callable, List
+
+from src import metrics
+from src import renderer
+
+# Jobs rendering at the same time, one process each
+MAX_WORKERS = int(os.environ.get('PROS2VI_MAX_WORKERS', str(os.cpu_count() or 1)))
+
+# Jobs waiting for a worker; further submissions are rejected until the queue drains
+QUEUE_DEPTH = int(os.environ.get('PROS2VI_QUEUE_DEPTH', '32'))
+
+# Seconds a job may run before its process is terminated
+JOB_TIMEOUT = float(os.environ.get('PROS2VI_JOB_TIMEOUT', '600'))
+
+# Seconds a terminated job process is given to exit before it is killed
+TERMINATE_GRACE = 5
+
+# Seconds finished jobs are remembered for the status and result pages
+JOB_RETENTION = float(os.environ.get('PROS2VI_JOB_RETENTION', str(3600)))
+
+# Job states
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# Metrics of the job queue, exposed by the /metrics endpoint of the web interface
+JOB_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    'pros2vi_job_seconds', 'Time render jobs spent running, by final status.', ('status',)))
+JOB_WAIT_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    'pros2vi_job_wait_seconds', 'Time render jobs waited in the queue for a worker.'))
+metrics.REGISTRY.register(metrics.Gauge(
+    'pros2vi_queue_depth', 'Render jobs waiting for a worker.',
+    function=lambda: _job_queue.depth() if _job_queue is not None else 0))
+metrics.REGISTRY.register(metrics.Gauge(
+    'pros2vi_jobs_running', 'Render jobs currently running.',
+    function=lambda: len(_job_queue.running()) if _job_queue is not None else 0))
+
+
+class QueueFullError(Exception):
+    '''Raised when a job is submitted while the queue is at its maximum depth.'''
+
+
+class Job:
+    '''
+    One submitted job and its state.
+
+    Attributes:
+        id (str): The job ID.
+        status (str): "queued", "running", "done" or "failed".
+        result: The return value of the job function once done.
+        error (str): The error message once failed.
+        error_type (str): The name of the exception class once failed, e.g. "DecompressionBombError" or "TimeoutError".
+    '''
+    def __init__(self, job_id: str, function: Optional[Callable], args: tuple,
+                 on_finished: Optional[Callable[['Job'], None]] = None) -> None:
+        self.id = job_id
+        self.function = function
+        self.args = args
+        self.on_finished = on_finished
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.error_type = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        '''Returns the job state as a JSON-serializable dictionary.'''
+        return {
+            'id': self.id,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'error_type': self.error_type,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+def _run_job(connection, function: Callable, args: tuple, renderer_slots=None, held_slots=None) -> None:
+    '''
+    Runs a job function in the worker process and sends back its result or error. The process leads its own
+    process group, so that the renderer processes it starts are terminated with it.
+
+    '''
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    if renderer_slots is not None:
+        renderer.set_slots(renderer_slots, held_slots)
+    try:
+        result = function(*args)
+    except BaseException as e:
+        logging.debug(traceback.format_exc())
+        connection.send(('error', type(e).__name__, str(e)))
+    else:
+        connection.send(('ok', result, None))
+    finally:
+        connection.close()
+
+
+class JobQueue:
+    '''
+    Runs submitted jobs on a fixed number of worker threads, each starting one process per job, so renders use
+    all cores while the web server keeps serving requests. A job that exceeds the timeout has its process, and
+    the renderer processes it started, terminated. Job functions and their arguments must be picklable and return a picklable result.
+
+    '''
+    def __init__(self, max_workers: int = MAX_WORKERS, queue_depth: int = QUEUE_DEPTH, timeout: float = JOB_TIMEOUT,
+                 retention: float = JOB_RETENTION) -> None:
+        '''
+
+        Args:
+            max_workers (int): The number of jobs running at the same time.
+            queue_depth (int): The number of jobs that may wait for a worker.
+            timeout (float): Seconds a job may run.
+            retention (float): Seconds a finished job is kept.
+
+        Raises:
+            ValueError: If max_workers or queue_depth is not positive
+        '''
+        if max_workers <= 0 or queue_depth <= 0:
+            raise ValueError('The max_workers and queue_depth parameters must be positive')
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retention = retention
+        self._pending = queue.Queue(maxsize=queue_depth)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        # Worker processes are spawned, not forked, as the web server process runs threads
+        self._context = multiprocessing.get_context('spawn')
+        # Renderer processes are capped across all jobs, not per job
+        self._renderer_slots = renderer.shared_slots(self._context)
+        self._workers = [
+            threading.Thread(target=self._work, name=f'pros2vi-job-{index}', daemon=True) for index in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, function: Callable, *args, job_id: Optional[str] = None,
+               on_finished: Optional[Callable[[Job], None]] = None) -> Job:
+        '''
+        Queues function(*args) to run in a worker process.
+
+        Args:
+            function: A module-level function.
+            job_id (str): The job ID, a new random ID by default.
+            on_finished: Called with the job in this process once it is done or failed, e.g. to record the metrics
+                its worker process collected.
+
+        Returns:
+            The queued Job.
+
+        Raises:
+            QueueFullError: If the queue is full
+        '''
+        job = Job(job_id or uuid.uuid4().hex, function, args, on_finished)
+        with self._lock:
+            self._prune()
+            try:
+                self._pending.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError(f'The job queue is full ({self._pending.maxsize} jobs waiting)')
+            self._jobs[job.id] = job
+        return job
+
+    def complete(self, result: Any, job_id: Optional[str] = None) -> Job:
+        '''
+        Records a job whose result is already known, e.g. served from a cache, without running anything.
+
+        '''
+        job = Job(job_id or uuid.uuid4().hex, None, ())
+        job.status, job.result = DONE, result
+        job.started = job.finished = job.submitted
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        '''Returns the job with the given ID, or None if it is unknown or expired.'''
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self) -> int:
+        '''Returns the number of jobs waiting for a worker.'''
+        return self._pending.qsize()
+
+    def running(self) -> List[Job]:
+        '''Returns the jobs currently running.'''
+        with self._lock:
+            return [job for job in self._jobs.values() if job.status == RUNNING]
+
+    def _prune(self) -> None:
+        expired = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished < expired]:
+            del self._jobs[job_id]
+
+    def _work(self) -> None:
+        while True:
+            job = self._pending.get()
+            job.status = RUNNING
+            job.started = time.time()
+            JOB_WAIT_SECONDS.observe(job.started - job.submitted)
+            try:
+                self._run(job)
+            except Exception as e:
+                job.status, job.error, job.error_type = FAILED, str(e), type(e).__name__
+            job.finished = time.time()
+            JOB_SECONDS.observe(job.finished - job.started, status=job.status)
+            if job.on_finished is not None:
+                try:
+                    job.on_finished(job)
+                except Exception as e:
+                    logging.warning(f"The on_finished callback of job {job.id} failed: {e}")
+            # The function, arguments and callback are no longer needed
+            job.function = job.args = job.on_finished = None
+
+    def _run(self, job: Job) -> None:
+        receiver, sender = self._context.Pipe(duplex=False)
+        # The renderer slots the job holds, given back here if it dies or is terminated while rendering
+        held_slots = self._context.RawValue('i', 0)
+        process = self._context.Process(target=_run_job, args=(sender, job.function, job.args, self._renderer_slots,
+                                                               held_slots))
+        process.start()
+        sender.close()
+        try:
+            if not receiver.poll(self.timeout):
+                _terminate(process)
+                job.status, job.error, job.error_type = FAILED, f'The job timed out after {self.timeout:g} seconds', 'TimeoutError'
+                return
+            try:
+                outcome, value, message = receiver.recv()
+            except EOFError:
+                job.status, job.error, job.error_type = FAILED, 'The worker process exited unexpectedly', 'WorkerError'
+                return
+        finally:
+            receiver.close()
+            process.join()
+            released = renderer.release_held(self._renderer_slots, held_slots)
+            if released:
+                logging.warning(f'Job {job.id} ended holding {released} renderer slot(s), released them')
+
+        if outcome == 'ok':
+            job.status, job.result = DONE, value
+        else:
+            job.status, job.error, job.error_type = FAILED, message, value
+
+
+def _terminate(process) -> None:
+    '''Terminates a job process and the renderer processes it started, then kills it if it does not exit.'''
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        # Not on POSIX, or the process has not made its own group yet
+        process.terminate()
+    process.join(TERMINATE_GRACE)
+    if process.is_alive():
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            process.kill()
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    '''
+    Returns the process-wide job queue, configured from the environment.
+
+    '''
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
+
+
+def download_structure(pdb_name: str, download_dir: str) -> str:
+    '''
+    Downloads the mmCIF file of a PDB entry into download_dir, unless it is already there.
+
+    Returns:
+        The file path.
+
+    Raises:
+        FileNotFoundError: If the download failed
+    '''
+    from Bio.PDB import PDBList
+
+    file_path = os.path.join(download_dir, f'{pdb_name.lower()}.cif')
+    if not os.path.isfile(file_path):
+        os.makedirs(download_dir, exist_ok=True)
+        PDBList(server='https://files.wwpdb.org', verbose=False).retrieve_pdb_file(
+            pdb_name, pdir=download_dir, file_format='mmCif'
+        )
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f'Download of {pdb_name} failed')
+    return file_path
+
+
+def render_job(options: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Renders one web interface submission into the artifact store, unless its artifact already exists;
+    runs in a job worker process.
+
+    Args:
+        options (dict): file_path (None to download pdb_name), pdb_name, title, subtitle, scientific_name, colors,
+            residues_per_line, dpi, selection (chains and residue ranges, see src/selection.py), output_image (with a
+            .png or .jpg extension), pdf, artifact_key, artifact_dir, download_dir and session_dir (a session folder
+            of src/sessions.py whose state is reused and updated, or None).
+
+    Returns:
+        The artifact key, the file names within the artifact folder and the names to download them as:
+        {"key": "...", "image": "image.png", "pdf": "visual.pdf", "image_name": "1fat.png", "pdf_name": "1fat.pdf"},
+        the PDF entries being None unless requested, and under "spans" the timed pipeline stages of the render
+        (see src/metrics.py), for the web server to record.
+    '''
+    from src.artifacts import ArtifactStore
+    from src.sessions import load_state, save_state
+    from src.visual import VisualMap
+
+    store = ArtifactStore(options['artifact_dir'])
+    key = options['artifact_key']
+    output_image = options['output_image']
+    with metrics.collect() as spans:
+        manifest = store.get(key)
+        if manifest is None:
+            file_path = options['file_path']
+            if file_path is None:
+                with metrics.span('download'):
+                    file_path = download_structure(options['pdb_name'], options['download_dir'])
+            session_dir = options.get('session_dir')
+            state = None
+            if session_dir is not None:
+                with metrics.span('session', cache='session') as labels:
+                    state = load_state(session_dir)
+                    labels['hit'] = state is not None
+            vs = VisualMap(pdb_name=options['title'] or options['pdb_name'], file_path=file_path,
+                           subtitle=options['subtitle'], scientific_name=options['scientific_name'], colors=options['colors'],
+                           state=state, selection=options.get('selection'))
+
+            manifest = {'image': f'image{os.path.splitext(output_image)[1].lower()}', 'pdf': None}
+            outputs = [{'path': manifest['image'], 'dpi': options['dpi'], 'residues_per_line': options['residues_per_line']}]
+            if options['pdf']:
+                manifest['pdf'] = 'visual.pdf'
+                outputs.append({'path': manifest['pdf'], 'dpi': options['dpi'], 'residues_per_line': options['residues_per_line']})
+
+            staging_dir = store.staging_dir()
+            try:
+                for output in outputs:
+                    output['path'] = os.path.join(staging_dir, output['path'])
+                vs.render_plan(outputs)
+            except BaseException:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                raise
+            manifest = store.commit(key, staging_dir, manifest)
+            if session_dir is not None:
+                save_state(session_dir, vs.session_state())
+
+    return {**artifact_result(key, manifest, output_image), 'spans': spans}
+
+
+def artifact_result(key: str, manifest: Dict[str, Any], output_image: str) -> Dict[str, Any]:
+    '''
+    Returns the result of a render job from its stored artifact, see render_job.
+
+    '''
+    return {
+        'key': key,
+        'image': manifest['image'],
+        'pdf': manifest['pdf'],
+        'image_name': output_image,
+        'pdf_name': f'{os.path.splitext(output_image)[0]}.pdf' if manifest['pdf'] else None,
+    }
@@ -0,0 +1,343 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Entry metadata from the PDBe and RCSB APIs, with pooled connections, a persistent cache and an offline mode."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional, Dict, Any, Iterable, List
+
+from src import metrics
+from src.cache import CACHE_DIR, SQLiteStore
+
+# API base URLs, overridable to point at a mirror or a local stub server
+PDBE_API_URL = os.environ.get('PROS2VI_PDBE_API_URL', 'https://www.ebi.ac.uk/pdbe/api')
+RCSB_API_URL = os.environ.get('PROS2VI_RCSB_API_URL', 'https://data.rcsb.org')
+
+# API timeout for network requests (seconds)
+API_TIMEOUT = 10
+
+# Total time allowed for all metadata lookups of one entry, which run concurrently (seconds)
+METADATA_DEADLINE = float(os.environ.get('PROS2VI_METADATA_DEADLINE', str(API_TIMEOUT)))
+
+# Threads running metadata lookups in the background
+METADATA_WORKERS = 8
+
+# Source organisms of every polymer entity of an entry, in a single RCSB GraphQL request
+POLYMER_ENTITIES_QUERY = (
+    'query($id: String!) { entry(entry_id: $id) { polymer_entities { '
+    'rcsb_polymer_entity_container_identifiers { entity_id } '
+    'rcsb_entity_source_organism { scientific_name } } } }'
+)
+
+# How long responses are reused before being fetched again (seconds); missing entries are retried sooner
+METADATA_TTL = int(os.environ.get('PROS2VI_METADATA_TTL', str(7 * 24 * 3600)))
+METADATA_NEGATIVE_TTL = int(os.environ.get('PROS2VI_METADATA_NEGATIVE_TTL', str(24 * 3600)))
+
+# Size limit of the metadata cache in bytes (compressed responses)
+METADATA_CACHE_MAX_BYTES = int(os.environ.get('PROS2VI_METADATA_CACHE_MB', '64')) * 1024 * 1024
+
+# Serve metadata from the cache only, never from the network
+OFFLINE = os.environ.get('PROS2VI_OFFLINE', '') not in ('', '0', 'false', 'False')
+
+# Connections kept open per host by each pooled session
+POOL_SIZE = 10
+
+
+class MetadataClient:
+    '''
+    Fetches the JSON documents behind the UniProt mapping, the RCSB entry and its polymer entities.
+
+    Responses (including "not found" results) are cached on disk with a time to live, and connections are
+    reused through one pooled requests.Session per thread. In offline mode only the cache is consulted.
+
+    '''
+    def __init__(self, cache_dir: Optional[str] = CACHE_DIR, offline: bool = OFFLINE, pdbe_url: str = PDBE_API_URL,
+                 rcsb_url: str = RCSB_API_URL, timeout: float = API_TIMEOUT, ttl: float = METADATA_TTL,
+                 negative_ttl: float = METADATA_NEGATIVE_TTL) -> None:
+        '''
+
+        Args:
+            cache_dir (str): Directory of the metadata cache, or None to disable caching.
+            offline (bool): If True, never access the network and serve cached responses only (even expired ones).
+            pdbe_url (str): Base URL of the PDBe API.
+            rcsb_url (str): Base URL of the RCSB data API.
+            timeout (float): Timeout of each request in seconds.
+            ttl (float): Seconds a successful response is reused.
+            negative_ttl (float): Seconds a "not found" response is reused.
+
+        '''
+        self.offline = offline
+        self.pdbe_url = pdbe_url.rstrip('/')
+        self.rcsb_url = rcsb_url.rstrip('/')
+        self.timeout = timeout
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.store = None
+        if cache_dir is not None:
+            try:
+                self.store = SQLiteStore(os.path.join(cache_dir, 'metadata.sqlite'), METADATA_CACHE_MAX_BYTES)
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"Metadata cache disabled, {cache_dir} is not usable: {e}")
+        self._local = threading.local()
+
+    @property
+    def session(self) -> 'requests.Session':
+        '''The pooled session of the calling thread.'''
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._local.session = session
+        return session
+
+    def get_json(self, url: str, description: str, timeout: Optional[float] = None,
+                 json_body: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        '''
+        Returns the JSON document at url, from the cache when it is fresh enough, or None if it is unavailable.
+
+        Args:
+            url (str): The URL to fetch.
+            description (str): What is being fetched, for log messages (e.g. "UniProt data").
+            timeout (float): Overrides the request timeout in seconds.
+            json_body (dict): If given, the document is requested with a POST of this JSON body (e.g. a GraphQL query).
+
+        '''
+        with metrics.span('metadata', call=description) as span:
+            key = url if json_body is None else f"{url} {json.dumps(json_body, sort_keys=True)}"
+            cached = self._cache_get(key)
+            if self.store is not None:
+                span.update(cache='metadata', hit=cached is not None and (self.offline or cached['expires'] > time.time()))
+            if span.get('hit'):
+                return cached['data']
+            if self.offline:
+                logging.warning(f"Offline mode, no cached {description} for {url}")
+                return None
+
+            import requests
+
+            try:
+                if json_body is None:
+                    response = self.session.get(url, timeout=self.timeout if timeout is None else timeout)
+                else:
+                    response = self.session.post(url, json=json_body, timeout=self.timeout if timeout is None else timeout)
+                data = response.json() if response.status_code == 200 else None
+            except (requests.RequestException, ValueError) as e:
+                # A failed request, or a response that is not JSON (e.g. the HTML page of an outage)
+                logging.warning(f"Request failed for {description}: {e}")
+                # Serve an expired copy rather than nothing; transient failures are not cached
+                return cached['data'] if cached is not None else None
+
+            if response.status_code == 200:
+                self._cache_put(key, data, self.ttl)
+                return data
+            logging.warning(f"Unable to fetch {description} (status code: {response.status_code})")
+            if response.status_code in (400, 404, 410):
+                # The entry does not exist (or has no such data): remember the negative result
+                self._cache_put(key, None, self.negative_ttl)
+                return None
+            return cached['data'] if cached is not None else None
+
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.store is None:
+            return None
+        try:
+            value = self.store.get(key)
+        except sqlite3.Error as e:
+            logging.warning(f"Metadata cache read failed: {e}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def _cache_put(self, key: str, data: Optional[Dict[str, Any]], ttl: float) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.put(key, json.dumps({'expires': time.time() + ttl, 'data': data}).encode('utf-8'))
+        except sqlite3.Error as e:
+            logging.warning(f"Metadata cache write failed: {e}")
+
+    def uniprot_mapping(self, identifier: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Fetch UniProt mapping data from PDBe API."""
+        if not identifier:
+            return None
+        return self.get_json(f"{self.pdbe_url}/mappings/uniprot/{identifier.lower()}", "UniProt data", timeout)
+
+    def rcsb_entry(self, identifier: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Fetch entry data from RCSB PDB API."""
+        if not identifier:
+            return None
+        return self.get_json(f"{self.rcsb_url}/rest/v1/core/entry/{identifier.upper()}", "RCSB entry data", timeout)
+
+    def polymer_entity(self, identifier: str, entity_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Fetch polymer entity data from RCSB PDB API."""
+        if not identifier:
+            return None
+        return self.get_json(f"{self.rcsb_url}/rest/v1/core/polymer_entity/{identifier.upper()}/{entity_id}",
+                             "polymer entity data", timeout)
+
+    def polymer_entity_organisms(self, identifier: str, timeout: Optional[float] = None) -> Optional[Dict[str, List[str]]]:
+        '''
+        Fetch the source organisms of all polymer entities of an entry in one RCSB GraphQL request.
+
+        Returns:
+            A dictionary of entity ID to the scientific names of its source organisms, or None if unavailable.
+            Example: {"1": ["Homo sapiens"], "2": []}
+        '''
+        if not identifier:
+            return None
+        data = self.get_json(f"{self.rcsb_url}/graphql", "polymer entity data", timeout,
+                             json_body={'query': POLYMER_ENTITIES_QUERY, 'variables': {'id': identifier.upper()}})
+        if not data:
+            return None
+        entry = (data.get('data') or {}).get('entry') or {}
+        organisms = {}
+        for entity in entry.get('polymer_entities') or []:
+            entity_id = (entity.get('rcsb_polymer_entity_container_identifiers') or {}).get('entity_id')
+            if entity_id is None:
+                continue
+            organisms[str(entity_id)] = [
+                source.get('scientific_name') for source in entity.get('rcsb_entity_source_organism') or []
+                if source.get('scientific_name')
+            ]
+        return organisms
+
+    def fetch_async(self, identifier: Optional[str], deadline: float = METADATA_DEADLINE,
+                    lookups: Optional[Iterable[str]] = None) -> 'EntryMetadata':
+        '''
+        Starts the UniProt mapping, RCSB entry and polymer entity lookups of an entry concurrently in the background.
+
+        Args:
+            identifier (str): The PDB code; nothing is fetched if it is empty.
+            deadline (float): Seconds from now by which all lookups must have finished.
+            lookups (list): The lookups to start (see EntryMetadata.LOOKUPS), the default is all of them.
+
+        '''
+        return EntryMetadata(self, identifier, deadline, lookups=lookups)
+
+    def clear(self) -> None:
+        '''Removes every cached response.'''
+        if self.store is not None:
+            self.store.clear()
+
+
+class EntryMetadata:
+    '''
+    The metadata lookups of one entry, running concurrently in a shared thread pool, each within the deadline from its start.
+    Results that are not ready by the deadline are treated as unavailable.
+
+    '''
+    # The lookups of every entry
+    LOOKUPS = ('uniprot', 'entry', 'organisms')
+
+    def __init__(self, client: Optional[MetadataClient], identifier: Optional[str], deadline: float,
+                 results: Optional[Dict[str, Any]] = None, lookups: Optional[Iterable[str]] = None) -> None:
+        '''
+
+        Args:
+            client (MetadataClient): The client running the lookups.
+            identifier (str): The PDB code; nothing is fetched if it is empty.
+            deadline (float): Seconds from now by which all lookups must have finished.
+            results (dict): Results already known for identifier, e.g. from results() of an earlier request;
+                nothing is fetched and client may be None.
+            lookups (list): The lookups started now, the default is all LOOKUPS; the others start when their result
+                is first asked for.
+
+        '''
+        self.identifier = identifier
+        self._client = client
+        self._timeout = deadline
+        self._deadlines = {}
+        self._futures = {}
+        if results is not None:
+            for name, value in results.items():
+                self._futures[name] = Future()
+                self._futures[name].set_result(value)
+        elif identifier:
+            for name in (self.LOOKUPS if lookups is None else lookups):
+                self._start(name)
+
+    def _start(self, name: str) -> None:
+        '''Private method that starts one lookup, which must finish within the deadline from now.'''
+        fetch = {
+            'uniprot': self._client.uniprot_mapping,
+            'entry': self._client.rcsb_entry,
+            'organisms': self._client.polymer_entity_organisms,
+        }[name]
+        self._deadlines[name] = time.monotonic() + self._timeout
+        self._futures[name] = _get_executor().submit(fetch, self.identifier, self._timeout)
+
+    def matches(self, identifier: Optional[str]) -> bool:
+        '''Whether these lookups are for the given PDB code.'''
+        return bool(identifier) and bool(self.identifier) and identifier.lower() == self.identifier.lower()
+
+    def result(self, name: str) -> Any:
+        '''
+        Returns the result of one lookup ("uniprot", "entry" or "organisms"), waiting at most until the deadline.
+        A lookup that was not started yet starts now.
+
+        '''
+        if name not in self._futures and self._client is not None and self.identifier:
+            self._start(name)
+        future = self._futures.get(name)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=max(0.0, self._deadlines.get(name, 0.0) - time.monotonic()))
+        except FutureTimeoutError:
+            logging.warning(f"Metadata lookup '{name}' for {self.identifier} missed the deadline")
+            return None
+        except Exception as e:
+            # Metadata is optional, a failed lookup must not fail the render
+            logging.warning(f"Metadata lookup '{name}' for {self.identifier} failed: {e}")
+            return None
+
+    def results(self) -> Dict[str, Any]:
+        '''Returns the results of the lookups that have finished, without waiting.'''
+        return {name: future.result() for name, future in self._futures.items()
+                if future.done() and future.exception() is None}
+
+
+_executor = None
+_metadata_client = None
+_metadata_client_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _metadata_client_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=METADATA_WORKERS, thread_name_prefix='pros2vi-metadata')
+        return _executor
+
+
+def get_metadata_client() -> MetadataClient:
+    '''
+    Returns the process-wide metadata client, configured from the environment.
+
+    '''
+    global _metadata_client
+    with _metadata_client_lock:
+        if _metadata_client is None:
+            _metadata_client = MetadataClient()
+        return _metadata_client
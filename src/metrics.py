@@ -0,0 +1,293 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Timing spans of the pipeline stages, structured timing logs, and counters and histograms in the Prometheus text
+format."""
+
+import abc
+import bisect
+import contextlib
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Logger of one JSON line per finished span, e.g. {"stage": "dssp", "seconds": 0.41, "engine": "builtin"}
+TIMING_LOGGER = logging.getLogger('pros2vi.timing')
+
+# Write the timing log to standard error (see enable_timing_log)
+TIMING_LOG = os.environ.get('PROS2VI_TIMING_LOG', '') not in ('', '0', 'false', 'False')
+
+# Upper bounds of the latency histogram buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(abc.ABC):
+    '''A metric family with a fixed set of label names.'''
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f'{self.name} takes the labels {", ".join(self.label_names) or "(none)"}')
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    @abc.abstractmethod
+    def lines(self) -> List[str]:
+        '''Returns the sample lines of this metric in the text exposition format.'''
+
+
+class Counter(_Metric):
+    '''A value that only goes up, per combination of labels.'''
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}' for key, value in values]
+
+
+class Gauge(_Metric):
+    '''A value that goes up and down, either set explicitly or read from a function when the metrics are collected.'''
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, function: Optional[Callable[[], float]] = None) -> None:
+        super().__init__(name, documentation)
+        self._function = function
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def lines(self) -> List[str]:
+        value = self._function() if self._function is not None else self._value
+        return [f'{self.name} {_format_value(value)}']
+
+
+class Histogram(_Metric):
+    '''Observations counted into cumulative buckets, with their sum and count, per combination of labels.'''
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (the last one above every bound), then the sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    '''The metrics exposed together, e.g. by the /metrics endpoint of the web interface.'''
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> Any:
+        '''
+        Adds a metric and returns it.
+
+        Raises:
+            ValueError: If a metric of the same name is already registered
+        '''
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'A metric named {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        '''Returns every metric in the Prometheus text exposition format (version 0.0.4).'''
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.lines())
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics of this process
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'pros2vi_stage_seconds', 'Duration of the pipeline stages (load, parse, dssp, metadata, prepare, render_template, '
+    'pdf, rasterize) in seconds.', ('stage',)))
+
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'pros2vi_cache_requests_total', 'Cache lookups by cache (dssp, metadata, session, artifact) and result (hit, miss).',
+    ('cache', 'result')))
+
+_hooks: List[Callable[[Dict[str, Any]], None]] = []
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook: Callable[[Dict[str, Any]], None]) -> None:
+    '''
+    Calls hook with every span finished from now on, in any thread, as a dictionary of its stage, seconds and labels.
+
+    '''
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook: Callable[[Dict[str, Any]], None]) -> None:
+    '''Stops calling a hook added with add_hook.'''
+    with _hooks_lock:
+        _hooks.remove(hook)
+
+
+def record(stage: str, seconds: float, labels: Optional[Dict[str, Any]] = None,
+           timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    '''
+    Records a finished span: observes its duration, counts its cache lookup, logs it and passes it to every hook.
+
+    Args:
+        stage (str): The pipeline stage, e.g. "dssp".
+        seconds (float): The duration.
+        labels (dict): Details of the span; a "cache" name and a "hit" flag also count a cache lookup.
+        timings (dict): If given, seconds is added to timings[stage].
+
+    Returns:
+        The span as a JSON-serializable dictionary.
+    '''
+    entry = {'stage': stage, 'seconds': round(seconds, 6), **(labels or {})}
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if 'cache' in entry and 'hit' in entry:
+        CACHE_REQUESTS.inc(cache=entry['cache'], result='hit' if entry['hit'] else 'miss')
+    with _hooks_lock:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+        hooks = list(_hooks)
+    if TIMING_LOGGER.isEnabledFor(logging.INFO):
+        TIMING_LOGGER.info(json.dumps(entry, default=str))
+    for hook in hooks:
+        hook(entry)
+    return entry
+
+
+@contextlib.contextmanager
+def span(stage: str, timings: Optional[Dict[str, float]] = None, **labels: Any) -> Iterator[Dict[str, Any]]:
+    '''
+    Times the enclosed block as one stage, see record. Yields the labels, to which details only known inside the
+    block can be added, e.g. whether a cache lookup hit. Spans that raise are recorded with an "error" label.
+
+    '''
+    start = time.perf_counter()
+    try:
+        yield labels
+    except BaseException as e:
+        labels['error'] = type(e).__name__
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, labels, timings)
+
+
+@contextlib.contextmanager
+def collect() -> Iterator[List[Dict[str, Any]]]:
+    '''Yields a list that receives every span finished while the block runs, in any thread.'''
+    spans = []
+    add_hook(spans.append)
+    try:
+        yield spans
+    finally:
+        remove_hook(spans.append)
+
+
+def replay(spans: Iterable[Dict[str, Any]]) -> None:
+    '''Records spans collected in another process (e.g. a job worker) in this process's metrics and timing log.'''
+    for entry in spans or ():
+        labels = {key: value for key, value in entry.items() if key not in ('stage', 'seconds')}
+        record(entry['stage'], entry['seconds'], labels)
+
+
+def summarize(spans: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    '''Returns the number of spans and their total seconds per stage, in the order the stages first finished.'''
+    stages = {}
+    for entry in spans:
+        stage = stages.setdefault(entry['stage'], {'count': 0, 'seconds': 0.0})
+        stage['count'] += 1
+        stage['seconds'] += entry['seconds']
+    return stages
+
+
+def enable_timing_log(stream=None) -> None:
+    '''Writes the timing log, one JSON object per line, to stream (standard error by default).'''
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    TIMING_LOGGER.addHandler(handler)
+    TIMING_LOGGER.setLevel(logging.INFO)
+    TIMING_LOGGER.propagate = False
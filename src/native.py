@@ -0,0 +1,305 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pure-Python renderer that writes SVG directly and rasterizes PNG/JPG with Pillow, without wkhtmltopdf."""
+
+import functools
+import math
+from xml.sax.saxutils import escape
+from typing import Optional, Dict, Any, List, Tuple
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from src.visual import (CELL_WIDTH, COUNT_COLUMN_WIDTH, UNIPROT_COLUMN_WIDTH, PADDING_WIDTH, FOOTER_HEIGHT,
+                        AGREEMENT_ROW_HEIGHT, AGREEMENT_BAR_HEIGHT, CHAIN_LABEL_LINE_HEIGHT, IconSprite)
+
+# Layout constants mirroring templates/output_styles.css (CSS pixels)
+PAGE_MARGIN = 50  # Margin around the title and the chain tables
+ANNOTATION_ROW_HEIGHT = 31  # Annotation row, including its 20px top padding
+ICON_ROW_HEIGHT = 43  # Icon row: a 20x31 icon with 6px padding above and below
+RESIDUE_ROW_HEIGHT = 22  # Residue name row
+ICON_WIDTH = 20  # Displayed icon width; the height follows the 45x70 viewBox
+ICON_HEIGHT = 31
+AGREEMENT_BAR_WIDTH = 14  # Ensemble agreement bar, centered in its cell
+LEGEND_ITEM_GAP = 70  # Space after each legend text
+FONT_FAMILY = "'Courier New', Courier, monospace"
+MONOSPACE_ADVANCE = 0.6  # Approximate advance of a monospace glyph, as a fraction of the font size
+
+LEGEND = [
+    ('H', 'H Alpha helix (4-12)'),
+    ('I', 'I Pi helix'),
+    ('B_A', 'B Isolated beta-bridge residue'),
+    ('T', 'T Turn'),
+    ('E_A', 'E Strand'),
+    ('S', 'S Bend'),
+    ('G', 'G 3-10 helix'),
+    ('P', 'P Poly-Proline II (PPII) helix / k-helix'),
+    ('-', 'Unsolved'),
+]
+
+# Font files tried in order for raster output, before falling back to Pillow's built-in font
+FONT_FILES = {
+    False: ['cour.ttf', 'Courier New.ttf', 'LiberationMono-Regular.ttf', 'DejaVuSansMono.ttf'],
+    True: ['courbd.ttf', 'Courier New Bold.ttf', 'LiberationMono-Bold.ttf', 'DejaVuSansMono-Bold.ttf'],
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _load_font(size: int, bold: bool = False):
+    """Load a monospace TrueType font of the given pixel size, or Pillow's default font."""
+    for name in FONT_FILES[bold]:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow < 10.1 has no sized default font
+        return ImageFont.load_default()
+
+
+def _hex_to_rgb(color: str) -> Tuple[int, int, int]:
+    """Convert a color such as '#228B22' (or any color name Pillow knows) to an RGB tuple."""
+    return ImageColor.getrgb(color)[:3]
+
+
+class NativeRenderer:
+    '''
+    Lays out the visualization from the prepared chain data and draws it without an HTML engine.
+
+    The layout is computed once as a list of text and icon primitives in CSS pixels, which are then
+    written as a standalone SVG or drawn onto a Pillow image.
+
+    '''
+    def __init__(self, chains_data: List[Dict[str, Any]], residues_per_line: int, pdb_name: Optional[str] = None,
+                 subtitle: Optional[str] = None, scientific_name: Optional[str] = None,
+                 legend_colors: Optional[Dict[str, str]] = None, ensemble_models: Optional[int] = None) -> None:
+        '''
+
+        Args:
+            chains_data (list): Chain data from VisualMap._prepare_chain_data.
+            residues_per_line (int): The number of residues per row.
+            pdb_name (str): The PDB code shown in the title.
+            subtitle (str): The title of the entry.
+            scientific_name (str): The source scientific name.
+            legend_colors (dict): Icon key to color for the legend icons.
+            ensemble_models (int): The number of models of an ensemble, which adds the agreement bar to the legend.
+
+        '''
+        self.residues_per_line = residues_per_line
+        self.legend_colors = legend_colors or {}
+        self.ensemble_models = ensemble_models
+        self.primitives = []
+        self.width, self.height = self._layout(chains_data, pdb_name, subtitle, scientific_name)
+
+    def _text(self, x: float, y: float, text: Any, size: int, bold: bool = False, anchor: str = 'start') -> None:
+        # y is the top of the line box; anchor is 'start', 'middle' or 'end'
+        if text is None or text == '':
+            return
+        self.primitives.append(('text', x, y, str(text), size, bold, anchor))
+
+    def _icon(self, x: float, y: float, icon_key: str, color: str) -> None:
+        self.primitives.append(('icon', x, y, icon_key, color))
+
+    def _rect(self, x: float, y: float, w: float, h: float, color: str) -> None:
+        self.primitives.append(('rect', x, y, w, h, color))
+
+    def _layout(self, chains_data, pdb_name, subtitle, scientific_name) -> Tuple[int, int]:
+        '''
+        Private method that fills self.primitives and returns the page size in CSS pixels.
+
+        '''
+        table_width = COUNT_COLUMN_WIDTH + CELL_WIDTH * self.residues_per_line + UNIPROT_COLUMN_WIDTH
+        width = PAGE_MARGIN + table_width + PADDING_WIDTH
+        y = PAGE_MARGIN
+
+        # Title block
+        if pdb_name:
+            self._text(PAGE_MARGIN, y, f'PDB Code: {pdb_name}', 24, bold=True)
+            y += 30
+        y += 10
+        if subtitle:
+            self._text(PAGE_MARGIN, y, f'Title: {subtitle}', 20)
+            y += 26
+        if scientific_name:
+            self._text(PAGE_MARGIN, y, f'Source Scientific Name: {scientific_name}', 20)
+            y += 26
+        y += PAGE_MARGIN
+
+        # Chain tables
+        cells_x = PAGE_MARGIN + COUNT_COLUMN_WIDTH
+        end_x = cells_x + CELL_WIDTH * self.residues_per_line + 18
+        for chain in chains_data:
+            y += 30
+            label_lines = chain.get('label_lines') or [f"Chain {chain['chain_id']}:"]
+            for line in label_lines[:-1]:
+                self._text(PAGE_MARGIN, y, line, 20, bold=True)
+                y += CHAIN_LABEL_LINE_HEIGHT
+            self._text(PAGE_MARGIN, y, label_lines[-1], 20, bold=True)
+            y += 30
+            if chain.get('uniprot_id'):
+                self._text(PAGE_MARGIN, y, f"Uniprot ID: {chain['uniprot_id']}", 16)
+                y += 22
+            for row in chain['rows']:
+                x = cells_x
+                for cell in row['annotation_cells']:
+                    span = cell['colspan'] * CELL_WIDTH
+                    self._text(x + span / 2, y + 18, cell['text'], 11, bold=True, anchor='middle')
+                    x += span
+                y += ANNOTATION_ROW_HEIGHT
+                for i, cell in enumerate(row['structure_cells']):
+                    if cell.get('key') is not None:
+                        self._icon(cells_x + i * CELL_WIDTH, y + 6, cell['key'], cell['color'])
+                y += ICON_ROW_HEIGHT
+                self._text(PAGE_MARGIN, y + 2, row['start_res_num'], 18)
+                for i, cell in enumerate(row['residue_cells']):
+                    self._text(cells_x + i * CELL_WIDTH + CELL_WIDTH / 2, y + 3, cell['name'], 16, bold=True, anchor='middle')
+                self._text(end_x, y + 2, row['end_res_num'], 18)
+                y += RESIDUE_ROW_HEIGHT
+                if 'agreement_cells' in row:
+                    for i, cell in enumerate(row['agreement_cells']):
+                        if cell['height']:
+                            self._rect(cells_x + i * CELL_WIDTH + (CELL_WIDTH - AGREEMENT_BAR_WIDTH) / 2,
+                                       y + AGREEMENT_ROW_HEIGHT - cell['height'], AGREEMENT_BAR_WIDTH, cell['height'],
+                                       cell['color'])
+                    y += AGREEMENT_ROW_HEIGHT
+
+        # Legend, wrapping items onto new lines like the inline-block elements of the template
+        y += PAGE_MARGIN
+        self._text(PAGE_MARGIN, y, 'Legend:', 20)
+        y += 40
+        x = PAGE_MARGIN
+        for icon_key, text in LEGEND:
+            item_width = ICON_WIDTH + 15 + math.ceil(len(text) * 18 * MONOSPACE_ADVANCE) + LEGEND_ITEM_GAP
+            if x > PAGE_MARGIN and x + item_width > width:
+                x = PAGE_MARGIN
+                y += ICON_HEIGHT + 10
+            self._icon(x, y, icon_key, self.legend_colors.get(icon_key, '#000000'))
+            self._text(x + ICON_WIDTH + 15, y + 6, text, 18)
+            x += item_width
+        if self.ensemble_models:
+            text = f'Bar height: share of the {self.ensemble_models} models with the consensus structure'
+            y += ICON_HEIGHT + 10
+            self._rect(PAGE_MARGIN + (ICON_WIDTH - AGREEMENT_BAR_WIDTH) / 2, y, AGREEMENT_BAR_WIDTH, AGREEMENT_BAR_HEIGHT,
+                       self.legend_colors.get('-', '#b7b7b7'))
+            self._text(PAGE_MARGIN + ICON_WIDTH + 15, y + 6, text, 18)
+        y += ICON_HEIGHT + FOOTER_HEIGHT
+
+        return int(width), int(y)
+
+    def to_svg(self) -> str:
+        '''
+        Returns the visualization as a standalone SVG document, with each icon defined once as a <symbol>.
+
+        '''
+        sprite = IconSprite()
+        body = []
+        for primitive in self.primitives:
+            if primitive[0] == 'icon':
+                _, x, y, icon_key, color = primitive
+                symbol_id = sprite.symbol_id(icon_key, color)
+                body.append(f'<use xlink:href="#{symbol_id}" x="{x:g}" y="{y:g}" width="{ICON_WIDTH}" height="{ICON_HEIGHT}"/>')
+            elif primitive[0] == 'rect':
+                _, x, y, w, h, color = primitive
+                body.append(f'<rect x="{x:g}" y="{y:g}" width="{w:g}" height="{h:g}" fill="{color}"/>')
+            else:
+                _, x, y, text, size, bold, anchor = primitive
+                weight = ' font-weight="bold"' if bold else ''
+                # SVG places text on its baseline; shift down from the top of the line box
+                body.append(f'<text x="{x:g}" y="{y + size * 0.85:g}" font-size="{size}"{weight} text-anchor="{anchor}">{escape(text)}</text>')
+
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1" '
+            f'width="{self.width}" height="{self.height}" viewBox="0 0 {self.width} {self.height}">\n'
+            f'<defs>{sprite.symbols()}</defs>\n'
+            f'<rect width="100%" height="100%" fill="#ffffff"/>\n'
+            f'<g font-family="{FONT_FAMILY}" fill="#000000">\n'
+            + '\n'.join(body) +
+            '\n</g>\n</svg>\n'
+        )
+
+    def to_image(self, dpi: int = 100) -> Image.Image:
+        '''
+        Draws the visualization onto a Pillow image. One CSS pixel maps to one image pixel at 100 DPI.
+
+        Icons are drawn as simplified vector glyphs, since Pillow cannot rasterize the SVG paths in ICONS.
+
+        '''
+        scale = dpi / 100
+        image = Image.new('RGB', (max(1, round(self.width * scale)), max(1, round(self.height * scale))), 'white')
+        draw = ImageDraw.Draw(image)
+        for primitive in self.primitives:
+            if primitive[0] == 'icon':
+                _, x, y, icon_key, color = primitive
+                self._draw_icon(draw, x * scale, y * scale, ICON_WIDTH * scale, ICON_HEIGHT * scale, icon_key, _hex_to_rgb(color))
+            elif primitive[0] == 'rect':
+                _, x, y, w, h, color = primitive
+                draw.rectangle([x * scale, y * scale, (x + w) * scale - 1, (y + h) * scale - 1], fill=_hex_to_rgb(color))
+            else:
+                _, x, y, text, size, bold, anchor = primitive
+                font = _load_font(max(1, round(size * scale)), bold)
+                draw.text((x * scale, y * scale), text, fill='black', font=font, anchor={'start': 'la', 'middle': 'ma', 'end': 'ra'}[anchor])
+        return image
+
+    @staticmethod
+    def _draw_icon(draw: ImageDraw.ImageDraw, x: float, y: float, w: float, h: float, icon_key: str, color: Tuple[int, int, int]) -> None:
+        '''
+        Draws a simplified glyph for one secondary structure type in the box (x, y, w, h).
+
+        '''
+        mid = y + h / 2
+        line = max(1, round(w / 10))
+        structure = icon_key[0]
+        if structure in ('H', 'G', 'I'):
+            # Helices: one period of a sine wave spanning the cell
+            amplitude = h * {'H': 0.3, 'G': 0.22, 'I': 0.38}[structure]
+            points = [(x + w * t / 16, mid - amplitude * math.sin(2 * math.pi * t / 16)) for t in range(17)]
+            draw.line(points, fill=color, width=line * 2, joint='curve')
+        elif structure in ('E', 'B'):
+            # Strands and bridges: a flat band, ending in an arrow head at the end of the segment
+            band = h * 0.14
+            if icon_key.endswith('_A'):
+                draw.rectangle([x, mid - band, x + w * 0.5, mid + band], fill=color)
+                draw.polygon([(x + w * 0.5, mid - band * 2.4), (x + w, mid), (x + w * 0.5, mid + band * 2.4)], fill=color)
+            else:
+                draw.rectangle([x, mid - band, x + w, mid + band], fill=color)
+        elif structure == 'T':
+            draw.arc([x, mid - h * 0.25, x + w, mid + h * 0.25], 180, 360, fill=color, width=line * 2)
+        elif structure == 'S':
+            draw.arc([x, mid - h * 0.12, x + w, mid + h * 0.12], 180, 360, fill=color, width=line * 2)
+        elif structure == 'P':
+            points = [(x + w * t / 4, mid + (h * 0.12 if t % 2 else -h * 0.12)) for t in range(5)]
+            draw.line(points, fill=color, width=line * 2, joint='curve')
+        else:
+            draw.line([(x, mid), (x + w, mid)], fill=color, width=line)
+
+    def save(self, path: str, dpi: int = 100) -> None:
+        '''
+        Writes the visualization to path; the format follows the extension (svg, png, jpg or pdf).
+
+        '''
+        extension = path.rsplit('.', 1)[-1].lower()
+        if extension == 'svg':
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.to_svg())
+            return
+        image = self.to_image(dpi)
+        if extension in ('jpg', 'jpeg'):
+            image.save(path, 'JPEG', quality=95, dpi=(dpi, dpi))
+        elif extension == 'pdf':
+            image.save(path, 'PDF', resolution=dpi)
+        else:
+            image.save(path, 'PNG', dpi=(dpi, dpi))
@@ -0,0 +1,206 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Rasterizing PDF pages straight to disk, and stitching page images into one image a band of rows at a time."""
+
+import os
+import struct
+import zlib
+from typing import BinaryIO, Iterator, List, Tuple
+
+# pdftoppm processes rasterizing the pages of one PDF at the same time
+PAGE_THREADS = os.cpu_count() or 1
+
+# Rows read, padded and compressed at a time while stitching
+STITCH_BAND_ROWS = 256
+
+# Fill of the area right of pages narrower than the widest one
+STITCH_BACKGROUND = b'\xff\xff\xff'
+
+# Maximum size of one PNG IDAT chunk
+PNG_CHUNK_SIZE = 1024 * 1024
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def rasterize_pdf(pdf_bytes: bytes, dpi: int, output_folder: str, fmt: str = 'ppm') -> List[str]:
+    '''
+    Rasterizes every page of a PDF into output_folder with pdftoppm, without loading the pages in Python.
+    The pages are divided among PAGE_THREADS pdftoppm processes.
+
+    Args:
+        pdf_bytes (bytes): The PDF document.
+        dpi (int): The resolution.
+        output_folder (str): An existing folder for the page files.
+        fmt (str): "ppm" (uncompressed, streamable), "png" or "jpeg".
+
+    Returns:
+        The page file paths, in page order.
+    '''
+    import pdf2image
+
+    return pdf2image.convert_from_bytes(pdf_bytes, dpi=dpi, output_folder=output_folder, fmt=fmt,
+                                        output_file='page', paths_only=True, thread_count=PAGE_THREADS)
+
+
+def _read_ppm_header(f: BinaryIO) -> Tuple[int, int]:
+    '''Reads a binary PPM (P6) header and returns (width, height), leaving f at the first pixel.'''
+    fields = []
+    token = b''
+    while len(fields) < 4:
+        char = f.read(1)
+        if not char:
+            raise ValueError('Truncated PPM header')
+        if char == b'#' and not token:
+            f.readline()
+        elif char.isspace():
+            if token:
+                fields.append(token)
+                token = b''
+        else:
+            token += char
+    if fields[0] != b'P6' or int(fields[3]) != 255:
+        raise ValueError('Only 8-bit binary PPM (P6) pages can be streamed')
+    return int(fields[1]), int(fields[2])
+
+
+def image_size(path: str) -> Tuple[int, int]:
+    '''
+    Returns the (width, height) of a page image, reading only its header.
+
+    '''
+    if path.lower().endswith('.ppm'):
+        with open(path, 'rb') as f:
+            return _read_ppm_header(f)
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return image.size
+
+
+def _row_bands(path: str) -> Iterator[Tuple[int, bytes]]:
+    '''
+    Yields (rows, RGB bytes) bands of a page image. PPM pages are streamed from disk; other formats are decoded
+    one page at a time.
+
+    '''
+    if path.lower().endswith('.ppm'):
+        with open(path, 'rb') as f:
+            width, height = _read_ppm_header(f)
+            for row in range(0, height, STITCH_BAND_ROWS):
+                rows = min(STITCH_BAND_ROWS, height - row)
+                yield rows, f.read(rows * width * 3)
+        return
+    from PIL import Image
+
+    with Image.open(path) as image:
+        rgb = image.convert('RGB')
+        width, height = rgb.size
+        for row in range(0, height, STITCH_BAND_ROWS):
+            rows = min(STITCH_BAND_ROWS, height - row)
+            yield rows, rgb.crop((0, row, width, row + rows)).tobytes()
+
+
+class PNGStreamWriter:
+    '''
+    Writes an 8-bit RGB PNG of known size row by row, compressing as it goes, so that memory use does not depend
+    on the image size.
+
+    '''
+    def __init__(self, path: str, width: int, height: int, dpi: int = 100) -> None:
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(6)
+        self._pending = b''
+        self._file = open(path, 'wb')
+        self._file.write(PNG_SIGNATURE)
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        pixels_per_meter = round(dpi / 0.0254)
+        self._chunk(b'pHYs', struct.pack('>IIB', pixels_per_meter, pixels_per_meter, 1))
+
+    def _chunk(self, chunk_type: bytes, data: bytes) -> None:
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+
+    def _idat(self, data: bytes) -> None:
+        self._pending += data
+        while len(self._pending) >= PNG_CHUNK_SIZE:
+            self._chunk(b'IDAT', self._pending[:PNG_CHUNK_SIZE])
+            self._pending = self._pending[PNG_CHUNK_SIZE:]
+
+    def write_rows(self, pixels: bytes, rows: int) -> None:
+        '''Appends rows of RGB pixels, each exactly width * 3 bytes.'''
+        stride = self.width * 3
+        # Filter type 0 (None) in front of every row
+        filtered = b''.join(b'\x00' + pixels[row * stride:(row + 1) * stride] for row in range(rows))
+        self._idat(self._compressor.compress(filtered))
+        self.rows_written += rows
+
+    def close(self) -> None:
+        '''Finishes the file; raises ValueError if fewer rows than the height were written.'''
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f'Wrote {self.rows_written} of {self.height} PNG rows')
+            self._idat(self._compressor.flush())
+            if self._pending:
+                self._chunk(b'IDAT', self._pending)
+            self._chunk(b'IEND', b'')
+        finally:
+            self._file.close()
+
+    def __enter__(self) -> 'PNGStreamWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+
+def stitch_pages(page_paths: List[str], path: str, dpi: int = 100) -> None:
+    '''
+    Joins page images vertically into one image, left-aligned on a white background.
+
+    PNG output is written incrementally, a band of rows at a time, so only one band is held in memory.
+    Other formats (JPG) are assembled in memory by Pillow, as they cannot be written incrementally.
+
+    '''
+    sizes = [image_size(page_path) for page_path in page_paths]
+    width = max(page_width for page_width, _ in sizes)
+    height = sum(page_height for _, page_height in sizes)
+
+    if not path.lower().endswith('.png'):
+        from PIL import Image
+
+        stitched = Image.new('RGB', (width, height), 'white')
+        top = 0
+        for page_path, (_, page_height) in zip(page_paths, sizes):
+            with Image.open(page_path) as page:
+                stitched.paste(page.convert('RGB'), (0, top))
+            top += page_height
+        stitched.save(path, dpi=(dpi, dpi))
+        return
+
+    with PNGStreamWriter(path, width, height, dpi) as writer:
+        for page_path, (page_width, _) in zip(page_paths, sizes):
+            padding = STITCH_BACKGROUND * (width - page_width)
+            stride = page_width * 3
+            for rows, pixels in _row_bands(page_path):
+                if padding:
+                    pixels = b''.join(pixels[row * stride:(row + 1) * stride] + padding for row in range(rows))
+                writer.write_rows(pixels, rows)
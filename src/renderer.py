@@ -0,0 +1,196 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""The wkhtmltoimage and wkhtmltopdf runs: a bounded number of renderer processes at a time, and several HTML
+documents of the same page size rendered by one wkhtmltopdf process."""
+
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+
+from src import metrics
+
+# Renderer processes running at the same time, across the worker processes that share their slots (see shared_slots)
+RENDERER_PROCESSES = int(os.environ.get('PROS2VI_RENDERER_PROCESSES', str(os.cpu_count() or 1)))
+
+# Documents passed to one wkhtmltopdf process; 1 renders every document on its own
+RENDER_BATCH = int(os.environ.get('PROS2VI_RENDER_BATCH', '16'))
+
+_slots = None
+_held = None
+_slots_lock = threading.Lock()
+
+
+def shared_slots(context=None):
+    '''
+    Returns a semaphore of RENDERER_PROCESSES slots that worker processes can share, see set_slots.
+
+    Args:
+        context: The multiprocessing context of the workers, the default context if None.
+    '''
+    return (context or multiprocessing).BoundedSemaphore(RENDERER_PROCESSES)
+
+
+def set_slots(slots, held=None) -> None:
+    '''
+    Makes this process take its renderer slots from a semaphore shared with other processes, e.g. as the
+    initializer of a worker pool. Without it, each process has RENDERER_PROCESSES slots of its own.
+
+    Args:
+        slots: The shared semaphore, see shared_slots.
+        held: A shared integer (multiprocessing.RawValue) counting the slots this process holds, for the process
+            that started it to give them back if it is killed while rendering, see release_held.
+    '''
+    global _slots, _held
+    with _slots_lock:
+        _slots = slots
+        _held = held
+
+
+def release_held(slots, held) -> int:
+    '''
+    Releases the slots still counted in held, once the process that held them is dead, and returns their number.
+
+    '''
+    count = held.value
+    for _ in range(count):
+        slots.release()
+    held.value = 0
+    return count
+
+
+def _get_slots():
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(RENDERER_PROCESSES)
+        return _slots
+
+
+@contextlib.contextmanager
+def renderer_slot() -> Iterator[None]:
+    '''Waits for a free renderer slot and holds it while the block runs; the wait is timed as renderer_wait.'''
+    slots = _get_slots()
+    with metrics.span('renderer_wait'):
+        slots.acquire()
+    _count_held(1)
+    try:
+        yield
+    finally:
+        _count_held(-1)
+        slots.release()
+
+
+def _count_held(delta: int) -> None:
+    with _slots_lock:
+        if _held is not None:
+            _held.value += delta
+
+
+def render_image(html_path: str, path: str, options: Optional[Dict[str, Any]] = None) -> None:
+    '''Renders an HTML file to an image with wkhtmltoimage.'''
+    import imgkit
+
+    with renderer_slot():
+        imgkit.from_file(html_path, path, options=options)
+
+
+def render_pdf(html_paths: Any, path: Optional[str] = None, options: Optional[Dict[str, Any]] = None) -> Optional[bytes]:
+    '''
+    Renders one HTML file, or a list of them one after the other, to a PDF with wkhtmltopdf.
+
+    Returns:
+        The PDF, or None if it was written to path.
+    '''
+    import pdfkit
+
+    with renderer_slot():
+        pdf_bytes = pdfkit.from_file(html_paths, path or False, options=options)
+    return None if path else pdf_bytes
+
+
+def _split_pdf(pdf_path: str, folder: str) -> List[str]:
+    '''Splits a PDF into one file per page with pdfseparate (poppler-utils) and returns them in page order.'''
+    subprocess.run([shutil.which('pdfseparate') or 'pdfseparate', pdf_path, os.path.join(folder, 'page-%d.pdf')],
+                   check=True, capture_output=True)
+    pages = [name for name in os.listdir(folder) if name.startswith('page-')]
+    return [os.path.join(folder, name) for name in sorted(pages, key=lambda name: int(name[5:-4]))]
+
+
+def _render_batch(documents: List[Tuple[str, str]], options: Dict[str, Any],
+                  timings: Optional[Dict[str, float]] = None) -> None:
+    '''
+    Renders (HTML path, PDF path) documents of the same page size with one wkhtmltopdf process, and splits its output
+    into the PDF paths. Falls back to one process per document when the output cannot be split by document, i.e.
+    without pdfseparate or when a document spans several pages.
+
+    '''
+    if len(documents) > 1 and shutil.which('pdfseparate') is not None:
+        folder = tempfile.mkdtemp(prefix='.batch-', dir=os.path.dirname(os.path.abspath(documents[0][1])))
+        try:
+            batch_path = os.path.join(folder, 'batch.pdf')
+            with metrics.span('pdf', timings, tool='wkhtmltopdf', documents=len(documents)):
+                render_pdf([html_path for html_path, _ in documents], batch_path, options)
+            pages = _split_pdf(batch_path, folder)
+            if len(pages) == len(documents):
+                for page_path, (_, pdf_path) in zip(pages, documents):
+                    os.replace(page_path, pdf_path)
+                return
+            logging.debug(f'A batch of {len(documents)} documents gave {len(pages)} pages, rendering them one by one')
+        except (OSError, subprocess.CalledProcessError) as e:
+            logging.debug(f'Batched rendering failed, rendering the documents one by one: {e}')
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    for html_path, pdf_path in documents:
+        with metrics.span('pdf', timings, tool='wkhtmltopdf', documents=1):
+            render_pdf(html_path, pdf_path, options)
+
+
+def render_pdfs(documents: List[Tuple[str, str, Dict[str, Any]]], batch_size: int = RENDER_BATCH,
+                timings: Optional[Dict[str, float]] = None) -> None:
+    '''
+    Renders HTML files to single-page PDFs, passing the documents of the same page size (the same wkhtmltopdf
+    options, which apply to a whole run) to one wkhtmltopdf process in batches, so the startup of the renderer is
+    paid once per batch. Batches run in parallel, within the renderer slots.
+
+    Args:
+        documents (list): (HTML path, PDF path, wkhtmltopdf options) of every document.
+        batch_size (int): The most documents per wkhtmltopdf process.
+        timings (dict): If given, the seconds of the pdf stage are added to it (see metrics.record).
+
+    Raises:
+        RuntimeError: If a PDF could not be rendered
+    '''
+    groups = {}
+    for html_path, pdf_path, options in documents:
+        groups.setdefault(json.dumps(options, sort_keys=True), (options, []))[1].append((html_path, pdf_path))
+    batches = [(group[i:i + max(batch_size, 1)], options)
+               for options, group in groups.values() for i in range(0, len(group), max(batch_size, 1))]
+    if not batches:
+        return
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(RENDERER_PROCESSES, len(batches))) as executor:
+            list(executor.map(lambda batch: _render_batch(*batch, timings=timings), batches))
+    except Exception as e:
+        raise RuntimeError(f"Failed to render PDF: {e}")
@@ -0,0 +1,146 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Run-length encoded secondary structure segments of a chain, and their division into rows."""
+
+import bisect
+import re
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.chains import ChainData
+
+# Structure types whose segments are labelled in the annotation row, e.g. "H1"
+ANNOTATED_TYPES = ('H', 'B', 'E', 'I', 'G', 'S', 'T')
+
+# Structure types drawn with an arrow head on the last residue of a segment
+ARROW_TYPES = ('B', 'E')
+
+# A run of one or more identical structure codes
+_RUN_PATTERN = re.compile(r'(.)\1*', re.DOTALL)
+
+
+class Segment(NamedTuple):
+    '''
+    A maximal run of residues with the same secondary structure.
+
+    Attributes:
+        ss (str): The DSSP structure code, e.g. "H".
+        start (int): Index of the first residue in the chain.
+        end (int): Index after the last residue in the chain.
+        ordinal (int): Number of the segment among the chain's segments of the same type, starting at 1.
+    '''
+    ss: str
+    start: int
+    end: int
+    ordinal: int
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+
+class RowSegment(NamedTuple):
+    '''
+    The part of a segment that falls within one row.
+
+    Attributes:
+        segment (Segment): The segment.
+        start (int): Index of the first residue of the part in the chain.
+        end (int): Index after the last residue of the part in the chain.
+        label (str): The annotation of the part, e.g. "H1", or "" if it has none.
+    '''
+    segment: Segment
+    start: int
+    end: int
+    label: str
+
+    @property
+    def closes_segment(self) -> bool:
+        '''Whether the segment ends in this row.'''
+        return self.end == self.segment.end
+
+    def icon_keys(self) -> List[str]:
+        '''
+        Returns the icon key of each residue of the part, with the arrow head icon (e.g. "E_A") on the last
+        residue of a B or E segment.
+
+        '''
+        ss = self.segment.ss
+        if self.closes_segment and ss in ARROW_TYPES:
+            return [ss] * (self.end - self.start - 1) + [f"{ss}_A"]
+        return [ss] * (self.end - self.start)
+
+
+def find_segments(ss: str) -> List[Segment]:
+    '''
+    Returns the run-length encoded segments of a chain's secondary structure string.
+
+    Example: find_segments("HHH--HH") == [Segment("H", 0, 3, 1), Segment("-", 3, 5, 1), Segment("H", 5, 7, 2)]
+    '''
+    segments = []
+    ordinals = {}
+    for match in _RUN_PATTERN.finditer(ss):
+        code = match.group(1)
+        ordinals[code] = ordinals.get(code, 0) + 1
+        segments.append(Segment(code, match.start(), match.end(), ordinals[code]))
+    return segments
+
+
+def chain_segments(structure_list: Dict[str, ChainData]) -> Dict[str, List[Segment]]:
+    '''
+    Returns the segments of every chain of a VisualMap.structure_list, keyed by chain ID.
+
+    '''
+    return {chain_id: find_segments(chain.ss) for chain_id, chain in structure_list.items()}
+
+
+def split_rows(segments: List[Segment], chain_length: int, residues_per_line: int, first_row: int = 0,
+               end_row: Optional[int] = None) -> Iterator[Tuple[int, int, List[RowSegment]]]:
+    '''
+    Divides a chain's segments at row boundaries, visiting each segment once per row it spans.
+
+    Each part that ends its segment is labelled with the type and its number within the row (e.g. "E2"), except
+    for the last segment of the chain and for types outside ANNOTATED_TYPES.
+
+    Args:
+        segments (list): The chain's segments, see find_segments.
+        chain_length (int): The number of residues of the chain.
+        residues_per_line (int): The number of residues per row.
+        first_row (int): The first row to yield; earlier segments are skipped by bisection.
+        end_row (int): The row after the last one to yield, the default is all remaining rows.
+
+    Yields:
+        (row_start, row_end, parts) for each row, where row_end is the index after the row's last residue.
+    '''
+    first_start = first_row * residues_per_line
+    last_start = chain_length if end_row is None else min(chain_length, end_row * residues_per_line)
+    # The first segment that has not ended before the first row
+    index = bisect.bisect_right(segments, first_start, key=lambda segment: segment.end)
+    for row_start in range(first_start, last_start, residues_per_line):
+        row_end = min(row_start + residues_per_line, chain_length)
+        parts = []
+        row_counts = {}
+        while index < len(segments) and segments[index].start < row_end:
+            segment = segments[index]
+            part_end = min(segment.end, row_end)
+            label = ''
+            if part_end == segment.end and segment.end != chain_length and segment.ss in ANNOTATED_TYPES:
+                row_counts[segment.ss] = row_counts.get(segment.ss, 0) + 1
+                label = f"{segment.ss}{row_counts[segment.ss]}"
+            parts.append(RowSegment(segment, max(segment.start, row_start), part_end, label))
+            if segment.end > row_end:
+                # The segment continues in the next row
+                break
+            index += 1
+        yield row_start, row_end, parts
@@ -0,0 +1,112 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Chain and residue range selections such as "A:1-300,C", applied to a secondary structure assignment."""
+
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from src.chains import ChainData
+
+# One selector: a chain ID, optionally followed by a residue number or an inclusive range whose ends may be left out,
+# e.g. "A", "A:42", "A:1-300", "A:100-", "A:-50", "A:-5-20"
+_SELECTOR_PATTERN = re.compile(r'(?P<chain>[A-Za-z0-9]+)(?::(?:(?P<start>-?\d+)?(?P<range>-)(?P<end>-?\d+)?|(?P<residue>-?\d+)))?')
+
+
+class Selector(NamedTuple):
+    '''
+    The residues of one chain to keep.
+
+    Attributes:
+        chain_id (str): The chain identifier.
+        start (int): The first residue number, or None from the start of the chain.
+        end (int): The last residue number (inclusive), or None to the end of the chain.
+    '''
+    chain_id: str
+    start: Optional[int]
+    end: Optional[int]
+
+    def __str__(self) -> str:
+        if self.start is None and self.end is None:
+            return self.chain_id
+        if self.start is not None and self.start == self.end:
+            return f'{self.chain_id}:{self.start}'
+        return f"{self.chain_id}:{'' if self.start is None else self.start}-{'' if self.end is None else self.end}"
+
+
+def parse_selection(text: str) -> List[Selector]:
+    '''
+    Parses a comma-separated selection, e.g. "A:1-300,C" (residues 1 to 300 of chain A and all of chain C).
+    Selectors of the same chain add up.
+
+    Raises:
+        ValueError: If a selector is malformed or a range ends before it starts
+    '''
+    selectors = []
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        match = _SELECTOR_PATTERN.fullmatch(item)
+        if match is None:
+            raise ValueError(f'Invalid selection "{item}", expected a chain ID with an optional residue range, e.g. A:1-300')
+        if match.group('residue') is not None:
+            start = end = int(match.group('residue'))
+        else:
+            start = int(match.group('start')) if match.group('start') is not None else None
+            end = int(match.group('end')) if match.group('end') is not None else None
+        if start is not None and end is not None and end < start:
+            raise ValueError(f'Invalid selection "{item}", the range ends before it starts')
+        selectors.append(Selector(match.group('chain'), start, end))
+    if not selectors:
+        raise ValueError('The selection is empty')
+    return selectors
+
+
+def format_selection(selectors: List[Selector]) -> str:
+    '''Returns the canonical text of parsed selectors, e.g. "A:1-300,C".'''
+    return ','.join(str(selector) for selector in selectors)
+
+
+def selected_indices(structure_list: Dict[str, ChainData], selectors: List[Selector]) -> Dict[str, np.ndarray]:
+    '''
+    Returns the indices of the selected residues of every selected chain, in structure order.
+
+    Raises:
+        ValueError: If a selected chain is not in the structure, or nothing is selected
+    '''
+    masks = {}
+    for selector in selectors:
+        chain = structure_list.get(selector.chain_id)
+        if chain is None:
+            raise ValueError(f"Chain {selector.chain_id} is not in the structure (chains: {', '.join(structure_list) or 'none'})")
+        mask = np.ones(len(chain), dtype=bool)
+        if selector.start is not None:
+            mask &= chain.res_nums >= selector.start
+        if selector.end is not None:
+            mask &= chain.res_nums <= selector.end
+        masks[selector.chain_id] = masks[selector.chain_id] | mask if selector.chain_id in masks else mask
+
+    indices = {chain_id: np.flatnonzero(masks[chain_id]) for chain_id in structure_list if chain_id in masks}
+    indices = {chain_id: rows for chain_id, rows in indices.items() if len(rows)}
+    if not indices:
+        raise ValueError(f'The selection {format_selection(selectors)} contains no residues')
+    return indices
+
+
+def select(structure_list: Dict[str, ChainData], indices: Dict[str, np.ndarray]) -> Dict[str, ChainData]:
+    '''Returns the selected residues (see selected_indices) in the form of VisualMap.structure_list.'''
+    return {chain_id: structure_list[chain_id].take(rows) for chain_id, rows in indices.items()}
@@ -0,0 +1,162 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Render sessions of the web interface: a structure and the state computed from it, kept between submissions so
+that changing colors, titles or the layout re-renders without parsing, DSSP or metadata lookups."""
+
+import json
+import logging
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Optional, Dict, Any
+
+# Session location, overridable with the PROS2VI_SESSION_DIR environment variable
+SESSION_DIR = os.environ.get('PROS2VI_SESSION_DIR', os.path.join(os.getcwd(), 'uploads', 'sessions'))
+
+# Seconds a session is kept after its last use
+SESSION_TTL = float(os.environ.get('PROS2VI_SESSION_TTL', str(3600)))
+
+# Description of a session (its source, structure file and PDB code) and its computed state, inside its folder
+SESSION_FILE = 'session.json'
+STATE_FILE = 'state.pickle'
+
+# Session IDs are random; anything else is never looked up on disk
+SESSION_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+class SessionStore:
+    '''
+    One folder per session holding its structure file, if uploaded, and the pickled VisualMap.session_state() of its
+    last render. Sessions unused for longer than the time to live are removed.
+
+    '''
+    def __init__(self, root: str = SESSION_DIR, ttl: float = SESSION_TTL) -> None:
+        '''
+
+        Args:
+            root (str): The session folder, created if missing.
+            ttl (float): Seconds a session is kept after its last use.
+
+        '''
+        self.root = root
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, session_id: str) -> str:
+        '''Returns the folder of a session.'''
+        return os.path.join(self.root, session_id)
+
+    def create(self, source: str, file_path: Optional[str] = None, pdb_name: Optional[str] = None) -> Dict[str, Any]:
+        '''
+        Starts a session and removes expired ones.
+
+        Args:
+            source (str): Identifies the structure, e.g. the SHA-256 digest of the uploaded file or "pdb:1FAT".
+            file_path (str): An uploaded structure file, moved into the session.
+            pdb_name (str): The PDB code of the structure, for sessions without a file.
+
+        Returns:
+            The session, see get.
+        '''
+        self.prune()
+        session_id = uuid.uuid4().hex
+        os.makedirs(self.path(session_id))
+        file_name = None
+        if file_path is not None:
+            file_name = os.path.basename(file_path)
+            shutil.move(file_path, os.path.join(self.path(session_id), file_name))
+        with open(os.path.join(self.path(session_id), SESSION_FILE), 'w') as f:
+            json.dump({'source': source, 'file_name': file_name, 'pdb_name': pdb_name}, f)
+        return self.get(session_id)
+
+    def get(self, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        '''
+        Returns a session and marks it as used, or None if it does not exist or has expired.
+
+        Returns:
+            {"id": ..., "path": the session folder, "source": ..., "file_path": the structure file or None,
+             "pdb_name": ...}
+        '''
+        if not session_id or not SESSION_ID_PATTERN.fullmatch(session_id):
+            return None
+        path = self.path(session_id)
+        try:
+            if os.stat(path).st_mtime < time.time() - self.ttl:
+                return None
+            with open(os.path.join(path, SESSION_FILE), 'r') as f:
+                session = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return {
+            'id': session_id,
+            'path': path,
+            'source': session['source'],
+            'file_path': os.path.join(path, session['file_name']) if session['file_name'] else None,
+            'pdb_name': session['pdb_name'],
+        }
+
+    def prune(self) -> None:
+        '''Removes the sessions unused for longer than the time to live.'''
+        expired = time.time() - self.ttl
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if os.stat(path).st_mtime < expired:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+    def clear(self) -> None:
+        '''Removes every session.'''
+        for name in os.listdir(self.root):
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+
+def load_state(session_path: str) -> Optional[Dict[str, Any]]:
+    '''
+    Returns the state stored in a session folder, or None if there is none or it cannot be read.
+
+    '''
+    try:
+        with open(os.path.join(session_path, STATE_FILE), 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"Ignoring the unreadable session state in {session_path}: {e}")
+        return None
+
+
+def save_state(session_path: str, state: Dict[str, Any]) -> None:
+    '''
+    Stores a state in a session folder, replacing the previous one atomically.
+
+    '''
+    fd, temp_path = tempfile.mkstemp(prefix='.state-', dir=session_path)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, os.path.join(session_path, STATE_FILE))
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,236 @@
+#   Copyright 2024-2026 Muhammad Luckman Qasim, Laleh Alisaraie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Reading PDB, mmCIF and BinaryCIF inputs, plain or gzip-compressed, without loading or copying whole files."""
+
+import contextlib
+import gzip
+import io
+import itertools
+import os
+import re
+import shutil
+import tempfile
+from typing import Iterator, Optional, Tuple, IO
+
+# Structure file extensions and their format
+STRUCTURE_FORMATS = {
+    '.pdb': 'pdb',
+    '.ent': 'pdb',
+    '.cif': 'cif',
+    '.mmcif': 'cif',
+    '.bcif': 'bcif',
+}
+
+# Compressed variants, e.g. 1fat.cif.gz
+COMPRESSED_EXTENSION = '.gz'
+
+# All accepted file name endings, e.g. for file pickers and directory scans
+STRUCTURE_EXTENSIONS = tuple(STRUCTURE_FORMATS) + tuple(ext + COMPRESSED_EXTENSION for ext in STRUCTURE_FORMATS)
+
+# Lines scanned for a HEADER record before the coordinates start
+HEADER_SCAN_LINES = 1000
+
+# Record written in front of PDB files without one, which mkdssp requires
+PDB_HEADER_LINE = "HEADER    AUTO-GENERATED PDB FILE\n"
+
+# Chunk size of streamed copies
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# One value of an mmCIF data row: a quoted string, which may contain spaces, or a bare word
+_CIF_TOKEN = re.compile(r"'[^']*'(?=\s|$)|\"[^\"]*\"(?=\s|$)|\S+")
+
+
+def structure_format(file_path: str) -> Tuple[str, bool]:
+    '''
+    Returns the format of a structure file from its name, e.g. ("cif", True) for "1fat.cif.gz".
+
+    Raises:
+        Exception: If the file is not a (gzip-compressed) PDB, mmCIF or BinaryCIF file
+    '''
+    name = file_path.lower()
+    compressed = name.endswith(COMPRESSED_EXTENSION)
+    if compressed:
+        name = name[:-len(COMPRESSED_EXTENSION)]
+    file_format = STRUCTURE_FORMATS.get(os.path.splitext(name)[1])
+    if file_format is None:
+        raise Exception('File type must be either PDB, mmCIF or BinaryCIF, optionally gzip-compressed (.gz)')
+    return file_format, compressed
+
+
+def open_structure(file_path: str, mode: str = 'rt') -> IO:
+    '''
+    Opens a structure file for reading, decompressing gzip files on the fly.
+
+    '''
+    if file_path.lower().endswith(COMPRESSED_EXTENSION):
+        return gzip.open(file_path, mode)
+    return open(file_path, mode)
+
+
+def has_pdb_header(file_path: str) -> bool:
+    '''
+    Returns whether a PDB file has a HEADER record, reading only the lines before the first coordinates.
+
+    '''
+    with open_structure(file_path) as f:
+        for line in itertools.islice(f, HEADER_SCAN_LINES):
+            if line.startswith('HEADER'):
+                return True
+            if line.startswith(('ATOM', 'HETATM', 'MODEL')):
+                return False
+    return False
+
+
+def parse_structure(pdb_name: Optional[str], file_path: str):
+    '''
+    Parses a structure file with Biopython, streaming compressed files instead of decompressing them to disk.
+
+    Returns:
+        The Bio.PDB Structure.
+    '''
+    file_format, _ = structure_format(file_path)
+    if file_format == 'bcif':
+        parser = _binary_cif_parser()
+        with open_structure(file_path, 'rb') as f:
+            return parser.get_structure(pdb_name, io.BytesIO(f.read()))
+
+    from Bio.PDB import PDBParser, MMCIFParser
+    parser = PDBParser(QUIET=True) if file_format == 'pdb' else MMCIFParser(QUIET=True)
+    with open_structure(file_path) as f:
+        return parser.get_structure(pdb_name, f)
+
+
+def count_models(pdb_name: Optional[str], file_path: str) -> int:
+    '''
+    Returns the number of models parse_structure finds in a file, from a scan of its lines instead of a full parse:
+    the MODEL records of a PDB file, or the changes of pdbx_PDB_model_num between the atom rows of an mmCIF file.
+    BinaryCIF files are parsed.
+
+    '''
+    file_format, _ = structure_format(file_path)
+    if file_format == 'bcif':
+        return len(parse_structure(pdb_name, file_path))
+    with open_structure(file_path) as f:
+        return _count_pdb_models(f) if file_format == 'pdb' else _count_cif_models(f)
+
+
+def _count_pdb_models(lines: Iterator[str]) -> int:
+    models = 0
+    in_model = False
+    for line in lines:
+        record = line[:6].rstrip()
+        if record == 'MODEL':
+            models += 1
+            in_model = True
+        elif record == 'ENDMDL':
+            in_model = False
+        elif record in ('ATOM', 'HETATM') and not in_model:
+            # Atoms outside MODEL records, as in most single-model files, start a model like in Biopython
+            models += 1
+            in_model = True
+    return models
+
+
+def _count_cif_models(lines: Iterator[str]) -> int:
+    columns = []
+    column = None
+    models = 0
+    current = None
+    for line in lines:
+        if line.startswith('_atom_site.'):
+            columns.append(line.split('.', 1)[1].strip())
+            continue
+        if not columns:
+            continue
+        if column is None:
+            if 'pdbx_PDB_model_num' not in columns:
+                # Every atom belongs to the first model
+                return 1
+            column = columns.index('pdbx_PDB_model_num')
+        if line.startswith(('#', 'loop_', '_', 'data_')):
+            break
+        values = _CIF_TOKEN.findall(line)
+        if len(values) > column and values[column] != current:
+            current = values[column]
+            models += 1
+    return models
+
+
+def _binary_cif_parser():
+    try:
+        from Bio.PDB.binary_cif import BinaryCIFParser
+    except ImportError:
+        raise Exception('BinaryCIF input requires Biopython 1.85 or newer')
+    return BinaryCIFParser()
+
+
+@contextlib.contextmanager
+def dssp_input(file_path: str, model=None, decompress: bool = False, model_only: bool = False) -> Iterator[Tuple[str, str]]:
+    '''
+    Provides a file that the DSSP executable can read, as a (path, file type) tuple for Bio.PDB.DSSP.
+
+    The original file is used whenever possible; mkdssp 4 reads gzip-compressed files itself. A temporary,
+    uncompressed file is only written, by a streamed copy, for PDB files without a HEADER record, when decompress
+    is True, or from the parsed model for BinaryCIF input and for model_only.
+
+    Args:
+        file_path (str): The structure file.
+        model: The parsed Bio.PDB model, required for BinaryCIF input and model_only.
+        decompress (bool): If True, compressed files are decompressed into the temporary file (for DSSP < 4).
+        model_only (bool): If True, only the given model is written, since DSSP assigns the first model of a file.
+
+    '''
+    file_format, compressed = structure_format(file_path)
+    file_type = 'PDB' if file_format == 'pdb' else 'MMCIF'
+
+    if file_format == 'bcif' or model_only:
+        from Bio.PDB import MMCIFIO, PDBIO
+        temp_fd, temp_path = tempfile.mkstemp(suffix='.pdb' if file_format == 'pdb' else '.cif')
+        try:
+            with os.fdopen(temp_fd, 'w') as out:
+                if file_format == 'pdb':
+                    out.write(PDB_HEADER_LINE)
+                    writer = PDBIO()
+                else:
+                    writer = MMCIFIO()
+                writer.set_structure(model)
+                writer.save(out)
+            yield temp_path, file_type
+        finally:
+            _unlink(temp_path)
+        return
+
+    header = file_format == 'pdb' and not has_pdb_header(file_path)
+    if not header and not (compressed and decompress):
+        yield file_path, file_type
+        return
+
+    temp_fd, temp_path = tempfile.mkstemp(suffix='.pdb' if file_format == 'pdb' else '.cif')
+    try:
+        with os.fdopen(temp_fd, 'wb') as out:
+            if header:
+                out.write(PDB_HEADER_LINE.encode('ascii'))
+            with open_structure(file_path, 'rb') as f:
+                shutil.copyfileobj(f, out, COPY_CHUNK_SIZE)
+        yield temp_path, file_type
+    finally:
+        _unlink(temp_path)
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
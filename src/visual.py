@@ -12,23 +12,33 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-from jinja2 import Environment, FileSystemLoader
 from markupsafe import Markup
-from Bio.PDB import PDBParser, MMCIFParser
-from Bio.PDB.DSSP import DSSP
+import functools
+import logging
 import math
-import pdfkit
-import imgkit
-import pdf2image
-import requests
 import os
-import logging
-import tempfile
 import shutil
+import sqlite3
+import subprocess
 import re
+import tempfile
+import time
 import uuid
-from typing import Optional, Dict, Any, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Iterator, List, Tuple, Union
+from src import metrics
+from src import renderer
 from src.assets import ICONS
+from src.cache import CACHE_DIR, get_dssp_cache
+from src.chains import ChainData
+from src.dssp import assign as builtin_dssp, engine_version, resolve_engine
+from src.ensemble import EnsembleSummary, frame_items, model_items, summarize
+from src.export import chain_record, write_export
+from src.raster import rasterize_pdf, stitch_pages
+from src.segments import Segment, chain_segments, split_rows
+from src.selection import format_selection, parse_selection, select, selected_indices
+from src.structure_io import dssp_input, parse_structure, structure_format
+from src.metadata import EntryMetadata, MetadataClient, get_metadata_client
 
 # Rendering dimension constants
 CELL_WIDTH = 20  # Width of each residue cell in pixels
@@ -42,9 +52,189 @@ LEGEND_HEIGHT = 77  # Height of legend section in pixels
 FOOTER_HEIGHT = 79  # Height of footer section in pixels
 EXTRA_PADDING_HEIGHT = 400  # Extra vertical padding in pixels
 SCALE_FACTOR = 2  # Division factor for final output dimensions
+AGREEMENT_ROW_HEIGHT = 24  # Height of the ensemble agreement row under each data row in pixels
+AGREEMENT_BAR_HEIGHT = 20  # Height of a full agreement bar in pixels
+CHAIN_LABEL_LINE_HEIGHT = 24  # Height of each further line of a chain header listing several chains in pixels
+CHAIN_LABEL_CHAR_WIDTH = 12  # Width of a chain header character (20px monospace) in pixels
+
+# Rendering backends: 'wkhtml' renders the HTML template with wkhtmltoimage/wkhtmltopdf,
+# 'native' draws the same layout in Python (see src/native.py)
+BACKENDS = ('wkhtml', 'native')
+
+# Output file formats of render_plan; "svg" requires the native backend
+RENDER_FORMATS = ('png', 'jpg', 'pdf', 'svg')
+
+# How images of several pages (or tiles) are written: joined vertically into one image, or one image each
+PAGE_MODES = ('stitch', 'separate')
+
+# Folder that images are written to unless a path is given
+OUTPUT_FOLDER = 'output'
+
+# Format of VisualMap.session_state(); states of other formats are ignored
+STATE_FORMAT = 2
+
+# Compiled templates, kept between runs so that only the first one compiles template.html.jinja
+TEMPLATE_CACHE_DIR = os.path.join(CACHE_DIR, 'templates')
+
+# Legend entries of the template and the icon each one shows
+LEGEND_ICONS = {'H': 'H', 'B': 'B_A', 'E': 'E_A', 'G': 'G', 'I': 'I', 'T': 'T', 'S': 'S', 'P': 'P', 'U': '-'}
+
+# Write buffer of the streamed HTML document (bytes)
+HTML_BUFFER_SIZE = 1 << 20
+
+# Tiles of a tiled layout rendered at the same time
+TILE_WORKERS = os.cpu_count() or 1
+
+
+def _suffix_gradient_ids(svg_string: str, suffix: str) -> str:
+    """
+    Append a suffix to every gradient ID (and the references to it) in an SVG string.
+
+    Args:
+        svg_string (str): The SVG markup containing grad-* IDs
+        suffix (str): The suffix appended to each gradient ID
+
+    Returns:
+        The SVG markup with unique gradient IDs.
+    """
+    # Pattern matches id="grad-..." in definitions
+    svg_string = re.sub(r'id="(grad-[^"]+)"', lambda m: f'id="{m.group(1)}-{suffix}"', svg_string)
+    # Pattern matches url(#grad-...) in fill references
+    svg_string = re.sub(r'url\(#(grad-[^)]+)\)', lambda m: f'url(#{m.group(1)}-{suffix})', svg_string)
+    # Pattern matches xlink:href="#grad-..." in gradient references
+    svg_string = re.sub(r'xlink:href="#(grad-[^"]+)"', lambda m: f'xlink:href="#{m.group(1)}-{suffix}"', svg_string)
+    return svg_string
+
+
+def chain_label_lines(chain_ids: List[str], residues_per_line: int) -> List[str]:
+    '''
+    Returns the header of a chain block, e.g. ["Chain A:"], or for a group of identical chains
+    ["Chains A, B, C, D:"], broken into lines as wide as the chain table.
+
+    '''
+    if len(chain_ids) == 1:
+        return [f'Chain {chain_ids[0]}:']
+    width = (CELL_WIDTH * residues_per_line + COUNT_COLUMN_WIDTH + UNIPROT_COLUMN_WIDTH) // CHAIN_LABEL_CHAR_WIDTH
+    words = [f'{chain_id},' for chain_id in chain_ids[:-1]] + [f'{chain_ids[-1]}:']
+    lines = []
+    line = 'Chains'
+    for word in words:
+        if len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f'{line} {word}'
+    lines.append(line)
+    return lines
+
+
+def uniprot_chain_index(data: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    '''
+    Returns the UniProt accession of every chain in a PDBe UniProt mapping, keyed by chain ID. A chain mapped to
+    several accessions gets the first one.
+
+    '''
+    index = {}
+    for structure_data in (data or {}).values():
+        for uniprot_id, uniprot_data in structure_data['UniProt'].items():
+            for mapping in uniprot_data['mappings']:
+                index.setdefault(mapping['chain_id'], uniprot_id)
+    return index
+
+
+@functools.lru_cache(maxsize=32)
+def _legend_icons(colors: Tuple[str, ...]) -> Dict[str, Markup]:
+    '''
+    Returns the inline legend icons for the colors of LEGEND_ICONS, in its order. They are colored once per color
+    scheme and shared by every document, whose residue icons get gradient IDs of their own.
+
+    '''
+    return {name: VisualMap._inject_svg_color(ICONS[icon_key], color)
+            for (name, icon_key), color in zip(LEGEND_ICONS.items(), colors)}
+
+
+@functools.lru_cache(maxsize=256)
+def _colored_icon_parts(svg_string: str, color: str) -> Tuple[str, ...]:
+    '''
+    Returns an icon with the color injected and whitespace stripped, split where each gradient ID ends, so that
+    icons of the same color only differ in the suffix joined in between (see VisualMap._inject_svg_color).
+
+    '''
+    marker = '\x00'
+    return tuple(_suffix_gradient_ids(svg_string.format(color=color), marker).strip().split(f'-{marker}'))
+
+
+class IconSprite:
+    '''
+    Collects secondary structure icons as SVG <symbol> definitions, so each (structure type, color)
+    pair is defined once per document and every residue cell refers to it with <use>.
+
+    '''
+    def __init__(self) -> None:
+        self._symbols = {}
+
+    def use(self, icon_key: str, color: str) -> Markup:
+        '''
+        Returns a small inline SVG referencing the symbol for the icon, defining the symbol on first use.
+
+        Args:
+            icon_key (str): The key of the icon in ICONS (e.g. 'H', 'E_A', '-')
+            color (str): The color code to inject (e.g., '#0000ff')
+
+        Returns:
+            Markup: The <svg><use/></svg> reference, marked as safe HTML for Jinja2 rendering
+        '''
+        symbol_id = self.symbol_id(icon_key, color)
+        return Markup(f'<svg class="icon" width="45" height="70" viewBox="0 0 45 70"><use xlink:href="#{symbol_id}"/></svg>')
+
+    @staticmethod
+    def _to_symbol(svg_string: str, color: str, symbol_id: str) -> str:
+        '''
+        Converts a standalone icon SVG into a <symbol> with the color injected and gradient IDs scoped to the symbol.
+
+        '''
+        svg_with_color = _suffix_gradient_ids(svg_string.format(color=color), symbol_id).strip()
+        view_box = re.search(r'viewBox="([^"]+)"', svg_with_color)
+        view_box = view_box.group(1) if view_box else '0 0 45 70'
+        body = re.sub(r'^<svg[^>]*>', '', svg_with_color)
+        body = re.sub(r'</svg>$', '', body)
+        return f'<symbol id="{symbol_id}" viewBox="{view_box}">{body}</symbol>'
+
+    def definitions(self) -> Markup:
+        '''
+        Returns the hidden <svg> block holding every symbol used so far. The template renders it last,
+        so icons referenced anywhere in the document are included.
+
+        '''
+        # Hidden by size rather than display:none, which would stop WebKit painting the gradients
+        return Markup(
+            '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+            'style="position: absolute; width: 0; height: 0; overflow: hidden;" aria-hidden="true"><defs>'
+            + self.symbols() +
+            '</defs></svg>'
+        )
+
+    def symbols(self) -> str:
+        '''
+        Returns the <symbol> definitions used so far, for embedding in a standalone SVG document.
+
+        '''
+        return ''.join(self._symbols.values())
+
+    def symbol_id(self, icon_key: str, color: str) -> str:
+        '''
+        Returns the ID of the symbol for the icon, defining the symbol on first use.
 
-# API timeout for network requests (seconds)
-API_TIMEOUT = 10
+        '''
+        # The '-' (unsolved) key and the color code are reduced to characters valid in an XML ID
+        icon_name = 'U' if icon_key == '-' else icon_key
+        symbol_id = f"i-{icon_name}-{re.sub(r'[^0-9A-Za-z]', '', color).lower()}"
+        if symbol_id not in self._symbols:
+            self._symbols[symbol_id] = self._to_symbol(ICONS[icon_key], color, symbol_id)
+        return symbol_id
+
+    def __len__(self) -> int:
+        return len(self._symbols)
 
 
 def _check_poppler_available() -> bool:
@@ -57,6 +247,124 @@ def _check_poppler_available() -> bool:
     return shutil.which('pdftoppm') is not None or shutil.which('pdftocairo') is not None
 
 
+def _tile_path(path: str, number: int, digits: int = 3) -> str:
+    '''
+    Returns the path of one tile of an output, e.g. "output/1fat_002.png" for tile 2 of "output/1fat.png".
+
+    '''
+    stem, extension = os.path.splitext(path)
+    return f'{stem}_{number:0{digits}d}{extension}'
+
+
+def _merge_pdfs(part_paths: List[str], path: str) -> None:
+    '''
+    Joins single-page PDFs into one document with pdfunite (poppler-utils), removing the parts.
+
+    '''
+    if len(part_paths) == 1:
+        os.replace(part_paths[0], path)
+        return
+    try:
+        subprocess.run([shutil.which('pdfunite') or 'pdfunite', *part_paths, path], check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise RuntimeError(f"Failed to join the tile PDFs: {e}")
+    finally:
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+
+def _write_pages(pdf_bytes: bytes, path: str, dpi: int, pages: str):
+    '''
+    Rasterizes a PDF at a DPI straight to files, one page at a time, instead of decoding every page in memory.
+
+    Args:
+        pdf_bytes (bytes): The PDF document.
+        path (str): The output image path.
+        dpi (int): The resolution.
+        pages (str): "stitch" joins the pages vertically into path; "separate" writes one numbered image per page
+            ("<name>_001.png", ...), or path itself for a single page.
+
+    Returns:
+        The written path, or the list of page paths.
+    '''
+    folder = tempfile.mkdtemp(prefix='.pages-', dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        if pages == 'stitch':
+            fmt = 'ppm'
+        else:
+            fmt = 'jpeg' if path.lower().endswith(('.jpg', '.jpeg')) else 'png'
+        try:
+            page_paths = rasterize_pdf(pdf_bytes, dpi, folder, fmt)
+        except Exception as e:
+            raise RuntimeError(f"Failed to render high-DPI image: {e}")
+        if not page_paths:
+            raise RuntimeError("Failed to render high-DPI image: the PDF has no pages")
+
+        if pages == 'stitch':
+            stitch_pages(page_paths, path, dpi)
+            return path
+        if len(page_paths) == 1:
+            os.replace(page_paths[0], path)
+            return path
+        digits = max(3, len(str(len(page_paths))))
+        paths = []
+        for number, page_path in enumerate(page_paths, 1):
+            paths.append(_tile_path(path, number, digits))
+            os.replace(page_path, paths[-1])
+        return paths
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def assign_model(structure, file_path: str, model_index: int = 0, engine: Optional[str] = None) -> Dict[str, ChainData]:
+    '''
+    Runs DSSP on one model of a parsed structure. Models after the first are written to a temporary file on their
+    own, since DSSP only assigns the first model of a file.
+
+    Args:
+        structure: The Bio.PDB Structure parsed from file_path.
+        file_path (str): The structure file.
+        model_index (int): The model to assign.
+        engine (str): "mkdssp", "builtin" (in-process, see src/dssp.py) or "auto"; the default is DSSP_ENGINE.
+
+    Returns:
+        The chains' assignments keyed by chain ID, see VisualMap._get_dssp_output.
+    '''
+    model = structure[model_index]
+    if resolve_engine(engine) == 'builtin':
+        return builtin_dssp(model)
+
+    from Bio.PDB.DSSP import DSSP
+
+    try:
+        with dssp_input(file_path, model, model_only=model_index != 0) as (dssp_path, file_type):
+            dssp = DSSP(model, dssp_path, file_type=file_type)
+    except Exception as e:
+        if not structure_format(file_path)[1]:
+            raise Exception(f"DSSP failed: {e}")
+        # DSSP versions before 4 cannot read compressed files
+        try:
+            with dssp_input(file_path, model, decompress=True, model_only=model_index != 0) as (dssp_path, file_type):
+                dssp = DSSP(model, dssp_path, file_type=file_type)
+        except Exception as e:
+            raise Exception(f"DSSP failed after decompressing the input: {e}")
+
+    # Collect the DSSP output per chain, then store each chain as columns
+    columns = {}
+    for key in dssp.keys():
+        chain_id = key[0][0]
+        res_nums, res_names, res_strucs = columns.setdefault(chain_id, ([], [], []))
+        res_nums.append(key[1][1])
+        res_names.append(dssp[key][1])
+        res_strucs.append(dssp[key][2])
+
+    return {
+        chain_id: ChainData(chain_id, res_nums, ''.join(res_names), ''.join(res_strucs))
+        for chain_id, (res_nums, res_names, res_strucs) in columns.items()
+    }
+
+
 class VisualMap:
     '''
     Computes a Visualization mapping, residues with their secondary structure types.
@@ -84,128 +392,423 @@ class VisualMap:
     }
 
     @classmethod
-    def _get_jinja_env(cls) -> Environment:
-        """Get cached Jinja2 environment, creating it if necessary."""
+    def _get_jinja_env(cls) -> 'Environment':
+        """Get cached Jinja2 environment, creating it if necessary, with its compiled templates cached on disk."""
         if cls._jinja_env is None:
-            cls._jinja_env = Environment(loader=FileSystemLoader(cls._TEMPLATE_DIR))
+            from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+            bytecode_cache = None
+            try:
+                os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+            except OSError as e:
+                logging.warning(f"Template cache disabled, {TEMPLATE_CACHE_DIR} is not usable: {e}")
+            cls._jinja_env = Environment(loader=FileSystemLoader(cls._TEMPLATE_DIR), bytecode_cache=bytecode_cache)
         return cls._jinja_env
     
-    def __init__(self, file_path: str, pdb_name: str = None, subtitle: str = None, scientific_name: str = None) -> None:
+    def __init__(self, file_path: str, pdb_name: str = None, subtitle: str = None, scientific_name: str = None,
+                 model_index: Union[int, str] = 0, use_cache: bool = True, metadata: Optional[MetadataClient] = None,
+                 colors: Optional[Dict[str, str]] = None, frames: Optional[List[str]] = None,
+                 dssp_engine: Optional[str] = None, state: Optional[Dict[str, Any]] = None,
+                 lookups: Optional[Tuple[str, ...]] = None, group_chains: bool = False,
+                 selection: Optional[str] = None) -> None:
         '''
         
         Args:
             pdb_name (str): The PDB code of the file.
             file_path (str): The file path of the PDB file.
+            model_index (int): The model of the structure to assign, the default is the first model. "all" assigns
+                every model (e.g. of an NMR ensemble) and shows the consensus structure (see src/ensemble.py).
+            use_cache (bool): Whether to reuse and store DSSP assignments in the on-disk cache (see src/cache.py).
+            metadata (MetadataClient): The client for the PDBe/RCSB APIs, the default is the shared client (see src/metadata.py).
+            colors (dict): Colors overriding the defaults in COLORS for this instance only, e.g. {"H_COLOR": "#00aa00"}.
+            frames (list): Frame files (or glob patterns) of a trajectory, whose consensus structure is shown instead
+                of file_path's, which then only names the outputs.
+            dssp_engine (str): "mkdssp", "builtin" (in-process NumPy DSSP, see src/dssp.py) or "auto" (mkdssp if
+                installed); the default is the PROS2VI_DSSP_ENGINE environment variable, else "auto".
+            state (dict): The session_state() of an earlier instance for the same file, whose secondary structure,
+                metadata and layouts are reused instead of computed again. Ignored if it was computed for other models,
+                frames or DSSP engine; its metadata is only reused for the same pdb_name.
+            lookups (tuple): The metadata lookups started with the instance (see EntryMetadata.LOOKUPS), the default
+                is all of them; ("uniprot",) is all that export needs. Others start when first needed.
+            group_chains (bool): If True, chains with the same residues, secondary structure and UniProt ID (e.g. the
+                subunits of a homo-oligomer) are laid out and rendered once, as one block headed by all their chain
+                IDs (see get_chain_groups).
+            selection (str): The chains and residue ranges to show, e.g. "A:1-300,C" (see src/selection.py). DSSP still
+                assigns the whole model, so the selected residues keep their context; everything after it (layout,
+                page size, rendering and export) only handles the selected residues. The default shows every chain.
+
+        Raises:
+            ValueError: If the selection is malformed, names a chain that is not in the structure or selects nothing
+
+        Attributes:
+            timings (dict): The total seconds this instance spent in each pipeline stage so far, e.g.
+                {"load": 0.52, "parse": 0.08, "dssp": 0.43, "prepare": 0.05}; every stage is also a span (see src/metrics.py).
 
         '''
-        self.structure_list = self._get_dssp_output(pdb_name, file_path)
+        self.timings: Dict[str, float] = {}
+        selectors = parse_selection(selection) if selection else None
+        self.selection = format_selection(selectors) if selectors else None
+        self.metadata = metadata if metadata is not None else get_metadata_client()
+        self.dssp_engine = resolve_engine(dssp_engine)
+        # What the secondary structure is computed from, to tell whether a session state applies
+        self._source = (model_index, tuple(frames) if frames else None, self.dssp_engine)
+        if state is not None and (state.get('format') != STATE_FORMAT or state['source'] != self._source):
+            state = None
+        known_metadata = None
+        if state is not None and pdb_name and (state['metadata_identifier'] or '').lower() == pdb_name.lower() \
+                and set(state['metadata']) == set(EntryMetadata.LOOKUPS):
+            known_metadata = state['metadata']
+        if known_metadata is not None:
+            self._metadata_request = EntryMetadata(self.metadata, pdb_name, 0, results=known_metadata)
+        else:
+            # Start the metadata lookups now, so they run concurrently with each other and with parsing and DSSP
+            self._metadata_request = self.metadata.fetch_async(pdb_name, lookups=lookups)
+        self.colors = {**VisualMap.COLORS, **(colors or {})}
+        self.model_index = model_index
+        # The per-residue structure counts of all models or frames, if more than one model is assigned
+        self.ensemble: Optional[EnsembleSummary] = None
+        # Color-independent rows of every chain of whole pages, per residues_per_line (see _chain_layout)
+        self._layouts: Dict[int, Dict[str, List[Dict[str, Any]]]] = {}
+        if state is not None:
+            self.structure_list, self.ensemble = state['structure_list'], state['ensemble']
+        elif frames or model_index == 'all':
+            items = frame_items(frames) if frames else model_items(pdb_name, file_path)
+            with self._span('dssp', engine=self.dssp_engine, models=len(items)):
+                self.ensemble = summarize(pdb_name, items, use_cache=use_cache, engine=self.dssp_engine)
+            self.structure_list = self.ensemble.consensus()
+        else:
+            self.structure_list = self._load_structure(pdb_name, file_path, use_cache)
+        # The whole assignment, kept for session states; the rendered one is narrowed to the selection
+        self._full_structure_list, self._full_ensemble = self.structure_list, self.ensemble
+        if selectors:
+            with self._span('select'):
+                indices = selected_indices(self.structure_list, selectors)
+                self.structure_list = select(self.structure_list, indices)
+                if self.ensemble is not None:
+                    self.ensemble = self.ensemble.select(indices)
+        if state is not None and state.get('selection') == self.selection:
+            self._layouts.update(state['layouts'])
         self.file_path = file_path
         self.pdb_name = pdb_name
         self.subtitle = subtitle
         self.scientific_name = scientific_name
+        # Metadata is fetched at most once per instance and shared by every render
+        self._uniprot_data = None
+        self._uniprot_fetched = False
+        self._metadata_resolved = False
+        self._segments = None
+        self.group_chains = group_chains
+        self._chain_groups = None
+        self._uniprot_ids = None
+
+    def _load_structure(self, pdb_name: str, file_path: str, use_cache: bool) -> Dict[str, ChainData]:
+        '''
+        Private method that returns the DSSP assignments from the cache, running DSSP and storing the result on a miss.
+
+        '''
+        with self._span('load') as span:
+            dssp_cache = get_dssp_cache() if use_cache else None
+            if dssp_cache is None:
+                return self._get_dssp_output(pdb_name, file_path, self.model_index)
+
+            # A locked or corrupt cache database must not fail the render: DSSP runs uncached instead
+            try:
+                key = dssp_cache.key(file_path, self.model_index, version=engine_version(self.dssp_engine))
+                structure_list = dssp_cache.get(key)
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"DSSP cache lookup failed, running DSSP uncached: {e}")
+                return self._get_dssp_output(pdb_name, file_path, self.model_index)
+            span.update(cache='dssp', hit=structure_list is not None)
+            if structure_list is None:
+                structure_list = self._get_dssp_output(pdb_name, file_path, self.model_index)
+                try:
+                    dssp_cache.put(key, structure_list)
+                except (OSError, sqlite3.Error) as e:
+                    logging.warning(f"DSSP cache write failed: {e}")
+            return structure_list
+
+    def _span(self, stage: str, **labels: Any):
+        '''
+        Private method that times a block as a pipeline stage of this instance, adding it to self.timings.
+
+        '''
+        return metrics.span(stage, self.timings, **labels)
+
+    def session_state(self) -> Dict[str, Any]:
+        '''
+        Returns what this instance computed from its structure file and the PDBe/RCSB APIs: the secondary structure,
+        the finished metadata lookups and the layouts of the pages rendered so far. The state is picklable; an
+        instance created from it (see the state parameter) skips parsing, DSSP and the metadata lookups, so that
+        re-rendering with other colors, titles or residues per line only lays out and rasterizes the pages. It holds
+        the secondary structure of every chain whatever the selection, and its layouts are reused for the same
+        selection only.
+
+        '''
+        return {
+            'format': STATE_FORMAT,
+            'source': self._source,
+            'structure_list': self._full_structure_list,
+            'ensemble': self._full_ensemble,
+            'selection': self.selection,
+            'metadata_identifier': self._metadata_request.identifier,
+            'metadata': self._metadata_request.results(),
+            'layouts': dict(self._layouts),
+        }
+
+    def _get_uniprot_mapping(self) -> Optional[Dict[str, Any]]:
+        '''
+        Private method that returns the UniProt mapping of the entry, fetching it on first use only.
+
+        '''
+        if not self._uniprot_fetched:
+            with self._span('metadata_wait', call='uniprot'):
+                self._uniprot_data = self.get_uniprot_data(self.pdb_name)
+            self._uniprot_fetched = True
+        return self._uniprot_data
+
+    def _get_uniprot_ids(self) -> Dict[str, str]:
+        '''
+        Private method that returns the UniProt accession of every mapped chain, indexed once from the UniProt mapping
+        rather than searched for each chain.
+
+        '''
+        if self._uniprot_ids is None:
+            self._uniprot_ids = uniprot_chain_index(self._get_uniprot_mapping())
+        return self._uniprot_ids
 
-    def _prepare_chain_data(self, residues_per_line: int = 50) -> List[Dict[str, Any]]:
+    def get_chain_groups(self) -> Dict[str, List[str]]:
         '''
-        Prepare structured data for template rendering.
+        Returns the chains that are rendered, each with the chains its block stands for. Without group_chains every
+        chain stands for itself; with it, chains with the same residue numbers, sequence, secondary structure,
+        UniProt ID and (for ensembles) agreement are rendered once, under the first of them.
 
         Returns:
-            List of chain data dictionaries, each containing:
-            - chain_id: Chain identifier
-            - uniprot_id: UniProt ID if available
-            - rows: List of row data, each with annotation_cells, structure_cells, residue_cells, start_res_num, end_res_num
+            The member chain IDs keyed by the rendered chain ID, in structure order.
+            Example: {"A": ["A", "B", "C", "D"], "E": ["E"]}
+        '''
+        if self._chain_groups is None:
+            if not self.group_chains:
+                self._chain_groups = {chain_id: [chain_id] for chain_id in self.structure_list}
+                return self._chain_groups
+            uniprot_ids = self._get_uniprot_ids()
+            representatives = {}
+            groups = {}
+            for chain_id, chain in self.structure_list.items():
+                key = (chain.sequence, chain.ss, chain.res_nums.tobytes(), uniprot_ids.get(chain_id),
+                       self.ensemble.agreement(chain_id).tobytes() if self.ensemble is not None else None)
+                groups.setdefault(representatives.setdefault(key, chain_id), []).append(chain_id)
+            self._chain_groups = groups
+        return self._chain_groups
+
+    def _chain_layout(self, residues_per_line: int = 50,
+                      tile: Optional[List[Tuple[str, int, int]]] = None) -> List[Dict[str, Any]]:
+        '''
+        Private method that returns the color-independent part of the chain data (see _prepare_chain_data): the rows of
+        every rendered chain (see get_chain_groups) with their annotation and residue cells, and the icon keys of their
+        structure cells. The chains of whole pages are kept (and saved by session_state), so rendering again with
+        other colors reuses them; tiles are laid out on every call, to keep memory bounded by the tile size.
+
+        '''
+        if tile is None:
+            chain_ids = list(self.get_chain_groups())
+            chain_layouts = self._layouts.setdefault(residues_per_line, {})
+            entries = [(chain_id, 0, None) for chain_id in chain_ids if chain_id not in chain_layouts]
+        else:
+            chain_ids = [chain_id for chain_id, _, _ in tile]
+            chain_layouts = {}
+            entries = tile
+
+        if entries:
+            with self._span('layout'):
+                self._lay_out_chains(entries, residues_per_line, chain_layouts)
+        return [{'chain_id': chain_id, 'rows': chain_layouts[chain_id]} for chain_id in chain_ids]
+
+    def _lay_out_chains(self, entries: List[Tuple[str, int, Optional[int]]], residues_per_line: int,
+                        chain_layouts: Dict[str, List[Dict[str, Any]]]) -> None:
         '''
-        unitprot_data = self.get_uniprot_data(self.pdb_name)
-        chains_data = []
+        Private method that lays out the rows of (chain ID, first row, end row) entries into chain_layouts.
 
-        for chain_id, chain in self.structure_list.items():
+        '''
+        segments = self.get_segments()
+        for chain_id, first_row, end_row in entries:
+            chain = self.structure_list[chain_id]
             rows = []
-            
-            for row_start in range(0, len(chain), residues_per_line):
-                row_end = min(row_start + residues_per_line, len(chain))
-                row_residues = chain[row_start:row_end]
-                
-                # Build cells for this row
+            for row_start, row_end, parts in split_rows(segments[chain_id], len(chain), residues_per_line, first_row, end_row):
+                # One annotation cell per segment part
                 annotation_cells = []
-                structure_cells = []
-                residue_cells = []
-                
-                curr_structure_start = 0
-                index_count = {'H': 0, 'B': 0, 'E': 0, 'I': 0, 'G': 0, 'S': 0, 'T': 0}
-                
-                for i, res in enumerate(row_residues):
-                    global_index = row_start + i
-                    
-                    # Get the structure icon
-                    is_last_in_chain = global_index == len(chain) - 1
-                    is_structure_change = is_last_in_chain or chain[global_index]['res_struc'] != chain[global_index + 1]['res_struc']
-                    
-                    if is_structure_change and chain[global_index]['res_struc'] in ['B', 'E']:
-                        svg_string = ICONS[f"{res['res_struc']}_A"]
-                        color = VisualMap.COLORS[f"{res['res_struc']}_A_COLOR"]
-                    else:
-                        svg_string = ICONS[res['res_struc']]
-                        color = VisualMap.COLORS[f"{res['res_struc']}_COLOR"]
-                    
-                    structure_icon = self._inject_svg_color(svg_string, color)
-                    
-                    # Handle annotation cells (with colspan)
-                    is_row_end = i == len(row_residues) - 1
-                    if is_structure_change or is_row_end:
-                        col_span = i + 1 - curr_structure_start
-                        curr_structure_start = i + 1
-                        
-                        annotation_text = ''
-                        if chain[global_index]["res_struc"] in index_count.keys() and is_structure_change and not is_last_in_chain:
-                            if chain[global_index]['res_struc'] != chain[global_index + 1]['res_struc']:
-                                index_count[chain[global_index]['res_struc']] += 1
-                                annotation_text = f"{chain[global_index]['res_struc']}{index_count[chain[global_index]['res_struc']]}"
-                        
-                        annotation_cells.append({'colspan': col_span, 'text': annotation_text})
-                    
-                    # Add structure and residue cells
-                    structure_cells.append({'icon': structure_icon})
-                    residue_cells.append({'name': res["res_name"]})
-                
+                icon_keys = []
+                for part in parts:
+                    annotation_cells.append({'colspan': part.end - part.start, 'text': part.label})
+                    icon_keys.extend(part.icon_keys())
+                residue_cells = [{'name': name} for name in chain.sequence[row_start:row_end]]
+
                 # Pad to residues_per_line
-                padding_needed = residues_per_line - len(row_residues)
-                for _ in range(padding_needed):
-                    structure_cells.append({'icon': ''})
-                    residue_cells.append({'name': ''})
-                    annotation_cells.append({'colspan': 1, 'text': ''})
-                
-                # Get start and end residue numbers
-                start_res_num = chain[row_start]['res_num']
-                end_res_num = chain[row_end - 1]['res_num']
-                
+                padding_needed = residues_per_line - (row_end - row_start)
+                annotation_cells.extend({'colspan': 1, 'text': ''} for _ in range(padding_needed))
+                residue_cells.extend({'name': ''} for _ in range(padding_needed))
+
                 rows.append({
                     'annotation_cells': annotation_cells,
-                    'structure_cells': structure_cells,
+                    'icon_keys': icon_keys,
                     'residue_cells': residue_cells,
-                    'start_res_num': start_res_num,
-                    'end_res_num': end_res_num
+                    'row_start': row_start,
+                    'row_end': row_end,
+                    'padding': padding_needed,
+                    'start_res_num': int(chain.res_nums[row_start]),
+                    'end_res_num': int(chain.res_nums[row_end - 1])
                 })
-            
-            uniprot_id = self.get_uniprot_id_by_chain_id(unitprot_data, chain_id)
-            chains_data.append({
-                'chain_id': chain_id,
-                'uniprot_id': uniprot_id,
-                'rows': rows
-            })
-        
-        return chains_data
+            chain_layouts[chain_id] = rows
+
+    def _prepare_chain_data(self, residues_per_line: int = 50, sprite: Optional[IconSprite] = None,
+                            tile: Optional[List[Tuple[str, int, int]]] = None) -> Iterator[Dict[str, Any]]:
+        '''
+        Prepare structured data for template rendering, coloring the rows of _chain_layout. Chains and rows are
+        generated as the template consumes them, so only the row being written holds its icons in memory; the
+        time spent preparing them is recorded as the "prepare" stage once the chains are exhausted.
+
+        Args:
+            residues_per_line (int): The number of residues per row.
+            sprite (IconSprite): If given, residue icons are <use> references into this sprite instead of full inline SVGs.
+            tile (list): If given, only these rows are prepared, as (chain ID, first row, end row) tuples (see _plan_tiles).
 
-    def _update_template(self, residues_per_line: int = 50) -> str:
+        Returns:
+            A generator of chain data dictionaries, each containing:
+            - chain_id: Chain identifier
+            - chain_ids: The identifiers of the chains the block stands for (see get_chain_groups)
+            - label_lines: The lines of the block's header, e.g. ["Chain A:"]
+            - uniprot_id: UniProt ID if available
+            - rows: A generator of row data, each with annotation_cells, structure_cells, residue_cells, start_res_num,
+              end_res_num, and for ensembles agreement_cells, the share of models assigning each residue's consensus
+              structure
+        '''
+        uniprot_ids = self._get_uniprot_ids()
+        chain_groups = self.get_chain_groups()
+        layout = self._chain_layout(residues_per_line, tile)
+        seconds = [0.0]
+
+        def prepare_rows(chain_id: str, layout_rows: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+            chain = self.structure_list[chain_id]
+            agreement = self.ensemble.agreement(chain_id) if self.ensemble is not None else None
+            for layout_row in layout_rows:
+                start = time.perf_counter()
+                structure_cells = []
+                for icon_key in layout_row['icon_keys']:
+                    color = self.colors[f"{icon_key}_COLOR"]
+                    if sprite is not None:
+                        structure_icon = sprite.use(icon_key, color)
+                    else:
+                        structure_icon = self._inject_svg_color(ICONS[icon_key], color)
+                    structure_cells.append({'icon': structure_icon, 'key': icon_key, 'color': color})
+                structure_cells.extend({'icon': '', 'key': None, 'color': None} for _ in range(layout_row['padding']))
+
+                row = {
+                    'annotation_cells': layout_row['annotation_cells'],
+                    'structure_cells': structure_cells,
+                    'residue_cells': layout_row['residue_cells'],
+                    'start_res_num': layout_row['start_res_num'],
+                    'end_res_num': layout_row['end_res_num']
+                }
+                if agreement is not None:
+                    row['agreement_cells'] = [
+                        {'value': float(agreement[i]), 'height': round(float(agreement[i]) * AGREEMENT_BAR_HEIGHT),
+                         'color': self.colors[f"{chain.ss[i]}_COLOR"]}
+                        for i in range(layout_row['row_start'], layout_row['row_end'])
+                    ] + [{'value': None, 'height': 0, 'color': None}] * layout_row['padding']
+                seconds[0] += time.perf_counter() - start
+                yield row
+
+        def prepare_chains() -> Iterator[Dict[str, Any]]:
+            try:
+                for chain_layout in layout:
+                    chain_id = chain_layout['chain_id']
+                    yield {
+                        'chain_id': chain_id,
+                        'chain_ids': chain_groups[chain_id],
+                        'label_lines': chain_label_lines(chain_groups[chain_id], residues_per_line),
+                        'uniprot_id': uniprot_ids.get(chain_id),
+                        'rows': prepare_rows(chain_id, chain_layout['rows'])
+                    }
+            finally:
+                metrics.record('prepare', seconds[0], timings=self.timings)
+
+        return prepare_chains()
+
+    def _update_template(self, residues_per_line: int = 50, sprite: bool = False,
+                         tile: Optional[List[Tuple[str, int, int]]] = None) -> str:
         '''
         A private Method that updates the template and returns a string representing the updated template.
 
+        Args:
+            residues_per_line (int): The number of residues per row.
+            sprite (bool): If True, every icon (residues and legend) refers to a single <symbol> sprite per document.
+
+        '''
+        chunks = self._stream_template(residues_per_line, sprite=sprite, tile=tile)
+        with self._span('render_template'):
+            return ''.join(chunks)
+
+    def _stream_template(self, residues_per_line: int = 50, sprite: bool = False,
+                         tile: Optional[List[Tuple[str, int, int]]] = None) -> Iterator[str]:
+        '''
+        Private method that renders the template piece by piece with Jinja's generate(), preparing each row only when
+        the template reaches it (see _prepare_chain_data).
+
+        Returns:
+            An iterator of HTML strings, which joined are the document _update_template returns.
         '''
         template = self._get_jinja_env().get_template("template.html.jinja")
-        
+        icon_sprite = IconSprite() if sprite else None
+
         # Prepare structured data for chains
-        chains_data = self._prepare_chain_data(residues_per_line)
-        
+        chains_data = self._prepare_chain_data(residues_per_line, sprite=icon_sprite, tile=tile)
+
         # Get metadata
-        rcsb_data = self.get_rcsb_entry_data(self.pdb_name)
+        self._resolve_metadata()
+
+        if icon_sprite is not None:
+            legend = {name: icon_sprite.use(icon_key, self.colors[f'{icon_key}_COLOR'])
+                      for name, icon_key in LEGEND_ICONS.items()}
+        else:
+            legend = _legend_icons(tuple(self.colors[f'{icon_key}_COLOR'] for icon_key in LEGEND_ICONS.values()))
+
+        return template.generate(
+            pdb_name = self.pdb_name,
+            pdb_title = self.subtitle,
+            scientific_name = self.scientific_name,
+            chains_data = chains_data,
+            **legend,
+            sprite = icon_sprite,
+            ensemble_models = self.ensemble.models if self.ensemble is not None else None
+        )
+
+    def _write_template(self, path: str, residues_per_line: int = 50, sprite: bool = False,
+                        tile: Optional[List[Tuple[str, int, int]]] = None) -> None:
+        '''
+        Private method that streams the rendered template into an HTML file for wkhtmltoimage and wkhtmltopdf to
+        read, with the output stylesheet in front of it as imgkit and pdfkit insert it into a string source.
+
+        '''
+        with open(self._CSS_FILE, 'r', encoding='utf-8') as f:
+            css = f.read()
+        chunks = self._stream_template(residues_per_line, sprite=sprite, tile=tile)
+        with self._span('render_template'):
+            with open(path, 'w', encoding='utf-8', buffering=HTML_BUFFER_SIZE) as f:
+                f.write(f'<style>{css}</style>')
+                for chunk in chunks:
+                    f.write(chunk)
+
+    def _resolve_metadata(self) -> None:
+        '''
+        Private method that fills in the subtitle and scientific name from the RCSB entry, unless they were given.
+        Only the first call queries the API.
+
+        '''
+        if self._metadata_resolved:
+            return
+        self._metadata_resolved = True
+        with self._span('metadata_wait', call='entry'):
+            rcsb_data = self.get_rcsb_entry_data(self.pdb_name)
         if self.pdb_name:
             self.pdb_name = self.pdb_name.upper()
         if self.subtitle is None and rcsb_data:
@@ -213,36 +816,30 @@ class VisualMap:
             if struct_data and 'title' in struct_data:
                 self.subtitle = struct_data['title']
         if self.scientific_name is None:
-            self.scientific_name = self.get_scientific_name(self.pdb_name, rcsb_data)
+            with self._span('metadata_wait', call='organisms'):
+                self.scientific_name = self.get_scientific_name(self.pdb_name, rcsb_data)
 
-        content = template.render(
-            pdb_name = self.pdb_name,
-            pdb_title = self.subtitle,
-            scientific_name = self.scientific_name,
-            chains_data = chains_data,
-            H = self._inject_svg_color(ICONS['H'], VisualMap.COLORS['H_COLOR']),
-            B = self._inject_svg_color(ICONS['B_A'], VisualMap.COLORS['B_A_COLOR']),
-            E = self._inject_svg_color(ICONS['E_A'], VisualMap.COLORS['E_A_COLOR']),
-            G = self._inject_svg_color(ICONS['G'], VisualMap.COLORS['G_COLOR']),
-            I = self._inject_svg_color(ICONS['I'], VisualMap.COLORS['I_COLOR']),
-            T = self._inject_svg_color(ICONS['T'], VisualMap.COLORS['T_COLOR']),
-            S = self._inject_svg_color(ICONS['S'], VisualMap.COLORS['S_COLOR']),
-            P = self._inject_svg_color(ICONS['P'], VisualMap.COLORS['P_COLOR']),
-            U = self._inject_svg_color(ICONS['-'], VisualMap.COLORS['-_COLOR'])
-        )
-            
-        return content
-    
-    def _get_width_and_height(self, residues_per_line: int) -> Tuple[int, int]:
+    def _get_width_and_height(self, residues_per_line: int, tile: Optional[List[Tuple[str, int, int]]] = None) -> Tuple[int, int]:
         '''
         Private method that returns the width and height of the resulting visualization in the form of a table. Eg. (output_width, output_height)
+        If tile is given, the size of that tile's page (see _plan_tiles).
 
         '''
         output_width = (CELL_WIDTH * residues_per_line + COUNT_COLUMN_WIDTH + UNIPROT_COLUMN_WIDTH + PADDING_WIDTH) / SCALE_FACTOR
-        num_rows = sum(math.ceil(len(chain) / residues_per_line) for chain in self.structure_list.values())
+        chain_groups = self.get_chain_groups()
+        if tile is None:
+            chain_ids = list(chain_groups)
+            num_rows = sum(math.ceil(len(self.structure_list[chain_id]) / residues_per_line) for chain_id in chain_ids)
+        else:
+            chain_ids = [chain_id for chain_id, _, _ in tile]
+            num_rows = sum(end_row - first_row for _, first_row, end_row in tile)
+        # Headers of chain groups may take more than one line
+        label_lines = sum(len(chain_label_lines(chain_groups[chain_id], residues_per_line)) - 1 for chain_id in chain_ids)
+        row_height = ROW_HEIGHT + (AGREEMENT_ROW_HEIGHT if self.ensemble is not None else 0)
         output_height = (
-            len(self.structure_list) * CHAIN_HEADER_HEIGHT +
-            num_rows * ROW_HEIGHT +
+            len(chain_ids) * CHAIN_HEADER_HEIGHT +
+            label_lines * CHAIN_LABEL_LINE_HEIGHT +
+            num_rows * row_height +
             TITLE_HEIGHT + LEGEND_HEIGHT + FOOTER_HEIGHT + EXTRA_PADDING_HEIGHT
         ) / SCALE_FACTOR
         return (int(output_width), int(output_height))
@@ -260,157 +857,102 @@ class VisualMap:
         Returns:
             Markup: The SVG string with color injected, marked as safe HTML for Jinja2 rendering
         '''
-        # Inject the color into the SVG
-        svg_with_color = svg_string.format(color=color)
+        # Inject the color into the SVG, once per icon and color
+        parts = _colored_icon_parts(svg_string, color)
 
         # Generate a unique suffix for gradient IDs to prevent conflicts
         # when multiple SVGs of the same type are rendered on one page
         unique_suffix = uuid.uuid4().hex[:8]
 
-        # Find all gradient IDs and make them unique
-        # Pattern matches id="grad-..." in definitions
-        def replace_gradient_id(match):
-            original_id = match.group(1)
-            return f'id="{original_id}-{unique_suffix}"'
+        # Return as Markup to prevent HTML escaping in Jinja2 template
+        return Markup(f'-{unique_suffix}'.join(parts))
+    
+    def _get_dssp_output(self, pdb_name, file_path, model_index: int = 0):
+        '''
+        Private method that returns DSSP secondary structure assignments from a PDB, mmCIF or BinaryCIF file,
+        optionally gzip-compressed. Handles PDB files without headers gracefully.
 
-        # Pattern matches url(#grad-...) in fill references
-        def replace_gradient_ref(match):
-            original_id = match.group(1)
-            return f'url(#{original_id}-{unique_suffix})'
+        The structure is parsed once, streaming compressed files, and only the head of the file is read to check for
+        a HEADER record. A temporary copy is written only when DSSP cannot read the file as it is.
 
-        # Pattern matches xlink:href="#grad-..." in gradient references
-        def replace_xlink_ref(match):
-            original_id = match.group(1)
-            return f'xlink:href="#{original_id}-{unique_suffix}"'
+        Returns:
+            A dictionary containing chain IDs as keys and the chains' residues with secondary structures as values,
+            stored as ChainData columns. Indexing a chain still yields the residue dictionaries.
+            Example: {"A": ChainData("A", [1, 2, 3], "MKV", "HHH")}, where chain[0] is
+            {"chain": "A", "res_num": 1, "res_name": "M", "res_struc": "H"}
+        '''
 
-        # Apply replacements for gradient definitions, fill references, and xlink references
-        svg_with_color = re.sub(r'id="(grad-[^"]+)"', replace_gradient_id, svg_with_color)
-        svg_with_color = re.sub(r'url\(#(grad-[^)]+)\)', replace_gradient_ref, svg_with_color)
-        svg_with_color = re.sub(r'xlink:href="#(grad-[^"]+)"', replace_xlink_ref, svg_with_color)
+        # Load the structure (raises for unsupported file types)
+        with self._span('parse'):
+            structure = parse_structure(pdb_name, file_path)
+        with self._span('dssp', engine=self.dssp_engine):
+            return assign_model(structure, file_path, model_index, engine=self.dssp_engine)
 
-        # Return as Markup to prevent HTML escaping in Jinja2 template
-        # Strip whitespace to avoid spacing issues
-        return Markup(svg_with_color.strip())
-    
-    def _fix_pdb_header(self, file_path: str) -> str:
-        """
-        Create a temporary copy of the PDB file with a HEADER line if missing.
+    def get_segments(self) -> Dict[str, List[Segment]]:
+        '''
+        Returns the secondary structure segments of every chain, without rendering anything.
 
         Returns:
-            Path to the temporary file with the fixed header.
-        """
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-
-        if any(line.startswith('HEADER') for line in lines):
-            # No fix needed, return original path
-            return file_path
-
-        # Create temp file with header added
-        suffix = os.path.splitext(file_path)[1]
-        temp_fd, temp_path = tempfile.mkstemp(suffix=suffix)
-        try:
-            with os.fdopen(temp_fd, 'w') as f:
-                f.write("HEADER    AUTO-GENERATED PDB FILE\n")
-                f.writelines(lines)
-        except Exception:
-            os.unlink(temp_path)
-            raise
-        return temp_path
-    
-    def _get_dssp_output(self, pdb_name, file_path):
+            A dictionary containing chain IDs as keys and run-length encoded segments as values (see src/segments.py).
+            Example: {"A": [Segment(ss="H", start=0, end=12, ordinal=1), Segment(ss="-", start=12, end=15, ordinal=1)]}
         '''
-        Private method that returns DSSP secondary structure assignments from a PDB or mmCIF file.
-        Handles PDB files without headers gracefully.
+        if self._segments is None:
+            self._segments = chain_segments(self.structure_list)
+        return self._segments
 
-        Returns:
-            A dictionary containing chain IDs as keys and lists of residues with secondary structures as values.
-            Example: {"A": [{"chain": "A", "res_num": 1, "res_name": "A", "res_struc": "H"}, {}, {}]}
+    def export_data(self) -> Dict[str, Any]:
         '''
+        Returns the secondary structure of every chain with its segments and UniProt ID, without laying out or
+        rendering anything; only the UniProt mapping of the entry is waited for.
 
-        # Parser selection based on file type
-        if file_path.lower().endswith('.pdb'):
-            parser = PDBParser(QUIET=True)
-        elif file_path.lower().endswith('.cif'):
-            parser = MMCIFParser(QUIET=True)
-        else:
-            raise Exception('File type must be either PDB or mmCIF')
+        Returns:
+            {"pdb_name", "file", "selection", "model", "models", "dssp_engine", "chains"}, where models is the number of models or
+            frames of an ensemble (else None) and chains are the records of src/export.py's chain_record.
+        '''
+        uniprot_ids = self._get_uniprot_ids()
+        segments = self.get_segments()
+        return {
+            'pdb_name': self.pdb_name.upper() if self.pdb_name else None,
+            'file': os.path.basename(self.file_path) if self.file_path else None,
+            'selection': self.selection,
+            'model': self.model_index,
+            'models': self.ensemble.models if self.ensemble is not None else None,
+            'dssp_engine': self.dssp_engine,
+            'chains': [chain_record(chain, segments[chain_id], uniprot_ids.get(chain_id),
+                                    self.ensemble.agreement(chain_id) if self.ensemble is not None else None)
+                       for chain_id, chain in self.structure_list.items()],
+        }
 
-        # Load the structure
-        structure = parser.get_structure(pdb_name, file_path)
-        model = structure[0]
+    def export(self, path: str, export_format: Optional[str] = None) -> str:
+        '''
+        Writes the data of export_data to a file instead of rendering a visualization.
 
-        temp_file_path = None
-        try:
-            dssp = DSSP(model, file_path)
-        except Exception:
-            # Try with a header-fixed temporary copy
-            temp_file_path = self._fix_pdb_header(file_path)
-            if temp_file_path != file_path:
-                # Need to reload structure from temp file
-                structure = parser.get_structure(pdb_name, temp_file_path)
-                model = structure[0]
-            try:
-                dssp = DSSP(model, temp_file_path)
-            except Exception as e:
-                raise Exception(f"DSSP failed after header fix: {e}")
+        Args:
+            path (str): The output file.
+            export_format (str): "json", "csv" (one row per residue), "npz" (NumPy columns), "parquet" (requires pyarrow)
+                or "ndjson" (one line); the default is told from the path's extension.
 
-        # Parse DSSP output into a structured dictionary
-        structure_out = {}
-        try:
-            for key in dssp.keys():
-                chain_id = key[0][0]
-                res_dict = {
-                    'chain': chain_id,
-                    'res_num': key[1][1],
-                    'res_name': dssp[key][1],
-                    'res_struc': dssp[key][2]
-                }
-                structure_out.setdefault(chain_id, []).append(res_dict)
-        finally:
-            # Clean up temporary file if created
-            if temp_file_path and temp_file_path != file_path:
-                try:
-                    os.unlink(temp_file_path)
-                except OSError:
-                    pass
+        Returns:
+            The path written.
+        '''
+        record = self.export_data()
+        with self._span('export', format=export_format or os.path.splitext(path)[1].lstrip('.')):
+            return write_export(record, path, export_format)
 
-        return structure_out
-    
     def get_uniprot_data(self, identifier: str) -> Optional[Dict[str, Any]]:
         """Fetch UniProt mapping data from PDBe API."""
-        if not identifier:
-            return None
-        url = f"https://www.ebi.ac.uk/pdbe/api/mappings/uniprot/{identifier}"
-        try:
-            response = requests.get(url, timeout=API_TIMEOUT)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logging.warning(f"Unable to fetch UniProt data (status code: {response.status_code})")
-                return None
-        except requests.RequestException as e:
-            logging.warning(f"Request failed for UniProt data: {e}")
-            return None
+        if self._metadata_request.matches(identifier):
+            return self._metadata_request.result('uniprot')
+        return self.metadata.uniprot_mapping(identifier)
         
     def get_rcsb_entry_data(self, identifier: str) -> Optional[Dict[str, Any]]:
         """Fetch entry data from RCSB PDB API."""
-        if not identifier:
-            return None
-        url = f"https://data.rcsb.org/rest/v1/core/entry/{identifier}"
-        try:
-            response = requests.get(url, timeout=API_TIMEOUT)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logging.warning(f"Unable to fetch RCSB entry data (status code: {response.status_code})")
-                return None
-        except requests.RequestException as e:
-            logging.warning(f"Request failed for RCSB entry data: {e}")
-            return None
+        if self._metadata_request.matches(identifier):
+            return self._metadata_request.result('entry')
+        return self.metadata.rcsb_entry(identifier)
         
     def get_scientific_name(self, identifier: str, rcsb_data: Optional[Dict[str, Any]]) -> Optional[str]:
-        """Fetch scientific name from RCSB polymer entity API."""
+        """Fetch scientific name from RCSB polymer entity API, looking up all polymer entities in one batched query."""
         if not identifier or not rcsb_data:
             return None
 
@@ -420,34 +962,26 @@ class VisualMap:
             return None
         entity_ids = container_ids.get('polymer_entity_ids', [])
 
-        for entity_id in entity_ids:
-            url = f"https://data.rcsb.org/rest/v1/core/polymer_entity/{identifier}/{entity_id}"
-            try:
-                response = requests.get(url, timeout=API_TIMEOUT)
-                if response.status_code != 200:
-                    logging.warning(f"Unable to fetch polymer entity data (status code: {response.status_code})")
-                    continue
-                json_data = response.json()
-            except requests.RequestException as e:
-                logging.warning(f"Request failed for polymer entity data: {e}")
-                continue
+        if self._metadata_request.matches(identifier):
+            organisms = self._metadata_request.result('organisms')
+        else:
+            organisms = self.metadata.polymer_entity_organisms(identifier)
+        if not organisms:
+            return None
 
-            source_organisms = json_data.get('rcsb_entity_source_organism')
-            if source_organisms and len(source_organisms) > 0:
-                return source_organisms[0].get('scientific_name')
+        for entity_id in entity_ids:
+            scientific_names = organisms.get(str(entity_id))
+            if scientific_names:
+                return scientific_names[0]
 
         return None
     
     def get_uniprot_id_by_chain_id(self, data, target_chain_id):
         if data and target_chain_id:
-            for structure_id, structure_data in data.items():
-                for uniprot_id, uniprot_data in structure_data['UniProt'].items():
-                    for mapping in uniprot_data['mappings']:
-                        if mapping['chain_id'] == target_chain_id:
-                            return uniprot_id
+            return uniprot_chain_index(data).get(target_chain_id)
         return None
 
-    def generate_visual(self, residues_per_line: int = 50, output_image_name: str = '', dpi: int = 100, pdf: bool = False) -> None:
+    def generate_visual(self, residues_per_line: int = 50, output_image_name: str = '', dpi: int = 100, pdf: bool = False, sprite: bool = False, backend: str = 'wkhtml', tile: Any = None, pages: Optional[str] = None) -> None:
         '''
         Generates a visualization with the residues mapped to their secondar structure types.
 
@@ -455,6 +989,14 @@ class VisualMap:
             residues_per_line (int): An integer respresnting the number of residues per line, in the visualization, the default values is 60.
             output_image_name (string): Representing the output image path, valid types: "jpg, png, and gif".
             pdf (bool): A boolean value indicating if a PDF should be generated too. The default value is False.
+            sprite (bool): If True, icons are defined once per document as SVG symbols and referenced from each residue cell,
+                which keeps the HTML small for large structures. The default value is False.
+            backend (str): 'wkhtml' (default) renders through wkhtmltoimage/wkhtmltopdf. 'native' draws the layout in Python,
+                without any external process, and also accepts an ".svg" output image name.
+            tile: "chain" or a number of rows per tile, to render large structures as numbered images
+                ("<name>_001.png", ...) and a PDF with one page per tile. The default None renders a single page.
+            pages (str): "stitch" joins the pages (or tiles) of the image vertically into one image, "separate" writes
+                one numbered image each. The default is "stitch" without tiles and "separate" with tiles.
             color: TO BE ADDED
 
         Raises:
@@ -469,48 +1011,332 @@ class VisualMap:
         if not isinstance(pdf, bool):
             raise TypeError('The pdf parameter must be a boolean value (True/False)')
 
-        output_folder = 'output'
-        # Create folder if it doesn't exist
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-
         if output_image_name == '':
             output_image_name = f'{os.path.splitext(os.path.basename(self.file_path))[0]}.png'
-        if '.' not in output_image_name or output_image_name.split('.')[-1].lower() not in ['jpg', 'png']:
-            raise ValueError('The output image name must end with one of the following extensions: "JPG", "PNG"')
-        
-        updated_template = self._update_template(residues_per_line=residues_per_line)
-        output_width, output_height = self._get_width_and_height(residues_per_line=residues_per_line)
-
-        options = {'page-height': f'{output_height}px',
-                   'page-width': f'{output_width}px',
-                   'margin-top': '0',
-                   'margin-bottom': '0',
-                   'margin-left': '0',
-                   'margin-right': '0',
-                   'enable-local-file-access': '',
-                   'print-media-type': True,
-                   'disable-smart-shrinking': True}
-        if dpi == 100:
-            imgkit.from_string(updated_template, f'{output_folder}/{output_image_name}', css=self._CSS_FILE, options={'quality': 100})
-        else:
-            # High-DPI rendering requires poppler for pdf2image
-            if not _check_poppler_available():
-                raise RuntimeError(
-                    "High-DPI rendering (dpi != 100) requires poppler-utils to be installed. "
-                    "Install it via: apt-get install poppler-utils (Debian/Ubuntu), "
-                    "brew install poppler (macOS), or choco install poppler (Windows)."
-                )
-            try:
-                pdf_bytes = pdfkit.from_string(updated_template, css=self._CSS_FILE, options=options)
-                pages = pdf2image.convert_from_bytes(pdf_bytes, dpi=dpi)
-            except Exception as e:
-                raise RuntimeError(f"Failed to render high-DPI image: {e}")
-            if len(pages) == 1:
-                pages[0].save(f'{output_folder}/{output_image_name}')
-            else:
-                for count, page in enumerate(pages):
-                    page.save(f'{output_folder}/{output_image_name}')
+        image_formats = ['jpg', 'png', 'svg'] if backend == 'native' else ['jpg', 'png']
+        if '.' not in output_image_name or output_image_name.split('.')[-1].lower() not in image_formats:
+            extensions = ', '.join(f'"{f.upper()}"' for f in image_formats)
+            raise ValueError(f'The output image name must end with one of the following extensions: {extensions}')
 
+        outputs = [{'path': f'{OUTPUT_FOLDER}/{output_image_name}', 'dpi': dpi, 'residues_per_line': residues_per_line, 'tile': tile,
+                    'pages': pages}]
         if pdf:
-            pdfkit.from_string(updated_template, f'{self.pdb_name}.pdf', css=self._CSS_FILE, options=options)
+            outputs.append({'format': 'pdf', 'dpi': dpi, 'residues_per_line': residues_per_line, 'tile': tile})
+        self.render_plan(outputs, sprite=sprite, backend=backend)
+
+    def render_plan(self, outputs: List[Dict[str, Any]], sprite: bool = False, backend: str = 'wkhtml') -> List[str]:
+        '''
+        Renders several outputs in one pass. DSSP and the metadata lookups are shared by all outputs, the template is
+        rendered once per residues_per_line layout, and wkhtmltopdf runs at most once per layout, its PDF being reused
+        for the PDF output and for every image that is not at 100 DPI.
+
+        Args:
+            outputs (list): One dictionary per output file, with the keys:
+                - format: "png", "jpg", "pdf" or (native backend only) "svg". Defaults to the extension of path.
+                - path: The output file path. Defaults to "output/<file name>_<residues>r_<dpi>dpi.<format>"
+                  for images and "<PDB code>.pdf" for PDFs.
+                - dpi: The image resolution. Defaults to 100.
+                - residues_per_line: The layout width. Defaults to 50.
+                - tile: "chain" or a number of rows, to render the layout as separate tiles in parallel (see
+                  _render_tiles) instead of one page. Defaults to None.
+                - pages: How an image of several pages is written, "stitch" (one image, the default for untiled
+                  outputs) or "separate" (one numbered image per page or tile, the default for tiled outputs).
+            sprite (bool): If True, icons are defined once per document as SVG symbols.
+            backend (str): 'wkhtml' (default) or 'native'.
+
+        Returns:
+            The list of written file paths, in the order of outputs; a separate-pages image output adds one path
+            per page or tile.
+
+        Example:
+            vs.render_plan([{'format': 'pdf'}, {'path': 'output/1fat.png', 'dpi': 300},
+                            {'path': 'output/1fat_thumb.png', 'dpi': 30}, {'format': 'png', 'residues_per_line': 30},
+                            {'path': 'output/1fat_pages.pdf', 'tile': 20}])
+
+        Raises:
+            TypeError: If the any of the parameters are not of the correct type
+            ValueError: If any of the parameters are outside the range
+
+        '''
+        if not isinstance(sprite, bool):
+            raise TypeError('The sprite parameter must be a boolean value (True/False)')
+        if backend not in BACKENDS:
+            raise ValueError(f'The backend parameter must be one of: {", ".join(BACKENDS)}')
+        specs = [self._normalize_output(output, backend) for output in outputs]
+
+        if not os.path.exists(OUTPUT_FOLDER):
+            os.makedirs(OUTPUT_FOLDER)
+
+        written = {}
+        layouts = {}
+        for index, spec in enumerate(specs):
+            layouts.setdefault((spec['residues_per_line'], spec['tile']), []).append((index, spec))
+
+        for (residues_per_line, tile), layout_specs in layouts.items():
+            if tile is None:
+                written.update(self._render_page(residues_per_line, None, layout_specs, sprite, backend))
+            else:
+                written.update(self._render_tiles(residues_per_line, tile, layout_specs, sprite, backend))
+
+        paths = []
+        for index in range(len(specs)):
+            paths.extend(written[index] if isinstance(written[index], list) else [written[index]])
+        return paths
+
+    def _render_page(self, residues_per_line: int, tile: Optional[List[Tuple[str, int, int]]],
+                     page_specs: List[Tuple[int, Dict[str, Any]]], sprite: bool, backend: str,
+                     html_path: Optional[str] = None, pdf_path: Optional[str] = None) -> Dict[int, str]:
+        '''
+        Private method that renders the outputs of one page, the whole visualization or one tile of it, rendering the
+        template once and running wkhtmltopdf at most once.
+
+        Args:
+            html_path (str): The page's HTML, if already written by _write_template; otherwise it is written here.
+            pdf_path (str): The page's PDF, if already rendered (see _render_tiles); otherwise it is rendered here
+                when needed.
+
+        Returns:
+            The written path of each output index, or its list of page paths for pages="separate".
+        '''
+        written = {}
+        if backend == 'native':
+            native_renderer = self._native_renderer(residues_per_line, tile=tile)
+            for index, spec in page_specs:
+                path = spec['path'] or f'{self.pdb_name}.pdf'
+                with self._span('rasterize', tool='native', format=spec['format'], dpi=spec['dpi']):
+                    native_renderer.save(path, dpi=spec['dpi'])
+                written[index] = path
+            return written
+
+        # The document is streamed to disk once and read from there by every wkhtmltoimage and wkhtmltopdf run
+        own_html = html_path is None
+        if own_html:
+            fd, html_path = tempfile.mkstemp(prefix='pros2vi-', suffix='.html')
+            os.close(fd)
+        try:
+            if own_html:
+                self._write_template(html_path, residues_per_line=residues_per_line, sprite=sprite, tile=tile)
+            options = self._pdf_options(residues_per_line, tile=tile)
+            pdf_bytes = None
+            for index, spec in page_specs:
+                path = spec['path'] or f'{self.pdb_name}.pdf'
+                if spec['format'] != 'pdf' and spec['dpi'] == 100:
+                    with self._span('rasterize', tool='wkhtmltoimage', format=spec['format'], dpi=spec['dpi']):
+                        renderer.render_image(html_path, path, options={'quality': 100})
+                    written[index] = path
+                    continue
+
+                if spec['format'] != 'pdf' and not _check_poppler_available():
+                    # High-DPI rendering requires poppler for pdf2image
+                    raise RuntimeError(
+                        "High-DPI rendering (dpi != 100) requires poppler-utils to be installed. "
+                        "Install it via: apt-get install poppler-utils (Debian/Ubuntu), "
+                        "brew install poppler (macOS), or choco install poppler (Windows)."
+                    )
+                if pdf_bytes is None and pdf_path is not None:
+                    with open(pdf_path, 'rb') as f:
+                        pdf_bytes = f.read()
+                elif pdf_bytes is None:
+                    try:
+                        with self._span('pdf', tool='wkhtmltopdf', documents=1):
+                            pdf_bytes = renderer.render_pdf(html_path, options=options)
+                    except Exception as e:
+                        raise RuntimeError(f"Failed to render PDF: {e}")
+
+                if spec['format'] == 'pdf':
+                    with open(path, 'wb') as f:
+                        f.write(pdf_bytes)
+                else:
+                    with self._span('rasterize', tool='pdftoppm', format=spec['format'], dpi=spec['dpi']):
+                        path = _write_pages(pdf_bytes, path, spec['dpi'], spec['pages'])
+                written[index] = path
+        finally:
+            if own_html:
+                os.remove(html_path)
+        return written
+
+    def _render_tiles(self, residues_per_line: int, tile: Any, layout_specs: List[Tuple[int, Dict[str, Any]]],
+                      sprite: bool, backend: str) -> Dict[int, List[str]]:
+        '''
+        Private method that renders a tiled layout: every tile is a separate page, rendered in parallel, so memory
+        is bounded by the tile size rather than by the structure size. Images become a numbered series
+        ("<name>_001.png", ...), or one image streamed together from the tiles for pages="stitch", and PDFs one
+        document with a page per tile. When PDFs are needed, the HTML of every tile is written first and tiles of the
+        same page size share wkhtmltopdf processes (see renderer.render_pdfs).
+
+        Returns:
+            The written paths of each output index.
+        '''
+        tiles = self._plan_tiles(residues_per_line, tile)
+        if not tiles:
+            raise ValueError('The structure has no residues to render')
+        if any(spec['format'] == 'pdf' for _, spec in layout_specs) and len(tiles) > 1 and shutil.which('pdfunite') is None:
+            raise RuntimeError(
+                "Tiled PDF output requires pdfunite from poppler-utils to be installed. "
+                "Install it via: apt-get install poppler-utils (Debian/Ubuntu), "
+                "brew install poppler (macOS), or choco install poppler (Windows)."
+            )
+        # Shared by all tiles; fetched here so that the tile threads do not race for it
+        self._get_uniprot_ids()
+        self._resolve_metadata()
+
+        digits = max(3, len(str(len(tiles))))
+        batched = backend == 'wkhtml' and any(spec['format'] == 'pdf' or spec['dpi'] != 100 for _, spec in layout_specs)
+        work_dir = tempfile.mkdtemp(prefix='pros2vi-tiles-') if batched else None
+        try:
+            with ThreadPoolExecutor(max_workers=min(TILE_WORKERS, len(tiles))) as executor:
+                documents = {}
+                if batched:
+                    def write(number: int, tile_rows: List[Tuple[str, int, int]]) -> None:
+                        html_path = os.path.join(work_dir, f'{number:0{digits}d}.html')
+                        self._write_template(html_path, residues_per_line=residues_per_line, sprite=sprite, tile=tile_rows)
+                        documents[number] = (html_path, os.path.join(work_dir, f'{number:0{digits}d}.pdf'),
+                                             self._pdf_options(residues_per_line, tile=tile_rows))
+                    list(executor.map(write, range(1, len(tiles) + 1), tiles))
+                    renderer.render_pdfs([documents[number] for number in sorted(documents)], timings=self.timings)
+
+                def render(number: int, tile_rows: List[Tuple[str, int, int]]) -> Dict[int, str]:
+                    # The pages of one tile are always stitched, so every tile yields one file per output
+                    page_specs = [
+                        (index, {**spec, 'path': _tile_path(spec['path'] or f'{self.pdb_name}.pdf', number, digits),
+                                 'pages': 'stitch'})
+                        for index, spec in layout_specs
+                    ]
+                    html_path, pdf_path, _ = documents.get(number, (None, None, None))
+                    return self._render_page(residues_per_line, tile_rows, page_specs, sprite, backend,
+                                             html_path=html_path, pdf_path=pdf_path)
+
+                pages = list(executor.map(render, range(1, len(tiles) + 1), tiles))
+        finally:
+            if work_dir is not None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+        written = {}
+        for index, spec in layout_specs:
+            tile_paths = [page[index] for page in pages]
+            if spec['format'] == 'pdf':
+                path = spec['path'] or f'{self.pdb_name}.pdf'
+                _merge_pdfs(tile_paths, path)
+                written[index] = [path]
+            elif spec['pages'] == 'stitch':
+                try:
+                    stitch_pages(tile_paths, spec['path'], spec['dpi'])
+                finally:
+                    for tile_path in tile_paths:
+                        os.remove(tile_path)
+                written[index] = [spec['path']]
+            else:
+                written[index] = tile_paths
+        return written
+
+    def _plan_tiles(self, residues_per_line: int, tile: Any) -> List[List[Tuple[str, int, int]]]:
+        '''
+        Private method that divides the rows of the visualization into tiles.
+
+        Args:
+            tile: "chain" for one tile per chain, or the number of rows per tile, in which case a tile may hold
+                the end of one chain and the start of the next.
+
+        Returns:
+            The tiles, each a list of (chain ID, first row, end row) tuples.
+            Example: [[("A", 0, 40)], [("A", 40, 52), ("B", 0, 28)]]
+        '''
+        chain_rows = [(chain_id, math.ceil(len(self.structure_list[chain_id]) / residues_per_line))
+                      for chain_id in self.get_chain_groups()]
+        if tile == 'chain':
+            return [[(chain_id, 0, num_rows)] for chain_id, num_rows in chain_rows if num_rows]
+
+        tiles = []
+        current = []
+        free = tile
+        for chain_id, num_rows in chain_rows:
+            row = 0
+            while row < num_rows:
+                count = min(free, num_rows - row)
+                current.append((chain_id, row, row + count))
+                row += count
+                free -= count
+                if free == 0:
+                    tiles.append(current)
+                    current = []
+                    free = tile
+        if current:
+            tiles.append(current)
+        return tiles
+
+    def _normalize_output(self, output: Dict[str, Any], backend: str) -> Dict[str, Any]:
+        '''
+        Private method that validates one render_plan output and fills in its defaults.
+
+        '''
+        if not isinstance(output, dict):
+            raise TypeError('Each output must be a dictionary')
+        path = output.get('path')
+        output_format = output.get('format')
+        if output_format is None:
+            if not path or '.' not in path:
+                raise ValueError('Each output needs a format or a path with a file extension')
+            output_format = path.split('.')[-1]
+        output_format = output_format.lower()
+        if output_format == 'jpeg':
+            output_format = 'jpg'
+
+        formats = RENDER_FORMATS if backend == 'native' else tuple(f for f in RENDER_FORMATS if f != 'svg')
+        if output_format not in formats:
+            raise ValueError(f'The output format must be one of: {", ".join(formats)}')
+
+        residues_per_line = output.get('residues_per_line', 50)
+        dpi = output.get('dpi', 100)
+        if not isinstance(residues_per_line, int):
+            raise TypeError('The residues_per_line parameter must be an integer')
+        if not isinstance(dpi, int):
+            raise TypeError('The dpi parameter must be an integer')
+        if residues_per_line <= 0 or dpi <= 0:
+            raise ValueError('The residues_per_line and dpi parameters must be positive')
+
+        tile = output.get('tile')
+        if tile is not None and tile != 'chain' and not (isinstance(tile, int) and not isinstance(tile, bool) and tile > 0):
+            raise ValueError('The tile parameter must be "chain" or a positive number of rows')
+        pages = output.get('pages')
+        if pages is None:
+            pages = 'stitch' if tile is None else 'separate'
+        if pages not in PAGE_MODES:
+            raise ValueError(f'The pages parameter must be one of: {", ".join(PAGE_MODES)}')
+        if tile is not None and pages == 'stitch' and output_format == 'svg':
+            raise ValueError('Tiled SVG outputs cannot be stitched, use pages="separate"')
+
+        if not path and output_format != 'pdf':
+            stem = os.path.splitext(os.path.basename(self.file_path))[0]
+            path = f'{OUTPUT_FOLDER}/{stem}_{residues_per_line}r_{dpi}dpi.{output_format}'
+        return {'format': output_format, 'path': path, 'dpi': dpi, 'residues_per_line': residues_per_line, 'tile': tile,
+                'pages': pages}
+
+    def _pdf_options(self, residues_per_line: int, tile: Optional[List[Tuple[str, int, int]]] = None) -> Dict[str, Any]:
+        '''
+        Private method that returns the wkhtmltopdf options sizing the page to the visualization, or to one tile.
+
+        '''
+        output_width, output_height = self._get_width_and_height(residues_per_line=residues_per_line, tile=tile)
+        return {'page-height': f'{output_height}px',
+                'page-width': f'{output_width}px',
+                'margin-top': '0',
+                'margin-bottom': '0',
+                'margin-left': '0',
+                'margin-right': '0',
+                'enable-local-file-access': '',
+                'print-media-type': True,
+                'disable-smart-shrinking': True}
+
+    def _native_renderer(self, residues_per_line: int, tile: Optional[List[Tuple[str, int, int]]] = None):
+        '''
+        Private method that lays out the visualization, or one tile of it, for the pure-Python backend (see src/native.py).
+
+        '''
+        from src.native import NativeRenderer
+
+        chains_data = self._prepare_chain_data(residues_per_line, sprite=IconSprite(), tile=tile)
+        self._resolve_metadata()
+        legend_colors = {key: self.colors[f'{key}_COLOR'] for key in ('H', 'I', 'B_A', 'T', 'E_A', 'S', 'G', 'P', '-')}
+        return NativeRenderer(chains_data, residues_per_line, pdb_name=self.pdb_name, subtitle=self.subtitle,
+                              scientific_name=self.scientific_name, legend_colors=legend_colors,
+                              ensemble_models=self.ensemble.models if self.ensemble is not None else None)